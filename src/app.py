@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter.ttk import Style
+import profiling
 
 class App(tk.Tk):
     def __init__(self):
@@ -76,6 +77,7 @@ class App(tk.Tk):
         self.firstanalyzer_window = None
 
 if __name__ == "__main__":
+    profiling.enable_from_args()  # --profile / --cprofile, or MINIMOT_PROFILE in the environment
     app = App()
     app.mainloop()
     
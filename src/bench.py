@@ -0,0 +1,396 @@
+import os, sys, json, math, time, random, argparse, platform, subprocess, tracemalloc
+from datetime import date, datetime, timedelta
+from corpus import channel, corpus
+from manifest import manifest_path, update_manifest, record_conversions, conversion_settings
+from searchhelper import process_search_query, matches_search_terms
+from storage import open_text, has_ext
+from transcripts import convert_vtt_file, get_word_at_index
+
+"""
+
+    SYNTHETIC CORPUS BENCHMARKS
+
+    python3 src/bench.py --files 1000
+    python3 src/bench.py --files 100000 --channels 20 --no-memory --baseline data/output/bench/results/<old>.json
+    python3 src/bench.py --compare <old>.json <new>.json
+
+"""
+
+BENCH_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "output", "bench")
+SEED = 2024
+MINUTES = 8             # mean video length, lengths are log-normal around it
+WORDS_PER_SECOND = 2.6
+NO_SUBTITLES = 0.03     # share of videos that are in metadata.json but have no VTT
+MANUAL_CAPTIONS = 0.1   # share of VTTs with plain (not rolling auto-generated) cues
+CENSORED = "[&nbsp;__&nbsp;]"
+SOUNDS = ("[Music]", "[Applause]", "[Laughter]")
+WORD_INDEXES = (0, 4, -1)
+THRESHOLD = 0.10        # slower (or bigger) than this counts as a regression
+NOISE_SECONDS = 0.05    # differences below this are timer noise
+
+COMMON = ("the and to of a i you it that is in we so this what be for on just like was have are "
+          "not with they but know do can there about one if at all it's don't your get or as my "
+          "going go think that's really people very me right out up some will would now time "
+          "actually because okay yeah well here when which more then them how see these has "
+          "thing things because make want where been also no even other could into much why "
+          "something first we're i'm you're they're way lot look work different little kind "
+          "two new good let's back take only through thank video today channel").split()
+SYLLABLES = ("ka ri mo ne ta lu si ve po da an el or is un ex com pro ter tion ment ly ing ed "
+             "bar cel dor fen gri hal jon kel mar nor pel quin ros sul tor vin wex yor zan").split()
+
+# Queries use COMMON words so they hit whatever the seed generates
+TITLE_QUERIES = ("video", "first -new", "thing* | people", '"how to"')
+CONTENT_QUERIES = ("know", '"you know"', "think* really", "actually -okay", "channel | today video",
+                   "(people way) -(lot thank)")
+SPECIFIC_QUERIES = ("know | people", '"thank you"', "look+")
+
+
+def vocabulary(seed, size=20_000):
+    """COMMON words followed by made-up ones, with Zipf cumulative weights for rng.choices"""
+    rng = random.Random(f"{seed}/vocabulary")
+    words, seen = list(COMMON), set(COMMON)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice((1, 2, 2, 3, 3, 4))))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    cum, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1 / (rank + 2.7) ** 1.05
+        cum.append(total)
+    return words, cum
+
+def timestamp(seconds):
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+def spoken_lines(rng, words, cum, topic, seconds):
+    """Caption lines of 3-9 words for a video, with sound cues, censored words and speaker changes"""
+    count = max(int(seconds * WORDS_PER_SECOND), 10)
+    spoken = rng.choices(words, cum_weights=cum, k=count)
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.08:
+            spoken[i] = rng.choice(topic)
+        elif roll < 0.081:
+            spoken[i] = CENSORED
+    lines, i = [], 0
+    while i < count:
+        n = rng.randint(3, 9)
+        line = spoken[i:i + n]
+        i += n
+        if rng.random() < 0.02:
+            lines.append([rng.choice(SOUNDS)])
+        if rng.random() < 0.03:
+            line[0] = rng.choice((">>", "&gt;&gt;")) + " " + line[0]
+        lines.append(line)
+    return lines
+
+def auto_caption_vtt(rng, lines):
+    """Rolling YouTube auto-captions: each cue repeats the previous line above the new one, whose
+    words carry <time><c> tags, followed by a 10 ms cue holding the finished line"""
+    out = ["WEBVTT\nKind: captions\nLanguage: en\n"]
+    t, prev = rng.uniform(0, 2), " "
+    for line in lines:
+        start, times = t, []
+        for _ in line:
+            times.append(t)
+            t += rng.uniform(0.2, 0.55)
+        spoken = line[0] + "".join(f"<{timestamp(at)}><c> {word}</c>" for word, at in zip(line[1:], times[1:]))
+        out.append(f"{timestamp(start)} --> {timestamp(t)} align:start position:0%\n{prev}\n{spoken}\n")
+        out.append(f"{timestamp(t)} --> {timestamp(t + 0.01)} align:start position:0%\n{' '.join(line)}\n \n")
+        prev = " ".join(line)
+        t += 0.01
+    return "\n".join(out)
+
+def manual_vtt(rng, lines):
+    out = ["WEBVTT\nKind: captions\nLanguage: en\n"]
+    t = rng.uniform(0, 2)
+    for line in lines:
+        end = t + len(line) * rng.uniform(0.25, 0.5)
+        out.append(f"{timestamp(t)} --> {timestamp(end)}\n{' '.join(line)}\n")
+        t = end
+    return "\n".join(out)
+
+def video_id(rng):
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_") for _ in range(11))
+
+def generate_channel(channel_dir, handle, files, seed, minutes, words, cum):
+    """Write <channel>/vtt_files and a metadata.json shaped like the downloader's"""
+    vtt_dir = os.path.join(channel_dir, "vtt_files")
+    os.makedirs(vtt_dir, exist_ok=True)
+    rng = random.Random(f"{seed}/{handle}")
+    name = " ".join(w.capitalize() for w in rng.choices(words[len(COMMON):], k=2))
+    # Each channel keeps coming back to a few hundred words of its own
+    topic = rng.sample(words[500:5000], 300)
+    channel_id = "UC" + video_id(rng) * 2
+    metadata, vtt_bytes = [], 0
+    for i in range(files):
+        vrng = random.Random(f"{seed}/{handle}/{i}")
+        vid = video_id(vrng)
+        title = " ".join(vrng.choices(words[:2000], cum_weights=cum[:2000], k=vrng.randint(3, 9))).capitalize()
+        seconds = min(max(int(vrng.lognormvariate(math.log(minutes * 60), 0.6)), 30), 4 * 3600)
+        metadata.append({
+            'id': vid,
+            'title': title,
+            'url': f"https://www.youtube.com/watch?v={vid}",
+            'upload_date': (date(2010, 1, 1) + timedelta(days=vrng.randrange(5400))).strftime("%Y%m%d"),
+            'duration': seconds,
+            'view_count': int(vrng.paretovariate(1.2) * 1000),
+            'like_count': vrng.randrange(50000),
+            'comment_count': vrng.randrange(5000),
+            'was_live': False,
+            'is_live': False,
+            'timestamp': "2024-01-01T00:00:00",
+            'channel_name': name,
+            'channel_id': channel_id,
+            'channel_url': f"https://www.youtube.com/@{handle}",
+            'subscriber_count': 0
+        })
+        if vrng.random() < NO_SUBTITLES:
+            continue
+        lines = spoken_lines(vrng, words, cum, topic, seconds)
+        text = manual_vtt(vrng, lines) if vrng.random() < MANUAL_CAPTIONS else auto_caption_vtt(vrng, lines)
+        with open(os.path.join(vtt_dir, f"{title} [{vid}].en.vtt"), 'w', encoding='utf-8') as f:
+            f.write(text)
+        vtt_bytes += len(text)
+    with open(os.path.join(channel_dir, "metadata.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return vtt_bytes
+
+def generate(root, files, channels, seed=SEED, minutes=MINUTES):
+    """Build the corpus under root unless the same one is already there. Returns its spec"""
+    spec = {'files': files, 'channels': channels, 'seed': seed, 'minutes': minutes}
+    spec_path = os.path.join(root, "corpus.json")
+    try:
+        with open(spec_path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+        if {k: existing.get(k) for k in spec} == spec:
+            return existing
+    except (OSError, ValueError):
+        pass
+
+    words, cum = vocabulary(seed)
+    start = time.perf_counter()
+    spec['vtt_bytes'] = 0
+    for c in range(channels):
+        handle = f"bench{c:02d}"
+        per_channel = files // channels + (1 if c < files % channels else 0)
+        print(f"Generating {handle}: {per_channel} videos")
+        spec['vtt_bytes'] += generate_channel(os.path.join(root, handle), handle, per_channel, seed, minutes,
+                                              words, cum)
+    spec['generate_seconds'] = round(time.perf_counter() - start, 3)
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2)
+    return spec
+
+
+class benchrun:
+    """The pipeline stages over one generated corpus. Each stage returns how many items it
+    handled, plus any extra figures worth keeping"""
+
+    def __init__(self, root):
+        self.root = root
+        self.handles = sorted(e.name for e in os.scandir(root) if e.is_dir())
+        self.txt_files = []
+        self.videos = []
+
+    def channel_dir(self, handle):
+        return os.path.join(self.root, handle)
+
+    def converted(self):
+        return any(os.path.isdir(d := os.path.join(self.channel_dir(h), "txt_files")) and os.listdir(d)
+                   for h in self.handles)
+
+    def convert(self):
+        self.txt_files = []
+        for handle in self.handles:
+            vtt_dir = os.path.join(self.channel_dir(handle), "vtt_files")
+            txt_dir = os.path.join(self.channel_dir(handle), "txt_files")
+            os.makedirs(txt_dir, exist_ok=True)
+            vtt_files = sorted(os.path.join(vtt_dir, n) for n in os.listdir(vtt_dir) if has_ext(n, '.vtt'))
+            txt_files = [convert_vtt_file(path, txt_dir) for path in vtt_files]
+            record_conversions(self.channel_dir(handle), zip(vtt_files, txt_files), conversion_settings())
+            self.txt_files.extend(txt_files)
+        return len(self.txt_files), {}
+
+    def manifest(self):
+        """Cold scan: every file is listed and hashed again"""
+        videos = 0
+        for handle in self.handles:
+            if os.path.exists(manifest_path(self.channel_dir(handle))):
+                os.remove(manifest_path(self.channel_dir(handle)))
+            videos += len(update_manifest(self.channel_dir(handle)).videos)
+        return videos, {}
+
+    def load(self):
+        """What opening the analyzer does: channels from their manifests, metadata.json, video rows"""
+        channels = [channel.load(handle, root=self.root) for handle in self.handles]
+        current = corpus(channels)
+        rows = sum(len(ch.metadata) for ch in channels)
+        self.videos = current.videos()
+        self.txt_files = current.txt_files
+        return len(self.videos), {'metadata_rows': rows}
+
+    def word_at_index(self):
+        found = 0
+        for txt_file in self.txt_files:
+            for index in WORD_INDEXES:
+                found += get_word_at_index(txt_file, index) is not None
+        return len(self.txt_files) * len(WORD_INDEXES), {'found': found}
+
+    def title_search(self):
+        matches = 0
+        for query in TITLE_QUERIES:
+            terms = process_search_query(query, mode="general")
+            matches += sum(1 for v in self.videos if matches_search_terms(v.get('title', ''), terms))
+        return len(self.videos) * len(TITLE_QUERIES), {'matches': matches}
+
+    def content_search(self):
+        """Transcript filters as the analyzers run them; match_seconds leaves out reading the files"""
+        general = [process_search_query(q, mode="general") for q in CONTENT_QUERIES]
+        specific = [process_search_query(q, mode="specific") for q in SPECIFIC_QUERIES]
+        matches, hits, match_seconds = 0, 0, 0.0
+        for txt_file in self.txt_files:
+            with open_text(txt_file) as f:
+                text = f.read()
+            start = time.perf_counter()
+            for terms in general:
+                matches += bool(matches_search_terms(text, terms))
+            for terms in specific:
+                hits += len(matches_search_terms(text, terms, "specific"))
+            match_seconds += time.perf_counter() - start
+        return len(self.txt_files) * (len(general) + len(specific)), \
+               {'matches': matches, 'specific_hits': hits, 'match_seconds': round(match_seconds, 4)}
+
+
+STAGES = ('convert', 'manifest', 'load', 'word_at_index', 'title_search', 'content_search')
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(root, spec, stages=STAGES, repeat=1, memory=True):
+    """Time every stage (best of repeat), then run it once more under tracemalloc for its peak"""
+    bench = benchrun(root)
+    results = {}
+    for name in STAGES:
+        if name not in stages:
+            # Later stages still need the transcripts and video rows, just untimed
+            if name == 'convert' and not bench.converted():
+                bench.convert()
+            elif name == 'load':
+                bench.load()
+            continue
+        stage = getattr(bench, name)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items, extra = stage()
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        results[name] = {'seconds': round(best, 4), 'items': items,
+                         'per_item_us': round(best / items * 1e6, 2) if items else None, **extra}
+        if memory:
+            tracemalloc.start()
+            stage()
+            results[name]['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 2)
+            tracemalloc.stop()
+        print(f"{name:>15}: {best:8.3f}s  {items} items" +
+              (f"  peak {results[name]['peak_mb']} MB" if memory else ""))
+
+    txt_bytes = sum(os.path.getsize(p) for p in bench.txt_files if os.path.exists(p))
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'corpus': {**spec, 'txt_bytes': txt_bytes},
+        'repeat': repeat,
+        'memory': memory,
+        'stages': results,
+        'max_rss_mb': max_rss_mb()
+    }
+
+def compare(old, new, threshold=THRESHOLD):
+    """Print stage by stage changes between two result files; returns the regressed stages"""
+    keys = ('files', 'channels', 'seed', 'minutes')
+    if any(old['corpus'].get(k) != new['corpus'].get(k) for k in keys):
+        print("Warning: the runs used different corpora, "
+              + ", ".join(f"{k} {old['corpus'].get(k)} -> {new['corpus'].get(k)}" for k in keys
+                          if old['corpus'].get(k) != new['corpus'].get(k)))
+    print(f"{'stage':>15} {'old s':>9} {'new s':>9} {'change':>8} {'old MB':>8} {'new MB':>8}")
+    regressions = []
+    for name in STAGES:
+        if name not in old['stages'] or name not in new['stages']:
+            continue
+        a, b = old['stages'][name], new['stages'][name]
+        change = (b['seconds'] - a['seconds']) / a['seconds'] if a['seconds'] else 0.0
+        slower = change > threshold and b['seconds'] - a['seconds'] > NOISE_SECONDS
+        bigger = a.get('peak_mb') is not None and b.get('peak_mb') is not None and \
+                 b['peak_mb'] > a['peak_mb'] * (1 + threshold) and b['peak_mb'] - a['peak_mb'] > 1
+        flag = " ".join(label for label, hit in (("SLOWER", slower), ("MORE MEMORY", bigger)) if hit)
+        print(f"{name:>15} {a['seconds']:>9.3f} {b['seconds']:>9.3f} {change:>+8.1%} "
+              f"{a.get('peak_mb', '-'):>8} {b.get('peak_mb', '-'):>8}  {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversion, loading and search on a generated corpus")
+    parser.add_argument('--files', type=int, default=1000, help="Videos to generate (1k-100k)")
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--minutes', type=float, default=MINUTES, help="Mean video length")
+    parser.add_argument('--root', help=f"Corpus folder (default: {BENCH_ROOT}/corpus-<files>-<seed>)")
+    parser.add_argument('--stages', default=",".join(STAGES), help="Comma-separated stages to time")
+    parser.add_argument('--repeat', type=int, default=1, help="Keep the best of this many timings")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('-o', '--output', help="Results file (default: under <bench>/results)")
+    parser.add_argument('--baseline', help="Results file to compare this run against")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Only compare two results files")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    if unknown := [s for s in stages if s not in STAGES]:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+    root = args.root or os.path.join(BENCH_ROOT, f"corpus-{args.files}-{args.seed}")
+    spec = generate(root, args.files, args.channels, args.seed, args.minutes)
+    print(f"Corpus: {spec['files']} videos in {spec['channels']} channels, "
+          f"{spec['vtt_bytes'] / (1 << 20):.1f} MB of VTT at {root}")
+
+    results = run(root, spec, stages, max(args.repeat, 1), not args.no_memory)
+    output = args.output or os.path.join(BENCH_ROOT, "results",
+                                         f"{datetime.now():%Y%m%d-%H%M%S}-{args.files}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        sys.exit(1 if compare(load_results(args.baseline), results, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
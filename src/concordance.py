@@ -0,0 +1,384 @@
+import os, re, json, csv, zipfile
+import numpy as np
+from ngrams import tokenize, idmap
+from searchhelper import process_search_query, extract_video_id, seconds_to_hms
+from storage import open_text, plain_name
+from transcripts import load_line_times
+from downloadqueue import moment_url, atomic_file
+from manifest import content_keys
+
+WIDTH = 8            # context words shown on each side of a hit
+PAGE_SIZE = 200
+SORTS = ("position", "left", "right")
+NO_WORD = -1
+
+
+def index_path(channel_dir):
+    return os.path.join(channel_dir, "index", "positions.npz")
+
+
+class positionindex:
+    """Every token of a channel's transcripts as one id stream, with a postings list per word
+    (positions grouped by word id, CSR style) so term and phrase lookups never touch the text.
+    times holds the start second of the cue each token was spoken in (NaN when unknown).
+    update() only re-reads transcripts whose content key (the manifest's txt hash) changed"""
+
+    def __init__(self):
+        self.vocab = idmap()
+        self.names = []
+        self.keys = []
+        self.tokens = np.zeros(0, dtype=np.int32)
+        self.times = np.zeros(0, dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.dir = ""
+        self._order = None
+        self._starts = None
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def words(self):
+        return self.vocab.words
+
+    def paths(self):
+        return [os.path.join(self.dir, name) for name in self.names]
+
+    def update(self, txt_files, keys):
+        """Index files whose key (see manifest.content_keys) is new or changed and forget files
+        not in txt_files, keeping their order. Returns how many files were (re)read"""
+        position = {name: i for i, name in enumerate(self.names)}
+        names, new_keys, pieces, times, read = [], [], [], [], 0
+        for path, key in zip(txt_files, keys):
+            name = os.path.basename(path)
+            self.dir = self.dir or os.path.dirname(path)
+            if key is None:
+                continue
+            i = position.get(name)
+            if i is not None and self.keys[i] == key:
+                piece = self.tokens[self.offsets[i]:self.offsets[i + 1]]
+                piece_times = self.times[self.offsets[i]:self.offsets[i + 1]]
+            else:
+                try:
+                    with open_text(path) as f:
+                        lines = [tokenize(line) for line in f.read().split("\n")]
+                except (OSError, EOFError, UnicodeDecodeError):
+                    continue
+                vocab = self.vocab
+                piece = np.fromiter((vocab[w] for line in lines for w in line), dtype=np.int32)
+                line_times = load_line_times(path, len(lines))
+                piece_times = np.repeat(np.array(line_times if line_times else [np.nan] * len(lines),
+                                                 dtype=np.float32), [len(line) for line in lines])
+                read += 1
+            names.append(name)
+            new_keys.append(key)
+            pieces.append(piece)
+            times.append(piece_times)
+
+        if read or names != self.names:
+            self.names = names
+            self.keys = new_keys
+            self.tokens = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.int32)
+            self.times = np.concatenate(times) if times else np.zeros(0, dtype=np.float32)
+            self.offsets = np.r_[0, np.cumsum([len(p) for p in pieces], dtype=np.int64)].astype(np.int64)
+            self._order = self._starts = None
+        return read
+
+    def postings(self):
+        """(order, starts): positions of word w are order[starts[w]:starts[w + 1]], ascending"""
+        if self._order is None:
+            self._order = np.argsort(self.tokens, kind='stable').astype(np.int64)
+            self._starts = np.r_[0, np.cumsum(np.bincount(self.tokens, minlength=len(self.words)))].astype(np.int64)
+        return self._order, self._starts
+
+    def frequency(self, ids):
+        _, starts = self.postings()
+        return int((starts[ids + 1] - starts[ids]).sum())
+
+    def positions(self, ids):
+        """Sorted positions of any of the word ids"""
+        order, starts = self.postings()
+        if len(ids) == 1:
+            return order[starts[ids[0]]:starts[ids[0] + 1]]
+        return np.sort(np.concatenate([order[starts[i]:starts[i + 1]] for i in ids] or [np.zeros(0, np.int64)]))
+
+    def term_counts(self, i):
+        """{word: count} of the i-th transcript"""
+        ids, counts = np.unique(self.tokens[self.offsets[i]:self.offsets[i + 1]], return_counts=True)
+        words = self.words
+        return {words[w]: int(c) for w, c in zip(ids.tolist(), counts.tolist())}
+
+    def time_at(self, position):
+        """Start second of the cue a token was spoken in, None if unknown"""
+        t = float(self.times[position])
+        return None if np.isnan(t) else t
+
+    def doc_of(self, positions):
+        return np.searchsorted(self.offsets, positions, 'right') - 1
+
+    def word_ids(self, pattern):
+        """Ids of the words matching one query token: exact, or * / + as any word characters"""
+        if '*' in pattern or '+' in pattern:
+            regex = re.compile(re.escape(pattern).replace(r'\*', r"[\w']*").replace(r'\+', r"[\w']*"))
+            return np.array([i for i, w in enumerate(self.words) if regex.fullmatch(w)], dtype=np.int64)
+        i = self.vocab.get(pattern)
+        return np.array([] if i is None else [i], dtype=np.int64)
+
+    def find(self, sequence):
+        """Start positions of a word sequence (query tokens) inside single transcripts.
+        Anchors on the rarest token and checks the others against the token stream"""
+        ids = [self.word_ids(token) for token in sequence]
+        if not sequence or any(not len(i) for i in ids):
+            return np.zeros(0, dtype=np.int64)
+        anchor = min(range(len(ids)), key=lambda k: self.frequency(ids[k]))
+        starts = self.positions(ids[anchor]) - anchor
+        starts = starts[(starts >= 0) & (starts + len(ids) <= len(self.tokens))]
+        for k, allowed in enumerate(ids):
+            if k != anchor and len(starts):
+                starts = starts[np.isin(self.tokens[starts + k], allowed)]
+        if len(ids) > 1 and len(starts):
+            starts = starts[self.doc_of(starts) == self.doc_of(starts + len(ids) - 1)]
+        return starts
+
+    def save(self, path):
+        """Written to a temp file and renamed over path, a crash mid-save keeps the old index"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_file(path, 'wb') as f:
+            np.savez(f, tokens=self.tokens, times=self.times, offsets=self.offsets,
+                     info=np.array(json.dumps({'names': self.names, 'keys': self.keys, 'words': self.words,
+                                               'dir': self.dir})))
+
+    @classmethod
+    def load(cls, path):
+        """Saved index, or an empty one (rebuilt by the next update) if it is missing or unreadable"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                info = json.loads(str(data['info']))
+                index.tokens, index.offsets = data['tokens'], data['offsets']
+                index.times = data['times']
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return cls()
+        index.names, index.dir = info['names'], info['dir']
+        index.keys = info.get('keys') or [None] * len(index.names)  # mtime-keyed files are read once more
+        for word in info['words']:
+            index.vocab[word]
+        return index
+
+
+def update_index(channel_dir, txt_files):
+    """Load a channel's positional index, add new or changed txt_files and save if anything changed"""
+    path = index_path(channel_dir)
+    index = positionindex.load(path)
+    names = list(index.names)
+    if index.update(txt_files, content_keys(channel_dir, txt_files)) or index.names != names:
+        index.save(path)
+    return index
+
+
+def query_tokens(text):
+    """Phrase text -> query tokens, keeping * and + inside words as wildcards"""
+    tokens = []
+    for piece in text.split():
+        if '*' in piece or '+' in piece:
+            tokens.append(re.sub(r"[^\w'*+]", '', piece.lower()))
+        else:
+            tokens.extend(tokenize(piece))
+    return [t for t in tokens if t]
+
+def _unescape(pattern):
+    return re.sub(r'\\(.)', r'\1', pattern)
+
+def parse_query(query, mode="general"):
+    """process_search_query() output as word sequences the index can look up.
+    Returns groups of {'terms', 'exclude', 'all'}: with 'all' a transcript needs every term
+    (general mode), and it is dropped if it contains every excluded sequence"""
+    terms = process_search_query(query, mode)
+    if mode == "specific":
+        # Undo the regex escaping: \b\w+\b stands for one whole word, \w* for a partial
+        sequences = [_unescape(p) for p in terms['include']]
+        sequences += [_unescape(p.replace(r'\b\w+\b', '*')) for p in terms['wildcards']]
+        sequences += [_unescape(p.replace(r'\w*', '*')) for p in terms['partials']]
+        return [{'terms': [query_tokens(s) for s in sequences], 'exclude': [], 'all': False}]
+
+    groups = []
+    for group in terms['or_groups']:
+        positive = group['include'] + group['phrases'] + group['wildcards'] + group['partials']
+        groups.append({'terms': [query_tokens(t) for t in positive],
+                       'exclude': [query_tokens(t) for _, t in group['exclude']], 'all': True})
+    return groups
+
+def find_hits(index, groups):
+    """(start, length) arrays of every hit in one index, in corpus order"""
+    starts, lengths = [], []
+    for group in groups:
+        found = [(index.find(seq), len(seq)) for seq in group['terms'] if seq]
+        if not found:
+            continue
+        allowed = None
+        if group['all']:
+            for hits, _ in found:
+                docs = np.unique(index.doc_of(hits))
+                allowed = docs if allowed is None else np.intersect1d(allowed, docs)
+        excluded = None
+        for seq in filter(None, group['exclude']):
+            docs = np.unique(index.doc_of(index.find(seq)))
+            excluded = docs if excluded is None else np.intersect1d(excluded, docs)
+        for hits, length in found:
+            docs = index.doc_of(hits)
+            keep = np.ones(len(hits), dtype=bool)
+            if allowed is not None:
+                keep &= np.isin(docs, allowed)
+            if excluded is not None:
+                keep &= ~np.isin(docs, excluded)
+            starts.append(hits[keep])
+            lengths.append(np.full(keep.sum(), length, dtype=np.int64))
+    starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+    if not len(starts):
+        return starts, lengths
+    # Overlapping terms hit the same spot: keep the longest match at each position
+    order = np.lexsort((-lengths, starts))
+    starts, lengths = starts[order], lengths[order]
+    first = np.r_[True, starts[1:] != starts[:-1]]
+    return starts[first], lengths[first]
+
+
+class concordance:
+    """Keyword-in-context view of a query over one or more channel indexes.
+    Hits are found once; sorting by left or right context is one lexsort over word ranks,
+    and pages only decode the words they show"""
+
+    def __init__(self, indexes, query, mode="general"):
+        self.indexes = list(indexes)
+        groups = parse_query(query, mode)
+        sources, starts, lengths = [], [], []
+        for n, index in enumerate(self.indexes):
+            s, l = find_hits(index, groups)
+            sources.append(np.full(len(s), n, dtype=np.int64))
+            starts.append(s)
+            lengths.append(l)
+        self.source = np.concatenate(sources) if sources else np.zeros(0, dtype=np.int64)
+        self.start = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        self.length = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        self._ranks = None
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.start)
+
+    def pages(self, size=PAGE_SIZE):
+        return max(1, -(-len(self) // size))
+
+    def videos(self):
+        """How many transcripts have at least one hit"""
+        return len(np.unique((self.source << 32) | self._docs()))
+
+    def _docs(self):
+        docs = np.zeros(len(self), dtype=np.int64)
+        for n, index in enumerate(self.indexes):
+            mask = self.source == n
+            docs[mask] = index.doc_of(self.start[mask])
+        return docs
+
+    def ranks(self):
+        """Per index, each word id's place in the alphabetical order of all indexes' words"""
+        if self._ranks is None:
+            everything = np.unique(np.concatenate([np.array(i.words, dtype=str) for i in self.indexes]
+                                                  or [np.zeros(0, dtype=str)]))
+            self._ranks = [np.searchsorted(everything, np.array(i.words, dtype=str)).astype(np.int64)
+                           for i in self.indexes]
+        return self._ranks
+
+    def context_keys(self, side, depth):
+        """depth columns of word ranks next to each hit, NO_WORD past the transcript edge"""
+        keys = np.full((depth, len(self)), NO_WORD, dtype=np.int64)
+        for n, index in enumerate(self.indexes):
+            mask = np.flatnonzero(self.source == n)
+            if not len(mask):
+                continue
+            start, length = self.start[mask], self.length[mask]
+            doc = index.doc_of(start)
+            lo, hi = index.offsets[doc], index.offsets[doc + 1]
+            rank = self.ranks()[n]
+            for k in range(depth):
+                pos = start - 1 - k if side == "left" else start + length + k
+                inside = (pos >= lo) & (pos < hi)
+                keys[k, mask[inside]] = rank[index.tokens[pos[inside]]]
+        return keys
+
+    def order(self, sort="position", depth=WIDTH):
+        """Hit order for a sort: corpus position, or the words left / right of the hit
+        (nearest word first), ties kept in corpus order"""
+        if sort not in SORTS:
+            raise ValueError(f"Unknown concordance sort: {sort}")
+        if sort == "position":
+            return np.arange(len(self))
+        if (sort, depth) not in self._orders:
+            keys = self.context_keys(sort, depth)
+            self._orders[(sort, depth)] = np.lexsort(keys[::-1]) if len(self) else np.arange(0)
+        return self._orders[(sort, depth)]
+
+    def row(self, i, width=WIDTH):
+        index = self.indexes[self.source[i]]
+        start, length = int(self.start[i]), int(self.length[i])
+        doc = int(index.doc_of(start))
+        lo, hi = int(index.offsets[doc]), int(index.offsets[doc + 1])
+        words = index.words
+        text = lambda a, b: " ".join(words[t] for t in index.tokens[a:b].tolist())
+        name = index.names[doc]
+        video_id = extract_video_id(plain_name(name))
+        time = index.time_at(start)
+        return {
+            'txt_file': os.path.join(index.dir, name),
+            'id': video_id,
+            'name': os.path.splitext(plain_name(name))[0],
+            'position': start - lo,
+            'time': time,
+            'url': moment_url(video_id, time) if video_id else '',
+            'left': text(max(lo, start - width), start),
+            'match': text(start, start + length),
+            'right': text(start + length, min(hi, start + length + width)),
+        }
+
+    def page(self, number=0, size=PAGE_SIZE, sort="position", width=WIDTH):
+        """Rows of one page: txt_file, id, name, word position, spoken time, &t= link,
+        left / match / right text"""
+        order = self.order(sort, width)
+        return [self.row(i, width) for i in order[number * size:(number + 1) * size].tolist()]
+
+    def rows(self, sort="position", width=WIDTH):
+        for i in self.order(sort, width).tolist():
+            yield self.row(i, width)
+
+
+EXPORT_FIELDS = ('video_id', 'title', 'channel_name', 'upload_date', 'time', 'timestamp', 'url',
+                 'left', 'match', 'right', 'position', 'txt_file')
+
+def export_hits(result, path, video_by_id=None, sort="position", width=WIDTH):
+    """Write every hit (not just one page) to a CSV, or JSON lines if path ends with .jsonl.
+    Returns how many rows were written"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        jsonl = path.endswith('.jsonl')
+        writer = None if jsonl else csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        if writer:
+            writer.writeheader()
+        for row in result.rows(sort, width):
+            video = (video_by_id(row['id']) if video_by_id and row['id'] else None) or {}
+            record = {
+                'video_id': row['id'] or '', 'title': video.get('title') or row['name'],
+                'channel_name': video.get('channel_name') or '', 'upload_date': video.get('upload_date') or '',
+                'time': row['time'] if row['time'] is not None else '',
+                'timestamp': seconds_to_hms(int(row['time'])) if row['time'] is not None else '',
+                'url': row['url'], 'left': row['left'], 'match': row['match'], 'right': row['right'],
+                'position': row['position'], 'txt_file': row['txt_file'],
+            }
+            if jsonl:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                writer.writerow(record)
+            count += 1
+    return count
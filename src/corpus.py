@@ -0,0 +1,163 @@
+import os, json
+from collections import defaultdict
+from itertools import count
+from searchhelper import extract_video_id
+from storage import plain_name
+from manifest import update_manifest
+from profiling import span
+
+
+def data_root():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input")
+
+def parse_handles(text):
+    """'a, b c' -> ['a', 'b', 'c'] keeping order and dropping repeats"""
+    handles = []
+    for handle in text.replace(',', ' ').split():
+        if handle not in handles:
+            handles.append(handle)
+    return handles
+
+
+# Fallback versions for channels built in memory rather than from a manifest
+_versions = count(1)
+
+
+class channel:
+    """One data/input/<handle> folder: metadata indexed by id plus its transcript files"""
+
+    def __init__(self, handle, metadata=None, txt_files=None, vtt_files=None, root=None):
+        self.handle = handle
+        self.dir = os.path.join(root or data_root(), handle)
+        self._metadata = metadata
+        self._by_id = None
+        self.txt_files = txt_files or []
+        self.vtt_files = vtt_files or []
+        self.manifest = None
+        self._word_cache = {}
+        self.version = ('mem', next(_versions))
+
+    @classmethod
+    def load(cls, handle, root=None):
+        """Read a channel from its manifest (rescanning the folder only if it changed since),
+        pairing existing txt conversions with their vtt files. metadata.json is read on first use"""
+        ch = cls(handle, root=root)
+        ch.manifest = update_manifest(ch.dir)
+        ch.version = ch.manifest.version
+        for vtt_file, txt_file, _ in ch.manifest.converted():
+            ch.vtt_files.append(vtt_file)
+            ch.txt_files.append(txt_file)
+        return ch
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = []
+            meta_file = os.path.join(self.dir, "metadata.json")
+            if os.path.exists(meta_file):
+                with span("metadata.load", channel=self.handle), open(meta_file, 'r', encoding='utf-8') as f:
+                    self._metadata = json.load(f)
+        return self._metadata
+
+    @property
+    def by_id(self):
+        if self._by_id is None:
+            self._by_id = {v['id']: v for v in self.metadata if 'id' in v}
+        return self._by_id
+
+    @property
+    def channel_name(self):
+        rows = self.manifest.videos.values() if self.manifest else self.metadata
+        return next((v.get('channel_name') for v in rows if v.get('channel_name')), self.handle)
+
+    def videos(self):
+        """One record per transcript, shaped like the analyzers' video rows"""
+        records = []
+        for txt_file, vtt_file in zip(self.txt_files, self.vtt_files):
+            video_id = extract_video_id(plain_name(os.path.basename(txt_file)))
+            if self.manifest:
+                meta = self.manifest.videos.get(video_id) if video_id else None
+                meta = meta if meta and meta.get('in_metadata') else None
+            else:
+                meta = self.by_id.get(video_id) if video_id else None
+            name = os.path.splitext(plain_name(os.path.basename(txt_file)))[0]
+            records.append({
+                'txt_file': txt_file,
+                'vtt_file': vtt_file,
+                'name': name,
+                'id': video_id,
+                'selected_word': None,
+                'title': (meta.get('title') or name) if meta else name,
+                'upload_date': (meta.get('upload_date') or '') if meta else '',
+                'duration': (meta.get('duration') or 0) if meta else 0,
+                'channel_name': (meta.get('channel_name') or '') if meta else '',
+                'channel_handle': self.handle,
+                'url': (meta.get('url') or '') if meta else ''
+            })
+        return records
+
+    def word_at(self, word_index, txt_file, extract):
+        """Word at one position of a transcript, extracted once per channel and index"""
+        cache = self._word_cache.setdefault(word_index, {})
+        if txt_file not in cache:
+            cache[txt_file] = extract(txt_file, word_index)
+        return cache[txt_file]
+
+
+class corpus:
+    """Several channels analysed together. Per-channel results are kept apart
+    and only merged when a combined view is asked for"""
+
+    def __init__(self, channels=None):
+        self.channels = {ch.handle: ch for ch in channels or []}
+
+    @classmethod
+    def load(cls, handles):
+        return cls([channel.load(h) for h in handles])
+
+    def add(self, ch):
+        self.channels[ch.handle] = ch
+
+    @property
+    def handles(self):
+        return list(self.channels)
+
+    @property
+    def version(self):
+        """Manifest versions of the channels, used to key cached extractions"""
+        return tuple((handle, ch.version) for handle, ch in self.channels.items())
+
+    @property
+    def metadata(self):
+        return [v for ch in self.channels.values() for v in ch.metadata]
+
+    @property
+    def txt_files(self):
+        return [f for ch in self.channels.values() for f in ch.txt_files]
+
+    def title(self):
+        if len(self.channels) == 1:
+            return next(iter(self.channels.values())).channel_name
+        return ", ".join(self.handles)
+
+    def video_by_id(self, video_id):
+        for ch in self.channels.values():
+            if video_id in ch.by_id:
+                return ch.by_id[video_id]
+        return None
+
+    def videos(self, handles=None):
+        return [v for h in (handles or self.handles) if h in self.channels
+                for v in self.channels[h].videos()]
+
+    def word_at(self, video, word_index, extract):
+        return self.channels[video['channel_handle']].word_at(word_index, video['txt_file'], extract)
+
+
+def group_counts(videos, field='channel_handle', value='selected_word'):
+    """{group: {value: count}} over video rows, e.g. position words per channel"""
+    groups = defaultdict(lambda: defaultdict(int))
+    for video in videos:
+        if word := video.get(value):
+            groups[video.get(field, '')][word] += 1
+    return {group: dict(counts) for group, counts in groups.items()}
@@ -1,8 +1,15 @@
 import os
 import json
+import time
 import argparse
 import re
 from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from difflib import unified_diff
+from downloadqueue import write_atomic, add_to_queue
+from storage import compression_of, has_ext, plain_name, read_bytes, txt_name_for
 
 """
 
@@ -12,13 +19,62 @@ from pathlib import Path
 
 """
 
-DEFAULT_BASE_DIR = "/Users/c/minimot/data/input"
+DEFAULT_BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input")
 VTT_SUBDIR = "vtt_files"
+TXT_SUBDIR = "txt_files"
+REPORT_NAME = "integrity_report.json"
+TAIL_BYTES = 512
+TIMESTAMP_START = re.compile(rb'^\s*\d+:\d')
 
 def get_vid_id(filename):
-    match = re.search(r'\[([a-zA-Z0-9_-]{11})\]\.en\.vtt$', filename)
+    match = re.search(r'\[([a-zA-Z0-9_-]{11})\]\.en\.vtt(\.gz|\.zst)?$', filename)
     return match.group(1) if match else None
 
+def scan_vtt_files(vtt_directory):
+    """{video id: DirEntry} for the .en.vtt files in a folder (compressed or not)"""
+    vtt_files = {}
+    with os.scandir(vtt_directory) as entries:
+        for entry in entries:
+            if has_ext(entry.name, '.en.vtt') and (video_id := get_vid_id(entry.name)):
+                vtt_files[video_id] = entry
+    return vtt_files
+
+def read_archive_ids(archive_path):
+    """Video ids in a yt-dlp archive.txt, in file order (repeats kept)"""
+    with open(archive_path, 'r', encoding='utf-8') as f:
+        return [parts[1] for parts in (line.split() for line in f) if len(parts) >= 2 and parts[0] == 'youtube']
+
+def vtt_problem(path, size):
+    """'empty', 'not_vtt', 'no_cues' or 'truncated' from the first and last bytes, None if it looks whole"""
+    if size == 0:
+        return 'empty'
+    if compression_of(path):
+        data = read_bytes(path)
+        if not data:
+            return 'empty'
+        return vtt_problem_in(data[:TAIL_BYTES], data[-TAIL_BYTES:], len(data))
+    with open(path, 'rb') as f:
+        head = f.read(TAIL_BYTES)
+        if size > TAIL_BYTES:
+            f.seek(-TAIL_BYTES, os.SEEK_END)
+            tail = f.read()
+        else:
+            tail = head
+    return vtt_problem_in(head, tail, size)
+
+def vtt_problem_in(head, tail, size):
+    if not head.lstrip(b'\xef\xbb\xbf').startswith(b'WEBVTT'):
+        return 'not_vtt'
+    if size <= TAIL_BYTES and b'-->' not in head:
+        return 'no_cues'
+    # A cut off download ends right after (or inside) the last cue's timing line. A missing final
+    # newline alone is fine, plenty of writers leave it out
+    lines = [line for line in tail.splitlines() if line.strip()]
+    last = lines[-1] if lines else b''
+    if b'-->' in last or (not tail.endswith(b'\n') and TIMESTAMP_START.match(last)):
+        return 'truncated'
+    return None
+
 def check_and_clean_subtitles(metadata_path, archive_path, vtt_directory):
     try:
         with open(metadata_path, 'r', encoding='utf-8') as f:
@@ -29,12 +85,7 @@ def check_and_clean_subtitles(metadata_path, archive_path, vtt_directory):
 
     metadata_ids = {entry['id']: entry for entry in metadata if 'id' in entry}
 
-    vtt_files = {}
-    for filename in os.listdir(vtt_directory):
-        if filename.endswith('.en.vtt'):
-            video_id = get_vid_id(filename)
-            if video_id:
-                vtt_files[video_id] = filename
+    vtt_files = {video_id: entry.name for video_id, entry in scan_vtt_files(vtt_directory).items()}
 
     missing_files = []
     for video_id, entry in metadata_ids.items():
@@ -66,6 +117,7 @@ def check_and_clean_subtitles(metadata_path, archive_path, vtt_directory):
                 entries_removed += 1
 
     # Comment out if archive.txt needs to be cleaned of videos with no subs
+    # (or use --repair, which shows a dry run and writes atomically with a backup)
     '''
     if entries_removed > 0:
         try:
@@ -78,14 +130,265 @@ def check_and_clean_subtitles(metadata_path, archive_path, vtt_directory):
     
     return missing_files, len(metadata), entries_removed
 
+def scan_channel(channel_dir):
+    """Three-way check of metadata.json, archive.txt and vtt_files for one channel folder,
+    plus empty/truncated VTT files and TXT conversions that are missing or older than their VTT"""
+    channel_dir = Path(channel_dir)
+    report = {'channel': channel_dir.name, 'errors': []}
+
+    metadata_ids = {}
+    duplicate_metadata = set()
+    try:
+        with open(channel_dir / "metadata.json", 'r', encoding='utf-8') as f:
+            for entry in json.load(f):
+                if 'id' in entry:
+                    if entry['id'] in metadata_ids:
+                        duplicate_metadata.add(entry['id'])
+                    metadata_ids[entry['id']] = entry
+    except FileNotFoundError:
+        report['errors'].append("metadata.json not found")
+    except Exception as e:
+        report['errors'].append(f"Error loading metadata file: {e}")
+
+    archive_ids = []
+    try:
+        archive_ids = read_archive_ids(channel_dir / "archive.txt")
+    except FileNotFoundError:
+        report['errors'].append("archive.txt not found")
+    except Exception as e:
+        report['errors'].append(f"Error loading archive file: {e}")
+    archived = set(archive_ids)
+
+    vtt_files = {}
+    try:
+        vtt_files = scan_vtt_files(channel_dir / VTT_SUBDIR)
+    except FileNotFoundError:
+        report['errors'].append(f"{VTT_SUBDIR} not found")
+
+    txt_files = {}
+    try:
+        with os.scandir(channel_dir / TXT_SUBDIR) as entries:
+            txt_files = {plain_name(entry.name): entry for entry in entries if has_ext(entry.name, '.txt')}
+    except FileNotFoundError:
+        pass
+
+    bad_vtts, stale_txts, unconverted = [], [], []
+    for video_id, entry in vtt_files.items():
+        try:
+            stat = entry.stat()
+        except OSError as e:  # deleted or unreadable since the folder was listed
+            report['errors'].append(f"Cannot read {entry.name}: {e}")
+            continue
+        try:
+            if problem := vtt_problem(entry.path, stat.st_size):
+                bad_vtts.append({'id': video_id, 'file': entry.name, 'size': stat.st_size, 'problem': problem})
+        except Exception as e:  # unreadable, or a damaged .gz/.zst
+            bad_vtts.append({'id': video_id, 'file': entry.name, 'size': stat.st_size, 'problem': str(e)})
+        if txt_files:
+            txt = txt_files.get(plain_name(txt_name_for(entry.name)))
+            if txt is None:
+                unconverted.append(video_id)
+                continue
+            try:
+                if txt.stat().st_mtime < stat.st_mtime:
+                    stale_txts.append(txt.name)
+            except OSError as e:
+                report['errors'].append(f"Cannot read {txt.name}: {e}")
+
+    converted = {plain_name(txt_name_for(entry.name)) for entry in vtt_files.values()}
+    metadata, vtts = set(metadata_ids), set(vtt_files)
+    report.update({
+        'metadata_entries': len(metadata_ids),
+        'archive_entries': len(archive_ids),
+        'vtt_files': len(vtt_files),
+        'txt_files': len(txt_files),
+        'metadata_without_vtt': sorted(metadata - vtts),
+        'vtt_without_metadata': sorted(vtts - metadata),
+        'archived_without_vtt': sorted(archived - vtts),
+        'vtt_not_archived': sorted(vtts - archived),
+        'metadata_not_archived': sorted(metadata - archived),
+        'archived_without_metadata': sorted(archived - metadata),
+        'duplicate_metadata_ids': sorted(duplicate_metadata),
+        'duplicate_archive_ids': sorted(i for i, n in Counter(archive_ids).items() if n > 1),
+        'bad_vtt_files': bad_vtts,
+        'stale_txt_files': sorted(stale_txts),
+        'unconverted_vtt_ids': sorted(unconverted) if txt_files else [],
+        'orphan_txt_files': sorted(txt_files[name].name for name in set(txt_files) - converted),
+    })
+    return report
+
+def scan_corpus(base_dir=DEFAULT_BASE_DIR, channels=None, workers=None):
+    """Scan every channel folder under base_dir (or just the named ones) in parallel"""
+    if not channels:
+        with os.scandir(base_dir) as entries:
+            channels = sorted(e.name for e in entries if e.is_dir() and not e.name.startswith('.'))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        reports = list(pool.map(scan_channel, [os.path.join(base_dir, c) for c in channels]))
+
+    summary_keys = [key for key, value in reports[0].items() if isinstance(value, list) and key != 'errors'] if reports else []
+    return {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'base_dir': str(base_dir),
+        'seconds': round(time.perf_counter() - start, 3),
+        'channels': len(reports),
+        'totals': {key: sum(len(r.get(key, [])) for r in reports) for key in summary_keys},
+        'reports': {r['channel']: r for r in reports},
+    }
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def print_scan(report):
+    print(f"\nScanned {report['channels']} channels in {report['seconds']}s")
+    for key, count in report['totals'].items():
+        if count:
+            print(f"  {key.replace('_', ' ')}: {count}")
+    for channel, r in report['reports'].items():
+        for error in r['errors']:
+            print(f"  {channel}: {error}")
+
+def plan_archive_repair(channel_dir):
+    """What repairing a channel's archive.txt would do, without touching anything.
+    Archived ids with no VTT are dropped so yt-dlp retries them, repeated lines are dropped,
+    other lines are kept as they are. 'queue' holds every id that should be downloaded again"""
+    channel_dir = Path(channel_dir)
+    archive_path = channel_dir / "archive.txt"
+    plan = {'channel': channel_dir.name, 'archive': str(archive_path), 'errors': []}
+
+    vtt_dir = channel_dir / VTT_SUBDIR
+    if not archive_path.exists() or not vtt_dir.exists():
+        plan['errors'].append("archive.txt or vtt_files not found, nothing to repair")
+        return plan
+    vtt_files = scan_vtt_files(vtt_dir)
+
+    metadata_ids = set()
+    try:
+        with open(channel_dir / "metadata.json", 'r', encoding='utf-8') as f:
+            metadata_ids = {entry['id'] for entry in json.load(f) if 'id' in entry}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        plan['errors'].append(f"Error loading metadata file: {e}")
+        return plan
+
+    stat = archive_path.stat()
+    with open(archive_path, 'r', encoding='utf-8') as f:
+        old_lines = f.read().splitlines()
+
+    new_lines, removed, seen = [], [], set()
+    for line in old_lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] == 'youtube':
+            if parts[1] in seen:
+                continue
+            seen.add(parts[1])
+            if parts[1] not in vtt_files:
+                removed.append(parts[1])
+                continue
+        new_lines.append(line)
+
+    plan.update({
+        'old_lines': old_lines,
+        'new_lines': new_lines,
+        'removed': removed,
+        'queue': sorted(set(removed) | (metadata_ids - set(vtt_files))),
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+    })
+    if old_lines and not any(line.strip() for line in new_lines):
+        plan['errors'].append("repair would empty archive.txt, refusing (check vtt_files)")
+    return plan
+
+def archive_diff(plan, context=0):
+    return list(unified_diff(plan['old_lines'], plan['new_lines'], f"a/{plan['channel']}/archive.txt",
+                             f"b/{plan['channel']}/archive.txt", n=context, lineterm=""))
+
+def apply_archive_repair(plan, queue=True):
+    """Rewrite archive.txt atomically with a backup, then queue the ids for download.
+    Refuses if archive.txt changed since the plan was made. Returns the backup path"""
+    archive_path = Path(plan['archive'])
+    stat = archive_path.stat()
+    if (stat.st_mtime_ns, stat.st_size) != (plan['mtime'], plan['size']):
+        raise RuntimeError(f"{archive_path} changed since the dry run, run the repair again")
+    backup = None
+    if plan['new_lines'] != plan['old_lines']:
+        backup = write_atomic(str(archive_path), "\n".join(plan['new_lines']) + "\n", backup=True)
+    if queue and plan['queue']:
+        add_to_queue(plan['channel'], plan['queue'], str(archive_path.parent.parent / "download_queue.json"))
+    return backup
+
+def repair_archives(base_dir, channels=None, apply=False, show=10):
+    """Dry run (default) or apply archive repairs for many channels in one go"""
+    if not channels:
+        with os.scandir(base_dir) as entries:
+            channels = sorted(e.name for e in entries if e.is_dir() and not e.name.startswith('.'))
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+        plans = list(pool.map(plan_archive_repair, [os.path.join(base_dir, c) for c in channels]))
+
+    removed = queued = 0
+    for plan in plans:
+        if plan['errors']:
+            for error in plan['errors']:
+                print(f"{plan['channel']}: {error}")
+            continue
+        if not plan['removed'] and not plan['queue'] and plan['new_lines'] == plan['old_lines']:
+            continue
+        diff = archive_diff(plan)
+        print(f"\n{plan['channel']}: remove {len(plan['removed'])} archive entries, "
+              f"{len(plan['old_lines']) - len(plan['new_lines']) - len(plan['removed'])} repeats, "
+              f"queue {len(plan['queue'])} downloads")
+        body = [line for line in diff[2:] if not line.startswith('@@')]
+        for line in body[:show]:
+            print(f"  {line}")
+        if len(body) > show:
+            print(f"  ...and {len(body) - show} more")
+        removed += len(plan['removed'])
+        queued += len(plan['queue'])
+        if apply:
+            try:
+                if backup := apply_archive_repair(plan):
+                    print(f"  archive.txt rewritten, backup: {backup}")
+            except Exception as e:
+                print(f"  not applied: {e}")
+
+    print(f"\n{'Applied' if apply else 'Dry run'}: {removed} archive entries removed, {queued} ids "
+          f"{'queued' if apply else 'would be queued'} across {len(plans)} channels")
+    if not apply and (removed or queued):
+        print("Run again with --apply to write the changes")
+
 def main():
     parser = argparse.ArgumentParser(
         description="Check VTT files match metadata and clean archive.txt")
-    parser.add_argument('directory', help="Name of directory (e.g., 'vsauce') containing the files")
+    parser.add_argument('directory', nargs='*', help="Name of directory (e.g., 'vsauce') containing the files")
     parser.add_argument('--base-dir', default=DEFAULT_BASE_DIR, 
                        help=f"Base directory (default: {DEFAULT_BASE_DIR})")
+    parser.add_argument('--scan', action='store_true',
+                       help="Integrity scan of the given directories (default: all of them) into one JSON report")
+    parser.add_argument('--report', help=f"Report path for --scan (default: <base-dir>/{REPORT_NAME})")
+    parser.add_argument('--workers', type=int, help="Parallel channel scans (default: 4 per CPU, max 32)")
+    parser.add_argument('--repair', action='store_true',
+                       help="Dry run of archive.txt repairs for the given directories (default: all of them)")
+    parser.add_argument('--apply', action='store_true',
+                       help="With --repair: rewrite archive.txt (with a backup) and queue missing ids for download")
     
     args = parser.parse_args()
+
+    if args.repair:
+        repair_archives(args.base_dir, args.directory, apply=args.apply)
+        return
+
+    if args.scan:
+        report = scan_corpus(args.base_dir, args.directory, args.workers)
+        report_path = args.report or os.path.join(args.base_dir, REPORT_NAME)
+        write_report(report, report_path)
+        print_scan(report)
+        print(f"\nFull report saved to: {report_path}")
+        return
+    if len(args.directory) != 1:
+        parser.error("give one directory, or use --scan")
+    args.directory = args.directory[0]
     
     dir_path = Path(args.base_dir) / args.directory
     metadata_path = dir_path / "metadata.json"
@@ -126,4 +429,6 @@ def main():
 if __name__ == "__main__":
     main()
 
-# python3 src/debug.py debug
\ No newline at end of file
+# python3 src/debug.py debug
+# python3 src/debug.py --scan
+# python3 src/debug.py --repair [--apply]
\ No newline at end of file
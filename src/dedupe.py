@@ -0,0 +1,228 @@
+import os, json, hashlib, zipfile
+import numpy as np
+from ngrams import tokenize
+from sketches import stable_hash, combine_hashes
+from storage import open_text
+from manifest import content_keys
+from downloadqueue import atomic_file
+
+SHINGLE = 5           # words per shingle
+NUM_PERM = 128        # MinHash signature length
+BANDS = 16            # LSH bands of NUM_PERM // BANDS rows, candidates above ~0.7 similarity
+THRESHOLD = 0.8       # estimated Jaccard similarity that counts as a near duplicate
+PERM_CHUNK = 32
+BUCKET_PAIRS = 50_000  # most pairs compared inside one LSH bucket (boilerplate can fill one bucket)
+TOKEN_CACHE = 200_000  # cached token hashes before the cache is emptied
+EMPTY = np.iinfo(np.uint32).max
+
+# Fixed permutations so signatures from different channels and runs can be compared
+_rng = np.random.default_rng(0x5EED)
+PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+_token_hashes = {}
+
+
+def _token_hash(token):
+    """stable_hash through a capped cache, emptied when full rather than grown"""
+    h = _token_hashes.get(token)
+    if h is None:
+        if len(_token_hashes) >= TOKEN_CACHE:
+            _token_hashes.clear()
+        h = _token_hashes[token] = stable_hash(token)
+    return h
+
+def token_hashes(tokens):
+    return np.fromiter(map(_token_hash, tokens), dtype=np.uint64, count=len(tokens))
+
+def content_hash(tokens):
+    """Exact duplicate key: the cleaned word sequence, ignoring line breaks and case"""
+    return hashlib.blake2b(" ".join(tokens).encode('utf-8'), digest_size=16).hexdigest()
+
+def shingles(tokens, k=SHINGLE):
+    """Distinct hashes of every k-word window (the whole text if shorter)"""
+    hashes = token_hashes(tokens)
+    if not len(hashes):
+        return hashes
+    k = min(k, len(hashes))
+    with np.errstate(over='ignore'):
+        return np.unique(combine_hashes([hashes[i:len(hashes) - k + 1 + i] for i in range(k)]))
+
+def minhash(shingle_hashes):
+    """NUM_PERM minimums of (a * x + b) >> 32 over the shingles; all EMPTY for an empty text"""
+    signature = np.full(NUM_PERM, EMPTY, dtype=np.uint32)
+    if not len(shingle_hashes):
+        return signature
+    x = shingle_hashes[:, None]
+    with np.errstate(over='ignore'):
+        for i in range(0, NUM_PERM, PERM_CHUNK):
+            permuted = (x * PERM_A[i:i + PERM_CHUNK] + PERM_B[i:i + PERM_CHUNK]) >> np.uint64(32)
+            signature[i:i + PERM_CHUNK] = permuted.min(axis=0)
+    return signature
+
+def fingerprint_text(text):
+    tokens = tokenize(text)
+    return content_hash(tokens), minhash(shingles(tokens)), len(tokens)
+
+
+class fingerprintindex:
+    """Exact hashes and MinHash signatures for one channel's transcripts, keyed by txt filename.
+    update() only reads files whose content key (the manifest's txt hash) changed since they were last fingerprinted"""
+
+    def __init__(self):
+        self.names = []
+        self.keys = []
+        self.hashes = []
+        self.lengths = np.zeros(0, dtype=np.int64)
+        self.signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self.dir = ""
+
+    def __len__(self):
+        return len(self.names)
+
+    def paths(self):
+        return [os.path.join(self.dir, name) for name in self.names]
+
+    def update(self, txt_files, keys, drop_missing=True):
+        """Fingerprint files whose key (see manifest.content_keys) is new or changed; with drop_missing,
+        forget files not in txt_files. Returns how many files were (re)fingerprinted"""
+        position = {name: i for i, name in enumerate(self.names)}
+        keep = [] if drop_missing else list(range(len(self.names)))
+        added = []
+        for path, key in zip(txt_files, keys):
+            name = os.path.basename(path)
+            self.dir = self.dir or os.path.dirname(path)
+            if key is None:
+                continue
+            i = position.get(name)
+            if i is not None and self.keys[i] == key:
+                if drop_missing:
+                    keep.append(i)
+                continue
+            try:
+                with open_text(path) as f:
+                    added.append((name, key, *fingerprint_text(f.read())))
+            except (OSError, EOFError, UnicodeDecodeError):
+                continue
+            if i is not None and not drop_missing:
+                keep.remove(i)
+
+        keep = np.array(sorted(keep), dtype=np.int64)
+        self.names = [self.names[i] for i in keep] + [a[0] for a in added]
+        self.hashes = [self.hashes[i] for i in keep] + [a[2] for a in added]
+        self.keys = [self.keys[i] for i in keep] + [a[1] for a in added]
+        self.lengths = np.concatenate([self.lengths[keep], np.array([a[4] for a in added], dtype=np.int64)])
+        self.signatures = np.vstack([self.signatures[keep]] + [a[3][None, :] for a in added])
+        return len(added)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_file(path, 'wb') as f:
+            np.savez_compressed(f, lengths=self.lengths, signatures=self.signatures,
+                                info=np.array(json.dumps({'names': self.names, 'keys': self.keys,
+                                                          'hashes': self.hashes, 'dir': self.dir,
+                                                          'num_perm': NUM_PERM, 'shingle': SHINGLE})))
+
+    @classmethod
+    def load(cls, path):
+        """Saved fingerprints, or an empty index (rebuilt by the next update) if the file is missing,
+        unreadable or made with other MinHash settings"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                info = json.loads(str(data['info']))
+                if info.get('num_perm') != NUM_PERM or info.get('shingle') != SHINGLE:
+                    return index  # signatures from other settings are not comparable
+                lengths, signatures = data['lengths'], data['signatures']
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return index
+        index.names, index.hashes, index.dir = info['names'], info['hashes'], info['dir']
+        index.keys = info.get('keys') or [None] * len(index.names)  # mtime-keyed files are read once more
+        index.lengths, index.signatures = lengths, signatures
+        return index
+
+
+def fingerprint_path(channel_dir):
+    return os.path.join(channel_dir, "dedupe", "fingerprints.npz")
+
+def update_fingerprints(channel_dir, txt_files):
+    """Load a channel's fingerprints, add the new or changed txt_files and save if anything changed"""
+    path = fingerprint_path(channel_dir)
+    index = fingerprintindex.load(path)
+    count = len(index)
+    if index.update(txt_files, content_keys(channel_dir, txt_files)) or len(index) != count:
+        index.save(path)
+    return index
+
+
+def find_duplicates(indexes, threshold=THRESHOLD, bands=BANDS):
+    """Groups of txt paths that are exact or near duplicates, across all the given indexes.
+    Candidates come from LSH banding (pairs sharing one band of their signature) and are
+    confirmed on the estimated Jaccard similarity, so the cost stays close to linear. Pairs already
+    in one group are not compared again, and at most BUCKET_PAIRS pairs are compared per bucket"""
+    paths = [p for index in indexes for p in index.paths()]
+    if not paths:
+        return []
+    hashes = [h for index in indexes for h in index.hashes]
+    signatures = np.vstack([index.signatures for index in indexes])
+
+    parent = list(range(len(paths)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    def union(i, j):
+        if (i := find(i)) != (j := find(j)):
+            parent[max(i, j)] = min(i, j)
+
+    first = {}
+    for i, h in enumerate(hashes):
+        if h in first:
+            union(first[h], i)
+        else:
+            first[h] = i
+
+    rows = signatures.shape[1] // bands
+    valid = np.flatnonzero(signatures[:, 0] != EMPTY)
+    for band in range(bands):
+        chunk = np.ascontiguousarray(signatures[valid, band * rows:(band + 1) * rows])
+        keys = chunk.view(np.dtype((np.void, chunk.dtype.itemsize * rows))).ravel()
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            # Every pair in the bucket is a candidate, checked one row against the rest at a time
+            bucket = valid[order[start:start + size]]
+            block = signatures[bucket]
+            roots = np.array([find(i) for i in bucket])
+            checked = 0
+            for k in range(size - 1):
+                rest = k + 1 + np.flatnonzero(roots[k + 1:] != roots[k])
+                rest = rest[:BUCKET_PAIRS - checked]
+                checked += len(rest)
+                matches = rest[(block[rest] == block[k]).mean(axis=1) >= threshold]
+                for other in bucket[matches]:
+                    union(bucket[k], other)
+                if len(matches):
+                    roots = np.array([find(i) for i in bucket])
+                if checked >= BUCKET_PAIRS:
+                    break
+
+    groups = {}
+    for i in range(len(paths)):
+        groups.setdefault(find(i), []).append(paths[i])
+    return [group for group in groups.values() if len(group) > 1]
+
+def redundant_files(groups, videos=None):
+    """txt paths to leave out so each duplicate group keeps one video:
+    the earliest upload when video rows are given, otherwise the first path"""
+    upload = {v['txt_file']: v.get('upload_date') or '99999999' for v in videos or []}
+    redundant = set()
+    for group in groups:
+        keep = min(group, key=lambda p: (upload.get(p, '99999999'), p))
+        redundant.update(p for p in group if p != keep)
+    return redundant
@@ -7,6 +7,12 @@ import json
 from datetime import datetime, timedelta
 import threading
 import queue
+from downloadqueue import load_queue, remove_from_queue, video_url
+from manifest import update_manifest
+from profiling import span, profile_thread
+
+LOG_LINES = 2000  # lines kept in the window, the full log goes to data/logs
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "logs")
 
 
 class SubDownloader(tk.Toplevel):
@@ -19,6 +25,9 @@ class SubDownloader(tk.Toplevel):
         self.download_thread = None
         self.stop_event = threading.Event()
         self.message_queue = queue.Queue()
+        self.log_file = None
+        self.processed_ids = set()
+        self.histories = {}
         
         self.setup_ui()
         self.after(100, self.process_queue)
@@ -44,13 +53,23 @@ class SubDownloader(tk.Toplevel):
             variable=self.metadata_only_var
         ).grid(column=0, row=2, sticky=tk.W, pady=(5, 10))
         
-        # Download button
+        # Download buttons
+        button_frame = ttk.Frame(self.mainframe)
+        button_frame.grid(column=0, row=3, sticky=tk.W, pady=(10, 0))
         self.download_button = ttk.Button(
-            self.mainframe, 
+            button_frame, 
             text="Download Subtitles", 
             command=self.start_download
         )
-        self.download_button.grid(column=0, row=3, sticky=tk.W, pady=(10, 0))
+        self.download_button.pack(side=tk.LEFT)
+        
+        # Ids queued by `debug.py --repair --apply`, downloaded without a URL
+        self.queue_button = ttk.Button(
+            button_frame, 
+            text="Download Queue", 
+            command=self.start_queue_download
+        )
+        self.queue_button.pack(side=tk.LEFT, padx=(10, 0))
         
         # Progress bar
         self.progress = ttk.Progressbar(
@@ -78,7 +97,7 @@ class SubDownloader(tk.Toplevel):
         scrollbar.grid(column=1, row=6, sticky=(tk.N, tk.S))
         self.text_output['yscrollcommand'] = scrollbar.set
     
-    def start_download(self):
+    def start_download(self, target=None):
         """Start download in background thread"""
         if self.download_thread and self.download_thread.is_alive():
             messagebox.showwarning("Warning", "Download is already in progress!")
@@ -86,16 +105,27 @@ class SubDownloader(tk.Toplevel):
         
         self.stop_event.clear()
         self.download_button.config(state=tk.DISABLED)
+        self.queue_button.config(state=tk.DISABLED)
         self.progress['value'] = 0
         self.text_output.delete(1.0, tk.END)
         self.total_downloaded = 0
+        self.open_log()
         
-        button_text = "Updating Metadata..." if self.metadata_only_var.get() else "Downloading..."
+        button_text = "Updating Metadata..." if self.metadata_only_var.get() and not target else "Downloading..."
         self.download_button.config(text=button_text)
         
-        self.download_thread = threading.Thread(target=self.download_subtitles, daemon=True)
+        self.download_thread = threading.Thread(target=self.run_profiled, args=(target or self.download_subtitles,),
+                                                daemon=True)
         self.download_thread.start()
     
+    def run_profiled(self, target):
+        with profile_thread():
+            target()
+    
+    def start_queue_download(self):
+        """Start downloading the queued ids in background thread"""
+        self.start_download(target=self.download_queue)
+    
     def download_subtitles(self):
         """Main download logic"""
         url = self.url_entry.get().strip()
@@ -127,6 +157,13 @@ class SubDownloader(tk.Toplevel):
             self.queue_message("error", f"No previous downloads found. Directory: {base_dir}")
             return
         
+        # Counts from before history was kept become each video's first snapshot
+        try:
+            with open(os.path.join(base_dir, "metadata.json"), 'r', encoding='utf-8') as f:
+                self.history(base_dir).seed(json.load(f))
+        except Exception as e:
+            self.queue_message("error", f"Could not record metadata history: {str(e)}")
+        
         videos_to_update = self.get_outdated_videos(base_dir)
         if not videos_to_update:
             self.queue_message("status", "All metadata is up to date (updated within 7 days)")
@@ -134,13 +171,54 @@ class SubDownloader(tk.Toplevel):
         
         self.queue_message("status", f"{len(videos_to_update)} videos need metadata updates")
         self.update_metadata_batch(videos_to_update, base_dir, channel_name)
+        self.update_manifest(base_dir)
+    
+    def download_queue(self):
+        """Download every queued id, one yt-dlp batch per channel folder"""
+        try:
+            pending = load_queue()
+            if not pending:
+                self.queue_message("status", "Download queue is empty")
+                return
+            
+            root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input")
+            for channel, video_ids in pending.items():
+                # Channels share one download limit, each batch only gets what is left of it
+                remaining = self.download_limit - self.total_downloaded
+                if self.stop_event.is_set() or remaining <= 0:
+                    break
+                base_dir = os.path.join(root, channel)
+                os.makedirs(base_dir, exist_ok=True)
+                batch_file = os.path.join(base_dir, "queue_batch.txt")
+                with open(batch_file, 'w', encoding='utf-8') as f:
+                    f.write("\n".join(video_url(video_id) for video_id in video_ids) + "\n")
+                
+                self.processed_ids = set()
+                self.queue_message("status", f"{channel}: downloading {len(video_ids)} queued videos...")
+                self.queue_message("log", f"{channel}: {len(video_ids)} queued videos")
+                self.run_download_process(self.build_download_command(base_dir, ["--batch-file", batch_file], remaining),
+                                          base_dir, None, identifier=channel)
+                # Videos yt-dlp got to are done, with or without subtitles
+                remove_from_queue(channel, self.processed_ids)
+                os.remove(batch_file)
+        except Exception as e:
+            self.queue_message("error", f"Unexpected error: {str(e)}")
+        finally:
+            self.queue_message("done", None)
     
     def handle_subtitle_download(self, base_dir, channel_name, url):
         """Handle normal subtitle download mode"""
+        command = self.build_download_command(base_dir, [url])
+        self.queue_message("status", f"Starting download (max {self.download_limit} subtitles)...")
+        self.run_download_process(command, base_dir, channel_name)
+    
+    def build_download_command(self, base_dir, sources, max_downloads=None):
+        """yt-dlp command writing subtitles to base_dir/vtt_files, sources is a URL or --batch-file args.
+        max_downloads defaults to the whole download limit"""
         vtt_dir = os.path.join(base_dir, "vtt_files")
         os.makedirs(vtt_dir, exist_ok=True)
         
-        command = [
+        return [
             "yt-dlp",
             "--write-auto-sub", "--sub-lang", "en", "--skip-download",
             "--convert-subs", "vtt", "--print-json",
@@ -149,41 +227,41 @@ class SubDownloader(tk.Toplevel):
             "--sleep-subtitles", "1",
             "--extractor-args", "youtube:player-client=default,mweb",
             "-o", os.path.join(vtt_dir, "%(title)s [%(id)s].%(ext)s"),
-            "--max-downloads", str(self.download_limit),
-            url
+            "--max-downloads", str(self.download_limit if max_downloads is None else max_downloads),
+            *sources
         ]
-        
-        self.queue_message("status", f"Starting download (max {self.download_limit} subtitles)...")
-        self.run_download_process(command, base_dir, channel_name)
     
-    def run_download_process(self, command, base_dir, channel_name):
+    def run_download_process(self, command, base_dir, channel_name, identifier=None):
         """Run yt-dlp process and handle output"""
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        while True:
-            if self.stop_event.is_set():
-                process.terminate()
-                self.queue_message("status", "Download stopped by user")
-                break
-            
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
-                break
+        with span("yt-dlp", kind="download", channel=os.path.basename(base_dir)) as s:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
             
-            try:
-                video_data = json.loads(line)
-                if video_data.get('_type') == 'playlist':
-                    continue
-                
-                self.process_video_data(video_data, base_dir, channel_name)
-                
-                if self.total_downloaded >= self.download_limit:
+            while True:
+                if self.stop_event.is_set():
                     process.terminate()
+                    self.queue_message("status", "Download stopped by user")
                     break
-            except json.JSONDecodeError:
-                continue
+                
+                line = process.stdout.readline()
+                if not line and process.poll() is not None:
+                    break
+                
+                try:
+                    video_data = json.loads(line)
+                    if video_data.get('_type') == 'playlist':
+                        continue
+                    
+                    self.process_video_data(video_data, base_dir, channel_name)
+                    
+                    if self.total_downloaded >= self.download_limit:
+                        process.terminate()
+                        break
+                except json.JSONDecodeError:
+                    continue
+            s.set(videos=self.total_downloaded, returncode=process.poll())
         
-        self.finalize_download(process)
+        self.update_manifest(base_dir)
+        self.finalize_download(process, identifier)
     
     def process_video_data(self, data, base_dir, channel_name):
         """Process and save video data"""
@@ -206,6 +284,7 @@ class SubDownloader(tk.Toplevel):
         }
         
         self.save_metadata(base_dir, entry)
+        self.processed_ids.add(entry['id'])
         self.total_downloaded += 1
         
         progress = (self.total_downloaded / self.download_limit) * 100
@@ -230,28 +309,30 @@ class SubDownloader(tk.Toplevel):
                 "--no-warnings", "--extractor-args", "youtube:player-client=default,mweb"
             ] + urls
             
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            
-            for line in process.stdout:
-                if self.stop_event.is_set():
-                    process.terminate()
-                    break
+            with span("yt-dlp", kind="metadata", channel=os.path.basename(base_dir), videos=len(batch)) as s:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
                 
-                try:
-                    data = json.loads(line)
-                    if data.get('_type') == 'playlist':
-                        continue
-                    
-                    original = next((v for v in batch if v['id'] == data.get('id')), None)
-                    entry = self.build_metadata_entry(data, channel_name, original)
+                for line in process.stdout:
+                    if self.stop_event.is_set():
+                        process.terminate()
+                        break
                     
-                    self.update_existing_metadata(base_dir, entry)
-                    updated_count += 1
-                    
-                    self.queue_message("progress", (updated_count / total) * 100)
-                    self.queue_message("log", self.format_update_message(entry, original))
-                except json.JSONDecodeError:
-                    continue
+                    try:
+                        data = json.loads(line)
+                        if data.get('_type') == 'playlist':
+                            continue
+                        
+                        original = next((v for v in batch if v['id'] == data.get('id')), None)
+                        entry = self.build_metadata_entry(data, channel_name, original)
+                        
+                        self.update_existing_metadata(base_dir, entry)
+                        updated_count += 1
+                        
+                        self.queue_message("progress", (updated_count / total) * 100)
+                        self.queue_message("log", self.format_update_message(entry, original))
+                    except json.JSONDecodeError:
+                        continue
+                s.set(returncode=process.poll())
         
         msg = f"✓ Updated metadata for {updated_count}/{total} videos" if updated_count > 0 else "No metadata was updated"
         self.queue_message("status", msg)
@@ -306,6 +387,20 @@ class SubDownloader(tk.Toplevel):
         except (ValueError, TypeError, AttributeError):
             return True
     
+    def history(self, base_dir):
+        """View/like/comment snapshots for a channel folder, every save and refresh appends to it"""
+        if base_dir not in self.histories:
+            from history import statshistory
+            self.histories[base_dir] = statshistory(base_dir)
+        return self.histories[base_dir]
+    
+    def update_manifest(self, base_dir):
+        """Bring the channel's manifest up to date once a batch is written, so tools don't rescan"""
+        try:
+            update_manifest(base_dir)
+        except Exception as e:
+            self.queue_message("error", f"Could not update manifest: {str(e)}")
+    
     def save_metadata(self, base_dir, entry):
         """Add new entry to metadata.json"""
         json_file = os.path.join(base_dir, "metadata.json")
@@ -320,6 +415,7 @@ class SubDownloader(tk.Toplevel):
                 metadata.append(entry)
                 with open(json_file, 'w', encoding='utf-8') as f:
                     json.dump(metadata, f, indent=2)
+                self.history(base_dir).append([entry])
         except Exception as e:
             self.queue_message("error", f"Could not update metadata: {str(e)}")
     
@@ -344,13 +440,14 @@ class SubDownloader(tk.Toplevel):
             
             with open(json_file, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2)
+            self.history(base_dir).append([entry])
         except Exception as e:
             self.queue_message("error", f"Could not update metadata: {str(e)}")
     
-    def finalize_download(self, process):
+    def finalize_download(self, process, identifier=None):
         """Handle download completion"""
         if self.total_downloaded > 0:
-            identifier = self.extract_identifier(self.url_entry.get().strip())
+            identifier = identifier or self.extract_identifier(self.url_entry.get().strip())
             self.queue_message("status", f"✓ Downloaded {self.total_downloaded} subtitles to {identifier}")
         else:
             error = process.stderr.read()
@@ -464,10 +561,41 @@ class SubDownloader(tk.Toplevel):
         """Add message to queue for UI updates"""
         self.message_queue.put((msg_type, content))
     
+    def open_log(self):
+        """Start a new log file for this run, the window only keeps the last LOG_LINES"""
+        self.close_log()
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            path = os.path.join(LOG_DIR, f"download-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+            self.log_file = open(path, 'a', encoding='utf-8')
+            self.queue_message("log", f"Full log: {path}")
+        except OSError:
+            self.log_file = None
+
+    def close_log(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def write_log(self, lines):
+        """One file write and one Text insert for everything logged since the last tick"""
+        text = "\n".join(lines) + "\n"
+        if self.log_file is not None:
+            self.log_file.write(text)
+            self.log_file.flush()
+        
+        self.text_output.insert(tk.END, text)
+        excess = int(self.text_output.index('end-1c').split('.')[0]) - 1 - LOG_LINES
+        if excess > 0:
+            self.text_output.delete(1.0, f"{excess + 1}.0")
+        self.text_output.see(tk.END)
+
     def process_queue(self):
         """Process message queue for UI updates"""
+        lines = []
+        done = False
         try:
-            while True:
+            while not done:
                 msg_type, content = self.message_queue.get_nowait()
                 
                 if msg_type == "status":
@@ -475,18 +603,28 @@ class SubDownloader(tk.Toplevel):
                 elif msg_type == "progress":
                     self.progress['value'] = content
                 elif msg_type == "log":
-                    self.text_output.insert(tk.END, content + "\n")
-                    self.text_output.see(tk.END)
+                    lines.append(content)
                 elif msg_type == "error":
+                    self.write_log(lines + [f"ERROR: {content}"])
+                    lines = []
                     messagebox.showerror("Error", content)
                 elif msg_type == "done":
                     self.download_button.config(state=tk.NORMAL, text="Download Subtitles")
-                    break
+                    self.queue_button.config(state=tk.NORMAL)
+                    done = True
         except queue.Empty:
             pass
         
+        if lines:
+            self.write_log(lines)
+        if done:
+            self.close_log()
         self.after(100, self.process_queue)
 
+    def destroy(self):
+        self.stop_event.set()
+        self.close_log()
+        super().destroy()
 
 if __name__ == "__main__":
     class StandaloneApp(tk.Tk):
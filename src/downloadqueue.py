@@ -0,0 +1,76 @@
+import os, json, tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+QUEUE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "input",
+                          "download_queue.json")
+
+
+@contextmanager
+def atomic_file(path, mode='w'):
+    """Open a temp file next to path for writing. On a clean exit it is fsynced and renamed over
+    path in one step, on an error it is removed and path is left as it was"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=f".{os.path.basename(path)}.",
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def write_atomic(path, text, backup=False):
+    """Replace path with text in one step (see atomic_file).
+    With backup, the old file is first kept as <path>.<timestamp>.bak. Returns the backup path"""
+    backup_path = None
+    if backup and os.path.exists(path):
+        backup_path = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.bak"
+        with open(path, 'rb') as src, open(backup_path, 'wb') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+
+    with atomic_file(path) as f:
+        f.write(text)
+    return backup_path
+
+def load_queue(path=QUEUE_PATH):
+    """{channel folder: [video ids]} waiting to be downloaded"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_queue(queue, path=QUEUE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, json.dumps({c: ids for c, ids in queue.items() if ids}, indent=2))
+
+def add_to_queue(channel, video_ids, path=QUEUE_PATH):
+    """Queue ids for a channel folder, skipping ones already queued. Returns how many were added"""
+    queue = load_queue(path)
+    queued = queue.setdefault(channel, [])
+    seen = set(queued)
+    new = [i for i in dict.fromkeys(video_ids) if i not in seen]
+    queued.extend(new)
+    if new:
+        save_queue(queue, path)
+    return len(new)
+
+def remove_from_queue(channel, video_ids, path=QUEUE_PATH):
+    queue = load_queue(path)
+    done = set(video_ids)
+    if channel in queue:
+        queue[channel] = [i for i in queue[channel] if i not in done]
+        save_queue(queue, path)
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def moment_url(video_id, seconds=None):
+    """Watch link that starts playback at seconds (whole seconds, as YouTube takes them)"""
+    return video_url(video_id) + (f"&t={int(seconds)}s" if seconds else "")
@@ -1,29 +1,27 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import os, re, json, webbrowser, random, subprocess, sys
-from datetime import datetime
+from tkinter import ttk, messagebox
+import os, webbrowser, random, sys
 from collections import defaultdict
-from importlib.metadata import distributions
-import matplotlib.pyplot as plt
-from PIL import Image
-import numpy as np
 from searchhelper import (
     hms_to_seconds, seconds_to_hms, is_valid_date, process_search_query, 
-    matches_search_terms, check_requirements, extract_video_id
+    matches_search_terms, check_requirements, module_available, extract_video_id
 )
+from trends import trendcube, cube_path, update_term_cube, update_position_cube, masked_trend
+from corpus import corpus, channel, parse_handles, group_counts
+from ranking import wordranking
+from vtree import virtualtree
+from worker import backgroundjob, chunks
+from transcripts import load_stopwords, convert_vtt_file, get_word_at_index, position_label, word_time
+from downloadqueue import moment_url
+from storage import plain_name
+from manifest import update_manifest, record_conversions, conversion_settings, needs_conversion
+from profiling import span, traced
 
-# Find Wordcloud and Treemap
-try:
-    from wordcloud import WordCloud
-    WORDCLOUD_AVAILABLE = True
-except ImportError:
-    WORDCLOUD_AVAILABLE = False
+# Plotting libraries (matplotlib, numpy, PIL, wordcloud, squarify) are imported on first chart use
+WORDCLOUD_AVAILABLE = module_available("wordcloud")
+SQUARIFY_AVAILABLE = module_available("squarify")
 
-try:
-    import squarify
-    SQUARIFY_AVAILABLE = True
-except ImportError:
-    SQUARIFY_AVAILABLE = False
+FILTER_DELAY_MS = 250
 
 
 class firstana(tk.Toplevel):
@@ -33,8 +31,11 @@ class firstana(tk.Toplevel):
         self.geometry("1600x1000")
         self.video_metadata = []
         self.current_stats = {}
-        self.check_requirements()
+        self.job = None
+        self.table = None
+        self.filter_after = None
         self.setup_ui()
+        self.check_requirements()
         
     def setup_ui(self):
         self.mainframe = ttk.Frame(self, padding=10)
@@ -45,7 +46,7 @@ class firstana(tk.Toplevel):
         left = ttk.Frame(self.mainframe)
         left.grid(column=0, row=0, sticky="nsew", padx=10)
         
-        ttk.Label(left, text="Folder name (Channel handle or Playlist ID)").grid(column=0, row=0, sticky="w", pady=(0,5))
+        ttk.Label(left, text="Folder names (Channel handles or Playlist IDs, comma separated)").grid(column=0, row=0, sticky="w", pady=(0,5))
         self.url_entry = ttk.Entry(left, width=60)
         self.url_entry.grid(column=0, row=1, sticky="we", pady=(0,10))
         
@@ -59,6 +60,8 @@ class firstana(tk.Toplevel):
         ttk.Checkbutton(btn_frame, text="Use Stopwords", variable=self.use_stopwords).pack(side="left", padx=5)
         self.no_punctuation = tk.BooleanVar(value=True)
         ttk.Checkbutton(btn_frame, text="No Punctuation", variable=self.no_punctuation).pack(side="left", padx=5)
+        self.exclude_duplicates = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="Exclude Duplicates", variable=self.exclude_duplicates).pack(side="left", padx=5)
         
         word_index_frame = ttk.Frame(left)
         word_index_frame.grid(column=0, row=3, sticky="w", pady=(10,5))
@@ -67,6 +70,21 @@ class firstana(tk.Toplevel):
         self.word_index.pack(side="left", padx=(5,10))
         ttk.Label(word_index_frame, text="(0=1st, 1=2nd, -1=last, etc. Default: 0)").pack(side="left")
         
+        ngram_frame = ttk.Frame(left)
+        ngram_frame.grid(column=0, row=4, sticky="w", pady=(5,5))
+        ttk.Label(ngram_frame, text="N-gram size:").pack(side="left")
+        self.ngram_size = ttk.Entry(ngram_frame, width=4)
+        self.ngram_size.insert(0, "2")
+        self.ngram_size.pack(side="left", padx=(5,10))
+        self.ngram_scope = tk.StringVar(value="window")
+        ttk.Radiobutton(ngram_frame, text="From position, window:", variable=self.ngram_scope, value="window").pack(side="left")
+        self.ngram_window = ttk.Entry(ngram_frame, width=4)
+        self.ngram_window.insert(0, "5")
+        self.ngram_window.pack(side="left", padx=(0,10))
+        ttk.Radiobutton(ngram_frame, text="Full transcript", variable=self.ngram_scope, value="full").pack(side="left")
+        self.ngram_approximate = tk.BooleanVar(value=False)
+        ttk.Checkbutton(ngram_frame, text="Approximate (64 MB cap)", variable=self.ngram_approximate).pack(side="left", padx=(10,0))
+        
         ttk.Label(left, text="Word Filter:").grid(column=0, row=5, sticky="w", pady=(10,5))
         self.words_entry = ttk.Entry(left, width=70)
         self.words_entry.grid(column=0, row=6, sticky="we", pady=(0,20))
@@ -121,7 +139,9 @@ class firstana(tk.Toplevel):
             getattr(self, var).pack(side="left")
             ttk.Label(dur_frame, text="(HH:MM:SS)").pack(side="left", padx=(0,5))
         
-        self.tree = ttk.Treeview(self.mainframe, columns=('details', 'duration', 'date'), height=15)
+        self.results = virtualtree(self.mainframe, columns=('details', 'duration', 'date'), height=15)
+        self.result_videos = []
+        self.tree = self.results.tree
         self.tree.grid(column=0, row=8, columnspan=2, sticky="nsew")
         self.tree.column('#0', width=500, anchor="w", stretch=True)
         self.tree.column('details', width=300, anchor="w")
@@ -132,9 +152,16 @@ class firstana(tk.Toplevel):
         self.tree.heading('duration', text='Duration')
         self.tree.heading('date', text='Date')
         self.tree.bind("<Double-1>", self.on_tree_double_click)
-
-        vsb = ttk.Scrollbar(self.mainframe, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree_menu = tk.Menu(self, tearoff=0)
+        self.tree_menu.add_command(label="Similar Videos", command=self.show_similar_videos)
+        self.tree.bind("<Button-2>" if sys.platform == "darwin" else "<Button-3>", self.on_tree_right_click)
+
+        vsb = self.results.scrollbar
+        for entry in (self.words_entry, self.title_filter, self.channel_filter, self.date_from,
+                      self.date_to, self.duration_min, self.duration_max):
+            entry.bind("<KeyRelease>", self.schedule_filters)
+        self.sort_var.trace_add('write', lambda *_: self.resort_results())
+        self.sort_direction.trace_add('write', lambda *_: self.resort_results())
         vsb.grid(column=2, row=8, sticky='ns')
 
         self.mainframe.columnconfigure(0, weight=1)
@@ -145,8 +172,14 @@ class firstana(tk.Toplevel):
         bottom_frame = ttk.Frame(self.mainframe)
         bottom_frame.grid(column=0, row=9, columnspan=2, sticky="w", pady=(0,20))
         ttk.Button(bottom_frame, text="Run Analysis", command=self.run_analysis).pack(side="left", padx=5)
+        ttk.Button(bottom_frame, text="Run N-gram Analysis", command=self.run_ngram_analysis).pack(side="left", padx=5)
+        ttk.Button(bottom_frame, text="Distinctive Words", command=self.run_tfidf_analysis).pack(side="left", padx=5)
         ttk.Button(bottom_frame, text="Show Top Words (max 5000)", command=self.show_full_stats).pack(side="left", padx=5)
         ttk.Button(bottom_frame, text="Random Video", command=self.show_random_video).pack(side="left", padx=5)
+        self.progress = ttk.Progressbar(bottom_frame, orient='horizontal', length=300, mode='determinate')
+        self.progress.pack(side="left", padx=(20,5))
+        self.cancel_button = ttk.Button(bottom_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.pack(side="left", padx=5)
         
         self.status_var = tk.StringVar()
         ttk.Label(self.mainframe, textvariable=self.status_var).grid(column=0, row=10, columnspan=2, sticky="w")
@@ -154,10 +187,16 @@ class firstana(tk.Toplevel):
         self.style.configure('Treeview', rowheight=30, wrap=tk.WORD)
 
     def check_requirements(self):
-        try: return check_requirements()
-        except Exception as e:
+        # Runs off the Tk thread, it may have to walk site-packages or pip install
+        def work(cancel):
+            yield ("progress", 0, "Checking requirements")
+            return check_requirements()
+
+        def failed(e):
             if messagebox.showerror("Error", str(e)): sys.exit(1)
 
+        backgroundjob(self, work, on_error=failed).start()
+
     def get_word_index(self):
         index_str = self.word_index.get().strip()
         if not index_str:
@@ -169,46 +208,90 @@ class firstana(tk.Toplevel):
             return None
 
     def get_word_position_label(self, index):
-        if index == 0:
-            return "1st"
-        elif index == 1:
-            return "2nd"
-        elif index == 2:
-            return "3rd"
-        elif index == -1:
-            return "last"
-        elif index == -2:
-            return "2nd to last"
-        elif index == -3:
-            return "3rd to last"
-        elif index > 0:
-            return f"{index + 1}th"
-        else:
-            return f"{abs(index)}th from end"
+        return position_label(index)
 
     def show_random_video(self):
         try:
-            if not (items := self.tree.get_children()):
+            if not len(self.results):
                 messagebox.showinfo("Random Video", "No videos in the current view")
                 return
 
-            item = self.tree.item(random.choice(items), 'text')
-            for video in self.video_metadata:
-                if f"{video.get('title', '')} - {video.get('channel_name', '')}" == item:
-                    if url := video.get('url'): webbrowser.open(url)
-                    else: messagebox.showinfo("Random Video", "No URL found")
-                    return
-            messagebox.showinfo("Random Video", "Couldn't find video URL")
+            video = self.result_videos[random.choice(self.results.order)]
+            if url := video.get('url'): webbrowser.open(url)
+            else: messagebox.showinfo("Random Video", "No URL found")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open random video: {str(e)}")
 
     def on_tree_double_click(self, event):
-        if not (item := self.tree.selection()[0]): return
-        if item_text := self.tree.item(item, 'text'):
-            for video in self.video_metadata:
-                if f"{video.get('title', '')} - {video.get('channel_name', '')}" == item_text:
-                    webbrowser.open(video.get('url', ''))
-                    return
+        if (index := self.results.selected_row()) is None: return
+        video = self.result_videos[index]
+        # Position rows open at the moment their word was spoken, when the transcript has cue timings
+        if video.get('word_index') is not None and video.get('id') and video.get('txt_file'):
+            if (seconds := word_time(video['txt_file'], video['word_index'])) is not None:
+                webbrowser.open(moment_url(video['id'], seconds))
+                return
+        if url := video.get('url'):
+            webbrowser.open(url)
+
+    def on_tree_right_click(self, event):
+        if not (item := self.tree.identify_row(event.y)):
+            return
+        self.tree.selection_set(item)
+        self.results.on_select(event)
+        self.tree_menu.tk_popup(event.x_root, event.y_root)
+
+    def show_similar_videos(self):
+        """Videos whose transcripts read most like the selected one, across the loaded channels"""
+        if (index := self.results.selected_row()) is None:
+            messagebox.showinfo("Similar Videos", "Select a video first")
+            return
+        video = self.result_videos[index]
+        if not video.get('txt_file'):
+            messagebox.showinfo("Similar Videos", "No transcript for this video")
+            return
+        current = self.corpus
+
+        def work(cancel):
+            from similar import update_similar, similar_videos, NEIGHBOURS
+            indexes = []
+            for i, ch in enumerate(current.channels.values()):
+                if cancel.is_set():
+                    return None
+                yield ("progress", i / len(current.channels), f"{ch.handle}: updating similar videos index")
+                indexes.append(update_similar(ch.dir, ch.txt_files))
+            by_file = {v['txt_file']: v for v in current.videos()}
+            return [(by_file[path], score) for path, score in similar_videos(indexes, video['txt_file'], NEIGHBOURS)
+                    if path in by_file]
+
+        def done(neighbours):
+            self.finish_job(f"{len(neighbours)} videos similar to {video.get('title', video['txt_file'])}")
+            if not neighbours:
+                messagebox.showinfo("Similar Videos", "No similar videos found")
+                return
+            popup = tk.Toplevel(self)
+            popup.title(f"Similar to: {video.get('title', '')}")
+            popup.geometry("900x300")
+            tree = ttk.Treeview(popup, columns=('channel', 'similarity', 'date'))
+            tree.heading('#0', text='Video')
+            tree.heading('channel', text='Channel')
+            tree.heading('similarity', text='Similarity')
+            tree.heading('date', text='Date')
+            tree.column('#0', width=500, anchor="w", stretch=True)
+            for column in ('channel', 'similarity', 'date'):
+                tree.column(column, width=100, anchor="w")
+            urls = {}
+            for row, score in neighbours:
+                date = row.get('upload_date', '')
+                if len(date) == 8 and '-' not in date:
+                    date = f"{date[:4]}-{date[4:6]}-{date[6:8]}"
+                item = tree.insert('', 'end', text=row.get('title', ''),
+                                   values=(row.get('channel_name') or row.get('channel_handle', ''),
+                                           f"{score:.2f}", date))
+                urls[item] = row.get('url')
+            tree.pack(fill="both", expand=True, padx=10, pady=10)
+            tree.bind("<Double-1>", lambda e: (url := urls.get(tree.focus())) and webbrowser.open(url))
+
+        self.start_job(work, done)
 
     def edit_stopwords(self):
         root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -223,133 +306,200 @@ class firstana(tk.Toplevel):
         else: os.system(f'open "{path}"')
 
     def convert_vtt_to_txt(self):
-        if not (handle := self.url_entry.get().strip()):
+        if not (handles := parse_handles(self.url_entry.get())):
             messagebox.showerror("Error", "Please enter a channel handle or playlist ID")
             return
         
         root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        vtt_dir = os.path.join(root, "data", "input", handle, "vtt_files")
-        txt_dir = os.path.join(root, "data", "input", handle, "txt_files")
+        stopwords = load_stopwords(root) if self.use_stopwords.get() else set()
+        no_punctuation = self.no_punctuation.get()
+        
+        def work(cancel):
+            channels, errors = [], []
+            for handle in handles:
+                if cancel.is_set():
+                    return None
+                ch = yield from self.convert_channel(root, handle, stopwords, no_punctuation, errors, cancel)
+                if ch is not None:
+                    channels.append(ch)
+            return channels, errors
+        
+        def done(result):
+            channels, errors = result
+            if errors:
+                messagebox.showerror("Error", "\n".join(errors[:10]) + 
+                                     (f"\n...and {len(errors) - 10} more" if len(errors) > 10 else ""))
+            self.corpus = corpus(channels)
+            self.video_metadata = self.corpus.metadata
+            self.txt_files = self.corpus.txt_files
+            self.vtt_files = [f for ch in channels for f in ch.vtt_files]
+            self.finish_job(f"Converted {len(self.txt_files)} VTT files to TXT"
+                            + (f" across {len(channels)} channels" if len(channels) > 1 else ""))
+        
+        self.start_job(work, done)
+
+    def convert_channel(self, root, handle, stopwords, no_punctuation, errors, cancel):
+        channel_dir = os.path.join(root, "data", "input", handle)
+        vtt_dir = os.path.join(channel_dir, "vtt_files")
+        txt_dir = os.path.join(channel_dir, "txt_files")
         
         if not os.path.exists(vtt_dir):
-            messagebox.showerror("Error", f"Directory not found: {vtt_dir}")
-            return
+            errors.append(f"Directory not found: {vtt_dir}")
+            return None
 
-        meta_file = os.path.join(root, "data", "input", handle, "metadata.json")
-        if os.path.exists(meta_file):
-            with open(meta_file, 'r', encoding='utf-8') as f:
-                self.video_metadata = json.load(f)
-        
         os.makedirs(txt_dir, exist_ok=True)
-        self.txt_files = []
-        vtt_files = [f for f in os.listdir(vtt_dir) if f.endswith('.vtt')]
+        entries = sorted((e for e in update_manifest(channel_dir).videos.values() if e.get('vtt')),
+                         key=lambda e: e['vtt'])
         
-        if not vtt_files:
-            messagebox.showerror("Error", f"No VTT files found in {vtt_dir}")
-            return
-        
-        stopwords = set()
-        if self.use_stopwords.get():
-            path = os.path.join(root, "data", "input", "stopwords.txt")
-            if os.path.exists(path):
-                with open(path, 'r', encoding='utf-8') as f:
-                    stopwords.update(line.strip().lower() for line in f if line.strip() and not line.startswith('#'))
+        if not entries:
+            errors.append(f"No VTT files found in {vtt_dir}")
+            return None
         
-        for vtt_file in vtt_files:
+        # Only VTTs without an up to date TXT from these settings are converted again
+        settings = conversion_settings(stopwords, no_punctuation)
+        txt_by_vtt = {e['vtt']: os.path.join(txt_dir, e['txt']) for e in entries if not needs_conversion(e, settings)}
+        vtt_files = [e['vtt'] for e in entries if e['vtt'] not in txt_by_vtt]
+        converted = []
+        for i, vtt_file in enumerate(vtt_files, 1):
+            if cancel.is_set():
+                return None
             try:
-                video_id = extract_video_id(vtt_file)
-                with open(os.path.join(vtt_dir, vtt_file), 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                cleaned = []
-                prev = None
-                for line in lines:
-                    line = line.strip()
-                    if (not line or line == "WEBVTT" or line.startswith(("Kind:", "Language:", "NOTE")) or 
-                       re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3}.*$', line)):
-                        continue
-                    
-                    line = line.replace('[&nbsp;__&nbsp;]', 'FUCK')
-                    line = re.sub(r'\[(?!&nbsp;__&nbsp;).*?\]', '', line)
-                    line = re.sub(r'<.*?>|align:start position:0%|&gt;&gt;|>>|&gt;|<\d{2}:\d{2}:\d{2}\.\d{3}>', '', line)
-                    line = re.sub(r'^\s*[A-Z]+\s*\d*\s*:\s*', '', line)
-                    
-                    if self.no_punctuation.get():
-                        line = re.sub(r'[^\w\s\']', '', line)
-                    if not line: continue
-                    
-                    if self.use_stopwords.get():
-                        words = [word for word in line.split() if word.lower() not in stopwords]
-                        line = ' '.join(words)
-                        if not line: continue
-                    
-                    if line != prev:             
-                        cleaned.append(line)
-                        prev = line
-
-                base = os.path.splitext(vtt_file)[0]
-                txt_file = os.path.join(txt_dir, f"{base}.txt")
-                
-                with open(txt_file, 'w', encoding='utf-8') as f:
-                    f.write("\n".join(cleaned))
-                
-                self.txt_files.append(txt_file)
+                vtt_path = os.path.join(vtt_dir, vtt_file)
+                txt_by_vtt[vtt_file] = convert_vtt_file(vtt_path, txt_dir, stopwords, no_punctuation)
+                converted.append((vtt_path, txt_by_vtt[vtt_file]))
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to convert {vtt_file}: {str(e)}")
-        
-        if self.txt_files:
-            self.status_var.set(f"Converted {len(self.txt_files)} VTT files to TXT")
-            self.vtt_files = [os.path.join(vtt_dir, f) for f in vtt_files]
+                errors.append(f"Failed to convert {vtt_file}: {str(e)}")
+            if i % 50 == 0 or i == len(vtt_files):
+                yield ("progress", i / len(vtt_files), f"{handle}: converted {i}/{len(vtt_files)} VTT files")
+        
+        record_conversions(channel_dir, converted, settings)
+        txt_files = [txt_by_vtt[e['vtt']] for e in entries if e['vtt'] in txt_by_vtt]
+        ch = channel.load(handle)
+        # Full-transcript word counts per month, kept against this manifest version
+        yield ("progress", 1.0, f"{handle}: counting words per month")
+        update_term_cube(channel_dir, ch.videos(), ch.version)
+        # Fingerprints are kept per channel so duplicate checks only read new or changed transcripts
+        yield ("progress", 1.0, f"{handle}: fingerprinting transcripts")
+        from dedupe import update_fingerprints
+        update_fingerprints(channel_dir, txt_files)
+        # Only transcripts whose content changed are projected again
+        yield ("progress", 1.0, f"{handle}: updating similar videos index")
+        from similar import update_similar
+        update_similar(channel_dir, txt_files)
+        return ch
+
+    def start_job(self, work, on_done, on_partial=None):
+        """Run work on a background thread, cancelling whatever was running before"""
+        self.cancel_job()
+        self.progress['value'] = 0
+        self.cancel_button.config(state=tk.NORMAL)
+        self.job = backgroundjob(self, work, on_progress=self.on_job_progress, on_partial=on_partial,
+                                 on_done=on_done, on_error=self.on_job_error).start()
+
+    def cancel_job(self):
+        if self.job is not None and self.job.running:
+            self.job.cancel()
+            self.status_var.set("Cancelled")
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def finish_job(self, status):
+        self.progress['value'] = 100
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_var.set(status)
+
+    def on_job_progress(self, fraction, text):
+        self.progress['value'] = fraction * 100
+        self.status_var.set(text)
+
+    def on_job_error(self, error):
+        self.cancel_button.config(state=tk.DISABLED)
+        messagebox.showerror("Error", str(error))
+
+    def destroy(self):
+        if self.job is not None:
+            self.job.cancel()
+        super().destroy()
 
     def get_video_metadata(self, video_id):
-        return next((v for v in self.video_metadata if v['id'] == video_id), None)
+        return self.corpus.video_by_id(video_id)
 
-    def sort_videos(self, videos):
+    def sort_order(self, videos):
         reverse = (self.sort_direction.get() == "desc")
         key_map = {
             "date": lambda x: x.get('upload_date', ''),
             "duration": lambda x: x.get('duration', 0),
         }
-        return sorted(videos, key=key_map.get(self.sort_var.get(), lambda x: x.get('title', '').lower()), reverse=reverse)
+        key = key_map.get(self.sort_var.get(), lambda x: x.get('title', '').lower())
+        return sorted(range(len(videos)), key=lambda i: key(videos[i]), reverse=reverse)
+
+    def resort_results(self):
+        if self.result_videos:
+            self.results.set_order(self.sort_order(self.result_videos))
+
+    def video_row(self, index):
+        video = self.result_videos[index]
+        date = video.get('upload_date', '')
+        if date and len(date) == 8 and '-' not in date:
+            date = f"{date[:4]}-{date[4:6]}-{date[6:8]}"
+        return (f"{video['title']} - {video.get('channel_name', '')}",
+                (video.get('selected_word') or 'No words found', seconds_to_hms(video.get('duration', 0)), date))
+
+    def read_filters(self, quiet=False):
+        """Snapshot the filter entries so they can be applied off the Tk thread. None if invalid.
+        quiet skips the error dialogs, for filtering while the user is still typing"""
+        filters = {
+            'title': self.title_filter.get().strip(),
+            'channel': self.channel_filter.get().strip(),
+            'words': self.words_entry.get().strip(),
+            'date_from': self.date_from.get().strip(),
+            'date_to': self.date_to.get().strip(),
+            'duration_min': self.duration_min.get().strip(),
+            'duration_max': self.duration_max.get().strip()
+        }
+        def invalid(message):
+            if not quiet:
+                messagebox.showerror("Error", message)
+            return None
+
+        if filters['date_from'] and not is_valid_date(filters['date_from']):
+            return invalid("Invalid 'From' date format. Use YYYY-MM-DD")
+        if filters['date_to'] and not is_valid_date(filters['date_to']):
+            return invalid("Invalid 'To' date format. Use YYYY-MM-DD")
+        for key, label in [('duration_min', "minimum"), ('duration_max', "maximum")]:
+            try:
+                hms_to_seconds(filters[key])
+            except ValueError:
+                return invalid(f"Invalid {label} duration format")
+        return filters
 
-    def filter_videos(self, videos):
+    @traced("filter.videos")
+    def filter_videos(self, videos, filters, use_word_filter=True):
         filtered = videos.copy()
         
-        if title_filter := self.title_filter.get().strip():
+        if title_filter := filters['title']:
             title_terms = process_search_query(title_filter, mode="general")
             filtered = [v for v in filtered if matches_search_terms(v.get('title', ''), title_terms)]
         
-        if channel_filter := self.channel_filter.get().strip():
+        if channel_filter := filters['channel']:
             channel_terms = process_search_query(channel_filter, mode="general")
-            filtered = [v for v in filtered if matches_search_terms(v.get('channel_name', ''), channel_terms)]
+            filtered = [v for v in filtered if matches_search_terms(v.get('channel_name', ''), channel_terms)
+                        or matches_search_terms(v.get('channel_handle', ''), channel_terms)]
         
-        if word_filter := self.words_entry.get().strip():
+        if use_word_filter and (word_filter := filters['words']):
             words = [w.strip().lower() for w in word_filter.split(',')]
             filtered = [v for v in filtered if v.get('selected_word') and v.get('selected_word').lower() in words]
         
-        if date_from := self.date_from.get().strip():
-            if not is_valid_date(date_from):
-                messagebox.showerror("Error", "Invalid 'From' date format. Use YYYY-MM-DD")
-                return filtered
+        if date_from := filters['date_from']:
             filtered = [v for v in filtered if v.get('upload_date', '') >= date_from.replace("-", "")]
 
-        if date_to := self.date_to.get().strip():
-            if not is_valid_date(date_to):
-                messagebox.showerror("Error", "Invalid 'To' date format. Use YYYY-MM-DD")
-                return filtered
+        if date_to := filters['date_to']:
             filtered = [v for v in filtered if v.get('upload_date', '') <= date_to.replace("-", "")]
         
-        if duration_min := self.duration_min.get().strip():
-            try:
-                filtered = [v for v in filtered if v.get('duration', 0) >= hms_to_seconds(duration_min)]
-            except ValueError:
-                messagebox.showerror("Error", "Invalid minimum duration format")
+        if duration_min := filters['duration_min']:
+            filtered = [v for v in filtered if v.get('duration', 0) >= hms_to_seconds(duration_min)]
         
-        if duration_max := self.duration_max.get().strip():
-            try:
-                filtered = [v for v in filtered if v.get('duration', 0) <= hms_to_seconds(duration_max)]
-            except ValueError:
-                messagebox.showerror("Error", "Invalid maximum duration format")
+        if duration_max := filters['duration_max']:
+            filtered = [v for v in filtered if v.get('duration', 0) <= hms_to_seconds(duration_max)]
         
         return filtered
                     
@@ -361,84 +511,237 @@ class firstana(tk.Toplevel):
         word_index = self.get_word_index()
         if word_index is None:
             return
-        
-        self.tree.delete(*self.tree.get_children())
-        self.word_counts = defaultdict(int)
-        
-        video_data = []
-        for txt_file, vtt_file in zip(self.txt_files, self.vtt_files):
-            video_id = extract_video_id(os.path.basename(txt_file))
-            meta = self.get_video_metadata(video_id) if video_id else None
-
-            selected_word = self.get_word_at_index(txt_file, word_index)
-            if selected_word:
-                self.word_counts[selected_word] += 1
-            
-            video_data.append({
-                'txt_file': txt_file,
-                'vtt_file': vtt_file,
-                'name': os.path.splitext(os.path.basename(txt_file))[0],
-                'id': video_id,
-                'selected_word': selected_word,
-                'title': meta.get('title', os.path.splitext(os.path.basename(txt_file))[0]) if meta else os.path.splitext(os.path.basename(txt_file))[0],
-                'upload_date': meta.get('upload_date', '') if meta else '',
-                'duration': meta.get('duration', 0) if meta else 0,
-                'channel_name': meta.get('channel_name', '') if meta else '',
-                'url': meta.get('url', '') if meta else ''
-            })
-        
-        video_data = self.filter_videos(video_data)
-        video_data = self.sort_videos(video_data)
+        if (filters := self.read_filters()) is None:
+            return
         
         position_label = self.get_word_position_label(word_index)
         self.tree.heading('details', text=f'{position_label.capitalize()} Word')
+        current = self.corpus
+        exclude_duplicates = self.exclude_duplicates.get()
+        key = (current.version, word_index, exclude_duplicates)
         
-        for video in video_data:
-            dur_str = seconds_to_hms(video.get('duration', 0))
-            date = video.get('upload_date', '')
-            if date and len(date) == 8 and '-' not in date:
-                date = f"{date[:4]}-{date[4:6]}-{date[6:8]}"
-            
-            selected_word = video.get('selected_word', 'No words found')
-            
-            self.tree.insert('', 'end', text=f"{video['title']} - {video.get('channel_name', '')}", 
-                        values=(selected_word, dur_str, date))
+        # Words are already extracted for this corpus and position, only the filters changed
+        if self.table is not None and self.table['key'] == key:
+            self.apply_filters(filters)
+            return
+        
+        self.table = None
+        self.results.set_rows(0, self.video_row)
+        self.result_videos = []
+        
+        def work(cancel):
+            if exclude_duplicates:
+                yield ("progress", 0, "Finding duplicate transcripts")
+            video_data = self.collect_videos(current, exclude_duplicates)
+            for i, shard in enumerate(chunks(video_data, 250)):
+                for video in shard:
+                    if cancel.is_set():
+                        return None
+                    with span("words.extract", file=video['name']):
+                        video['selected_word'] = current.word_at(video, word_index, get_word_at_index)
+                    if video['selected_word']:
+                        video['word_index'] = word_index
+                yield ("partial", shard)
+                done = min((i + 1) * 250, len(video_data))
+                yield ("progress", done / len(video_data), f"Read {done}/{len(video_data)} transcripts")
+            # Each channel's cube keeps the words of every video it has seen, filters mask it later
+            yield ("progress", 1.0, "Updating trend cubes")
+            for handle, ch in current.channels.items():
+                update_position_cube(ch.dir, word_index, [v for v in video_data if v['channel_handle'] == handle],
+                                     ch.version)
+            return video_data
+        
+        arrival_order = []
+        
+        def partial(videos):
+            # Rows are shown in arrival order while streaming; done() sorts once
+            start = len(self.result_videos)
+            self.result_videos.extend(self.filter_videos(videos, filters))
+            arrival_order.extend(range(start, len(self.result_videos)))
+            self.results.set_order(arrival_order)
+        
+        def done(video_data):
+            self.table = {
+                'key': key,
+                'videos': video_data,
+                'word_index': word_index,
+                'position_label': position_label
+            }
+            self.apply_filters(filters)
+        
+        self.start_job(work, done, on_partial=partial)
+
+    def apply_filters(self, filters):
+        """Filter, sort and count over the extracted table, no transcripts are read here"""
+        table = self.table
+        video_data = self.filter_videos(table['videos'], filters)
+        self.result_videos = video_data
+        self.results.set_rows(len(video_data), self.video_row, self.sort_order(video_data))
         
         filtered_word_counts = defaultdict(int)
         for video in video_data:
             if video.get('selected_word'):
                 filtered_word_counts[video['selected_word']] += 1
         
+        position_label = table['position_label']
         self.current_stats = {
             'word_counts': dict(filtered_word_counts),
+            'ranking': wordranking(dict(filtered_word_counts)),
             'total_videos': len(video_data),
             'videos_with_words': len([v for v in video_data if v.get('selected_word')]),
-            'word_index': word_index,
-            'position_label': position_label
+            'word_index': table['word_index'],
+            'position_label': position_label,
+            'trend_rows': video_data,
+            'trend_cube': f"position_{table['word_index']}",
+            'date_range': (filters['date_from'], filters['date_to']),
+            'channel_word_counts': group_counts(video_data)
         }
         
         total_videos = len(video_data)
-        videos_with_words = len([v for v in video_data if v.get('selected_word')])
-        self.status_var.set(f"Analyzed {total_videos} videos, {videos_with_words} have {position_label} words")
-
-    def get_word_at_index(self, txt_file, index):
+        videos_with_words = self.current_stats['videos_with_words']
+        self.finish_job(f"Analyzed {total_videos} videos, {videos_with_words} have {position_label} words")
+
+    def schedule_filters(self, event=None):
+        """Re-filter shortly after the user stops typing"""
+        if self.filter_after is not None:
+            self.after_cancel(self.filter_after)
+        self.filter_after = self.after(FILTER_DELAY_MS, self.refilter)
+
+    def refilter(self):
+        self.filter_after = None
+        if self.table is None or (self.job is not None and self.job.running):
+            return
+        if 'count_unit' in self.current_stats:
+            return  # showing n-gram results, those are re-run explicitly
+        if (filters := self.read_filters(quiet=True)) is not None:
+            self.apply_filters(filters)
+
+    def collect_videos(self, current=None, exclude_duplicates=False):
+        """Video rows for the corpus; with exclude_duplicates, exact and near duplicate
+        transcripts (across all loaded channels) are cut down to their earliest upload"""
+        current = current or self.corpus
+        videos = current.videos()
+        if not exclude_duplicates:
+            return videos
+        from dedupe import update_fingerprints, find_duplicates, redundant_files
+        indexes = [update_fingerprints(ch.dir, ch.txt_files) for ch in current.channels.values()]
+        redundant = redundant_files(find_duplicates(indexes), videos)
+        return [v for v in videos if v['txt_file'] not in redundant]
+
+    def run_ngram_analysis(self):
+        if not hasattr(self, 'txt_files') or not self.txt_files:
+            messagebox.showerror("Error", "Please convert VTT files first")
+            return
+        
+        word_index = self.get_word_index()
+        if word_index is None:
+            return
+        if (filters := self.read_filters()) is None:
+            return
         try:
-            with open(txt_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    words = content.split()
-                    if words:
-                        try:
-                            word = words[index]
-                            # Cleans the word of punctuation
-                            clean_word = re.sub(r'[^\w\']', '', word).lower()
-                            return clean_word if clean_word else None
-                        except IndexError:
-                            return None
-            return None
-        except Exception:
-            return None
-    
+            n = int(self.ngram_size.get().strip() or 2)
+            window = int(self.ngram_window.get().strip() or 5)
+            scope = self.ngram_scope.get()
+            from ngrams import ngramcounter
+            counter = ngramcounter(n, scope, start=word_index, window=window,
+                                   approximate=self.ngram_approximate.get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid n-gram settings: {str(e)}")
+            return
+        current = self.corpus
+        exclude_duplicates = self.exclude_duplicates.get()
+        
+        def work(cancel):
+            video_data = self.filter_videos(self.collect_videos(current, exclude_duplicates), filters,
+                                            use_word_filter=False)
+            for i, video in enumerate(video_data, 1):
+                if cancel.is_set():
+                    return None
+                counter.add_file(video['txt_file'])
+                if i % 100 == 0:
+                    yield ("progress", i / len(video_data), f"Counted {i}/{len(video_data)} transcripts")
+            return video_data, counter.top(5000)
+        
+        def done(result):
+            video_data, top = result
+            scope_label = f"{self.get_word_position_label(word_index)} position" if scope == "window" else "full transcript"
+            position_label = f"{n}-gram"
+            self.current_stats = {
+                'word_counts': dict(top),
+                'ranking': wordranking(dict(top)),
+                'total_videos': len(video_data),
+                'videos_with_words': counter.documents,
+                'word_index': word_index if scope == "window" else None,
+                'scope_label': scope_label,
+                'position_label': position_label,
+                'count_unit': 'time',
+                'count_total': counter.total
+            }
+            status = (f"Counted {counter.total} {position_label}s ({counter.distinct()} distinct) "
+                      f"in {counter.documents} of {len(video_data)} videos, {scope_label}")
+            if counter.sketch is not None:
+                bounds = counter.sketch.error_bounds()
+                status += (f". Approximate: counts may be up to {bounds['undercount']} low and "
+                           f"{bounds['overcount']:.0f} high ({bounds['confidence']:.0%} confidence)")
+            self.finish_job(status)
+        
+        self.start_job(work, done)
+
+    def run_tfidf_analysis(self):
+        """TF-IDF over the whole corpus, scored for the filtered videos: the group's most distinctive
+        words go to the stats and charts, each video's own top words to the results tree"""
+        if not hasattr(self, 'txt_files') or not self.txt_files:
+            messagebox.showerror("Error", "Please convert VTT files first")
+            return
+        if (filters := self.read_filters()) is None:
+            return
+        current = self.corpus
+        exclude_duplicates = self.exclude_duplicates.get()
+        
+        def work(cancel):
+            from concordance import update_index
+            from tfidf import termmatrix, distinctive_terms
+            indexes = []
+            for i, ch in enumerate(current.channels.values()):
+                if cancel.is_set():
+                    return None
+                yield ("progress", i / (len(current.channels) + 1), f"{ch.handle}: updating word index")
+                indexes.append(update_index(ch.dir, ch.txt_files))
+            yield ("progress", len(indexes) / (len(indexes) + 1), "Weighting terms")
+            matrix = termmatrix.from_indexes(indexes)
+            video_data = self.filter_videos(self.collect_videos(current, exclude_duplicates), filters,
+                                            use_word_filter=False)
+            return video_data, matrix.shape, distinctive_terms(matrix, video_data)
+        
+        def done(result):
+            video_data, shape, terms = result
+            for video in video_data:
+                video['selected_word'] = ", ".join(terms['video_terms'].get(video['txt_file'], []))
+            self.tree.heading('details', text='Distinctive Words')
+            self.result_videos = video_data
+            self.results.set_rows(len(video_data), self.video_row, self.sort_order(video_data))
+            
+            word_counts = terms['word_counts']
+            self.current_stats = {
+                'word_counts': word_counts,
+                'ranking': wordranking(word_counts),
+                'total_videos': len(video_data),
+                'videos_with_words': sum(1 for v in video_data if v['selected_word']),
+                'word_index': None,
+                'scope_label': "full transcript",
+                'position_label': "distinctive",
+                'count_unit': 'point',
+                'count_total': sum(word_counts.values()),
+                'trend_rows': video_data,
+                'trend_cube': "terms",
+                'date_range': (filters['date_from'], filters['date_to']),
+                'channel_word_counts': terms['channel_word_counts']
+            }
+            self.finish_job(f"TF-IDF over {shape[0]} transcripts and {shape[1]} terms, "
+                            f"scored for {len(video_data)} filtered videos (points = weight x 1000)")
+        
+        self.start_job(work, done)
+
     def show_full_stats(self):                
         if not hasattr(self, 'current_stats'): 
             messagebox.showinfo("Info", "Please run analysis first")
@@ -457,12 +760,17 @@ class firstana(tk.Toplevel):
 
         stats = self.current_stats
         position_label = stats['position_label']
+        ranking = stats.setdefault('ranking', wordranking(stats['word_counts']))
         
         text.insert(tk.END, f"=== {position_label.upper()} WORDS STATISTICS ===\n\n", "title")
         text.insert(tk.END, f"Total videos analyzed: {stats['total_videos']}\n")
         text.insert(tk.END, f"Videos with {position_label} words: {stats['videos_with_words']}\n")
         text.insert(tk.END, f"Unique {position_label} words: {len(stats['word_counts'])}\n")
-        text.insert(tk.END, f"Word position index: {stats['word_index']}\n\n")
+        if stats['word_index'] is not None:
+            text.insert(tk.END, f"Word position index: {stats['word_index']}\n")
+        if scope_label := stats.get('scope_label'):
+            text.insert(tk.END, f"Scope: {scope_label}\n")
+        text.insert(tk.END, "\n")
         
         text.tag_config("title", font=('Arial', 14, 'bold'))
         text.config(state="disabled")
@@ -478,9 +786,10 @@ class firstana(tk.Toplevel):
         scrollbar.config(command=word_text.yview)
 
         if stats['word_counts']:
-            sorted_words = sorted(stats['word_counts'].items(), key=lambda x: (-x[1], x[0]))[:5000]
+            sorted_words = ranking.top(5000)
             
-            total_videos = stats['videos_with_words']
+            total_videos = stats.get('count_total', stats['videos_with_words'])
+            unit = stats.get('count_unit', 'video')
             
             word_text.insert(tk.END, f"TOP {position_label.upper()} WORDS (MAX 5000):\n\n", "header")
             word_text.tag_config("header", font=('Arial', 12, 'bold'))
@@ -488,11 +797,17 @@ class firstana(tk.Toplevel):
             for i, (word, count) in enumerate(sorted_words, 1):
                 pct = (count / total_videos * 100) if total_videos > 0 else 0
                 if count == 1:
-                    word_text.insert(tk.END, f"{i:4}. {word:<20} {count:>6} video ({pct:.1f}%)\n")
+                    word_text.insert(tk.END, f"{i:4}. {word:<20} {count:>6} {unit} ({pct:.1f}%)\n")
                 else:
-                    word_text.insert(tk.END, f"{i:4}. {word:<20} {count:>6} videos ({pct:.1f}%)\n")
+                    word_text.insert(tk.END, f"{i:4}. {word:<20} {count:>6} {unit}s ({pct:.1f}%)\n")
             
-            self.top_words = [word for word, _ in sorted_words]
+            if len(channel_counts := stats.get('channel_word_counts', {})) > 1:
+                word_text.insert(tk.END, f"\nTOP {position_label.upper()} WORDS BY CHANNEL:\n", "header")
+                for handle, counts in sorted(channel_counts.items()):
+                    channel_total = sum(counts.values())
+                    word_text.insert(tk.END, f"\n{handle} ({channel_total} {unit}s)\n")
+                    for i, (word, count) in enumerate(wordranking(counts).top(10), 1):
+                        word_text.insert(tk.END, f"{i:4}. {word:<20} {count:>6} ({count / channel_total * 100:.1f}%)\n")
 
         graph_frame = ttk.Frame(main_frame)
         graph_frame.pack(fill="x", pady=(10, 0))
@@ -505,27 +820,10 @@ class firstana(tk.Toplevel):
                 messagebox.showinfo("Info", f"No {position_label} word data to graph")
                 return
 
-            channel_name = ""
-            if self.video_metadata:
-                channel_name = self.video_metadata[0].get('channel_name', '')
-            
-            top_50 = sorted(stats['word_counts'].items(), key=lambda x: (-x[1], x[0]))[:50]
-            words, counts = zip(*top_50)
-            
-            plt.figure(figsize=(14, 8))
-            bars = plt.bar(range(len(words)), counts, color='#dabdab', alpha=0.8)
-            
-            plt.title(f'Top 50 Most Common {position_label.capitalize()} Words - {channel_name}', fontsize=16)
-            plt.xlabel(f'{position_label.capitalize()} Words', fontsize=12)
-            plt.ylabel('Number of Videos', fontsize=12)
-            plt.xticks(range(len(words)), words, rotation=45, ha='right')
-            plt.grid(axis='y', alpha=0.3)
-            
-            for i, (bar, count) in enumerate(zip(bars, counts)):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.1, 
-                        str(count), ha='center', va='bottom')
-            
-            plt.tight_layout()
+            import matplotlib.pyplot as plt
+            from render import draw_bar
+            fig = plt.figure(figsize=(14, 8))
+            draw_bar(fig, ranking, position_label, self.corpus.title(), stats.get('count_unit', 'video'))
             plt.show()
 
         def show_pie_chart():
@@ -533,28 +831,10 @@ class firstana(tk.Toplevel):
                 messagebox.showinfo("Info", f"No {position_label} word data to graph")
                 return
 
-            channel_name = ""
-            if self.video_metadata:
-                channel_name = self.video_metadata[0].get('channel_name', '')
-            
-            top_15 = sorted(stats['word_counts'].items(), key=lambda x: (-x[1], x[0]))[:25]
-            words, counts = zip(*top_15)
-            
-            plt.figure(figsize=(12, 8))
-            
-            def format_label(pct, counts):
-                total = sum(counts)
-                count = int(round(pct/100.*total))
-                return f'{count}'
-            
-            wedges, texts, autotexts = plt.pie(counts, labels=words, autopct=lambda pct: format_label(pct, counts),
-                                            startangle=90, textprops={'fontsize': 10})
-            
-            plt.title(f'Top 25 Most Common {position_label.capitalize()} Words - {channel_name}', fontsize=16)
-            
-            plt.axis('equal')
-            
-            plt.tight_layout()
+            import matplotlib.pyplot as plt
+            from render import draw_pie
+            fig = plt.figure(figsize=(12, 8))
+            draw_pie(fig, ranking, position_label, self.corpus.title())
             plt.show()
 
         def show_treemap():
@@ -565,79 +845,86 @@ class firstana(tk.Toplevel):
                 messagebox.showinfo("Info", f"No {position_label} word data to graph")
                 return
             
-            channel_name = self.video_metadata[0].get('channel_name', '') if self.video_metadata else ""
-            top_words = sorted(stats['word_counts'].items(), key=lambda x: (-x[1], x[0]))
-            words, counts = zip(*top_words)
-            
-            fig, ax = plt.subplots(figsize=(20, 15), facecolor='#2e2e2e', dpi=150)
-            ax.set_facecolor('#2e2e2e')
-            
-            squarify.plot(
-                sizes=counts,
-                color=plt.cm.plasma(np.linspace(0.1, 0.9, len(words))),
-                alpha=0.9,
-                edgecolor='#1a1a1a',
-                linewidth=1.5,
-                ax=ax
-            )
-            
-            max_count = max(counts)
-            min_count = min(counts)
-            
-            # Use logarithmic scaling for scaling text
-            log_counts = np.log10(counts)
-            max_log = np.max(log_counts)
-            min_log = np.min(log_counts)
+            import matplotlib.pyplot as plt
+            from render import draw_treemap
+            fig = plt.figure(figsize=(20, 15), dpi=150)
+            draw_treemap(fig, ranking, position_label, self.corpus.title())
             
-            for i, (word, count) in enumerate(top_words):
-                rect = ax.patches[i]
-                x = rect.get_x() + rect.get_width() / 2
-                y = rect.get_y() + rect.get_height() / 2
-                
-                rect_area = rect.get_width() * rect.get_height()
-                max_width_based_size = rect.get_width() * 0.5   
-                max_height_based_size = rect.get_height() * 0.2  
-                
-                if max_log > min_log:
-                    log_factor = (np.log10(count) - min_log) / (max_log - min_log)
-                else:
-                    log_factor = 1
-                
-                power_factor = log_factor ** 0.6                 
-                min_font_size = 2   
-                max_font_size = 35  
-                size_range = max_font_size - min_font_size
-                calculated_size = min_font_size + (size_range * power_factor)
-                
-                rect_constraint = min(max_width_based_size, max_height_based_size) * 8  
-                font_size = min(calculated_size, rect_constraint)
+            plt.show()
 
-                font_size = max(font_size, 2)  
-                
-                vertical_spacing = max(0.15, font_size * 0.008)  
+        def show_trends():
+            if not stats['word_counts'] or 'trend_cube' not in stats:
+                messagebox.showinfo("Info", f"No dated {position_label} word data to graph")
+                return
+            current = self.corpus
+            name = stats['trend_cube']
+
+            def work(cancel):
+                # The saved per-channel cubes are masked down to the filtered rows. The term cube keeps
+                # no per-video rows, the positional index gives the counts of the videos masked out
+                yield ("progress", 0, "Loading trend cubes")
+                if name == "terms":
+                    from concordance import update_index
+                    cubes, lookups = {}, {}
+                    for handle, ch in current.channels.items():
+                        cubes[handle] = update_term_cube(ch.dir, ch.videos(), ch.version)
+                        index = update_index(ch.dir, ch.txt_files)
+                        rows = {extract_video_id(plain_name(n)): i for i, n in enumerate(index.names)}
+                        lookups[handle] = lambda video_id, index=index, rows=rows: \
+                            index.term_counts(rows[video_id]) if video_id in rows else None
+                    return masked_trend(cubes, stats['trend_rows'], lookups.get)
+                cubes = {handle: trendcube.load(cube_path(ch.dir, name), ch.version, keep_rows=True)
+                         for handle, ch in current.channels.items()}
+                return masked_trend(cubes, stats['trend_rows'])
+
+            def done(cube):
+                if not cube.video_months:
+                    messagebox.showinfo("Info", f"No dated {position_label} word data to graph")
+                    return
+                date_from, date_to = stats.get('date_range', ('', ''))
+                import matplotlib.pyplot as plt
+                plt.figure(figsize=(14, 8))
+                for word in ranking.words(10):
+                    series = cube.trend(word, date_from, date_to)
+                    plt.plot(range(len(series)), [count for _, count in series],
+                             label=f"{word} ({cube.total(word, date_from, date_to)})", linewidth=1.5)
+
+                labels = [label for label, _ in cube.videos_per_month(date_from, date_to)]
+                step = max(1, len(labels) // 24)
+                plt.xticks(range(0, len(labels), step), labels[::step], rotation=45, ha='right')
+                plt.title(f'Monthly Top 10 {position_label.capitalize()} Words - {current.title()}', fontsize=16)
+                plt.ylabel('Number of Mentions' if name == "terms" else 'Number of Videos', fontsize=12)
+                plt.grid(alpha=0.3)
+                plt.legend()
+                plt.tight_layout()
+                plt.show()
 
-                ax.text(x, y - rect.get_height() * vertical_spacing, word,
-                        ha='center', va='center',
-                        fontsize=font_size, fontweight='bold',
-                        color='#f0f0f0', fontfamily='sans-serif')
-                
-                count_font_size = max(3, font_size * 0.55)
-                ax.text(x, y + rect.get_height() * vertical_spacing, f"({count})",
-                        ha='center', va='center',
-                        fontsize=count_font_size, fontweight='bold',
-                        color='#e0e0e0', alpha=1.0)
+            backgroundjob(popup, work, on_done=done,
+                          on_error=lambda e: messagebox.showerror("Error", f"Failed to build trends: {str(e)}")).start()
+
+        def export_charts():
+            if not stats['word_counts']:
+                messagebox.showinfo("Info", f"No {position_label} word data to export")
+                return
             
-            ax.set_title(f'Top {len(top_words)} {position_label.capitalize()} Words - {channel_name}',
-                        fontsize=26, fontweight='bold', pad=25, color='white')
-            ax.axis('off')
-            plt.tight_layout()
+            def work(cancel):
+                yield ("progress", 0, "Rendering charts")
+                from render import render_all
+                return render_all(ranking, position_label, self.corpus.title(), name="_".join(self.corpus.handles),
+                                  count_unit=stats.get('count_unit', 'video'))
             
-            plt.show()
+            def done(results):
+                written = sum(rendered for _, rendered in results.values())
+                messagebox.showinfo("Export Charts", f"{written} charts written, {len(results) - written} already up to date in:\n"
+                                    f"{os.path.dirname(next(iter(results.values()))[0]) if results else 'data/output'}")
+            
+            backgroundjob(popup, work, on_done=done,
+                          on_error=lambda e: messagebox.showerror("Error", f"Failed to export charts: {str(e)}")).start()
 
         def copy_words():
-            if hasattr(self, 'top_words'):
+            if stats['word_counts']:
                 self.clipboard_clear()
-                self.clipboard_append("\n".join(self.top_words))
+                self.clipboard_append("\n".join(ranking.words(5000)))
                 
         def generate_word_cloud():
             if not WORDCLOUD_AVAILABLE:
@@ -648,47 +935,36 @@ class firstana(tk.Toplevel):
                 messagebox.showinfo("Info", f"No {position_label} word data to generate word cloud")
                 return
             
+            import matplotlib.pyplot as plt
+            from render import draw_wordcloud, wordcloud_image, cached_wordcloud
+            counts = ranking.counts
             try:
-                root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                mask_path = os.path.join(root, "data", "pg.png")
-                
-                mask = None
-                if os.path.exists(mask_path):
-                    try:
-                        mask = np.array(Image.open(mask_path))
-                    except Exception:
-                        pass  
-
-                font_file_path = os.path.join(root, "data", "Ubuntu-Title.ttf")
-                
-                wordcloud = WordCloud(
-                    font_path = font_file_path,
-                    max_font_size=400,
-                    relative_scaling=0.4,
-                    width=1600, height=1200, 
-                    background_color='white', 
-                    max_words=500,
-                    colormap='tab10_r', 
-                    normalize_plurals=False, 
-                    mask=mask
-                ).generate_from_frequencies(stats['word_counts'])
-                
-                plt.figure(figsize=(12, 8))
-                plt.imshow(wordcloud, interpolation='bilinear')
-                plt.axis("off")
-                
-                channel_name = ""
-                if self.video_metadata:
-                    channel_name = self.video_metadata[0].get('channel_name', '')
-                
-                plt.title(f"Word Cloud of {position_label.capitalize()} words - {channel_name}")
-                plt.show()
-                
+                full = cached_wordcloud(counts)
+                fig = plt.figure(figsize=(12, 8))
+                draw_wordcloud(fig, ranking, position_label, self.corpus.title(),
+                               image=full if full is not None else wordcloud_image(counts, preview=True))
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to generate word cloud: {str(e)}")
+                return
+
+            if full is None:
+                # The preview stays up while the full size cloud renders
+                def work(cancel):
+                    yield ("progress", 0, "Rendering word cloud")
+                    return wordcloud_image(counts)
+
+                def done(image):
+                    if plt.fignum_exists(fig.number):
+                        fig.axes[0].images[0].set_data(image)
+                        fig.canvas.draw_idle()
+
+                backgroundjob(popup, work, on_done=done,
+                              on_error=lambda e: messagebox.showerror("Error", f"Failed to generate word cloud: {str(e)}")).start()
+            plt.show()
 
         ttk.Button(btn_frame, text="Show Bar Graph", command=show_bar_graph).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Show Pie Chart", command=show_pie_chart).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Show Trends", command=show_trends).pack(side="left", padx=5)
         
         if SQUARIFY_AVAILABLE:
             ttk.Button(btn_frame, text="Show Treemap", command=show_treemap).pack(side="left", padx=5)
@@ -707,6 +983,7 @@ class firstana(tk.Toplevel):
                                                        "To use word clouds, install with: pip install wordcloud")).pack(side="left", padx=5)
         
         ttk.Button(btn_frame, text="Close", command=popup.destroy).pack(side="right", padx=5)
+        ttk.Button(btn_frame, text="Export Charts", command=export_charts).pack(side="right", padx=5)
 
         word_text.config(state="disabled")
 
@@ -0,0 +1,136 @@
+import os
+from datetime import datetime
+import numpy as np
+
+# One fixed-size record per (video, refresh); the file is only ever appended to
+RECORD = np.dtype([('id', 'S11'), ('time', '<i8'), ('views', '<i8'), ('likes', '<i8'), ('comments', '<i8')])
+COUNTS = ('views', 'likes', 'comments')
+METADATA_FIELDS = {'views': 'view_count', 'likes': 'like_count', 'comments': 'comment_count'}
+DAY = 86400
+
+
+def to_epoch(timestamp):
+    """ISO timestamp from metadata.json -> unix seconds, None if missing or unparsable"""
+    try:
+        when = datetime.fromisoformat((timestamp or '').replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return None
+    return int(when.timestamp())
+
+def history_path(channel_dir):
+    return os.path.join(channel_dir, "history", "stats.bin")
+
+
+class statshistory:
+    """Append-only view/like/comment snapshots for one channel folder, read back as a typed array.
+    Queries sort once by (id, time) and answer per-video and per-channel growth from group boundaries"""
+
+    def __init__(self, channel_dir):
+        self.path = history_path(channel_dir)
+        self._size = -1
+        self._records = np.zeros(0, dtype=RECORD)
+        self._sorted = None
+
+    def records(self):
+        """Every snapshot in append order; a torn record at the end (interrupted write) is ignored"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size != self._size:
+            count = size // RECORD.itemsize
+            self._records = np.fromfile(self.path, dtype=RECORD, count=count) if count else np.zeros(0, dtype=RECORD)
+            self._size = size
+            self._sorted = None
+        return self._records
+
+    def __len__(self):
+        return len(self.records())
+
+    def video_ids(self):
+        return {i.decode('ascii') for i in np.unique(self.records()['id'])}
+
+    def append(self, entries, timestamp=None):
+        """Add one snapshot per metadata entry (uses each entry's own 'timestamp' unless given).
+        Returns how many records were written"""
+        rows = []
+        for entry in entries:
+            when = timestamp if timestamp is not None else to_epoch(entry.get('timestamp'))
+            if not entry.get('id') or when is None:
+                continue
+            rows.append((entry['id'].encode('ascii', 'replace')[:11], when,
+                         *(int(entry.get(METADATA_FIELDS[c]) or 0) for c in COUNTS)))
+        if not rows:
+            return 0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Drop a torn tail first so new records stay aligned
+        if os.path.exists(self.path) and (extra := os.path.getsize(self.path) % RECORD.itemsize):
+            with open(self.path, 'r+b') as f:
+                f.truncate(os.path.getsize(self.path) - extra)
+        with open(self.path, 'ab') as f:
+            np.array(rows, dtype=RECORD).tofile(f)
+        return len(rows)
+
+    def seed(self, metadata):
+        """Record the current counts of videos that have no history yet, e.g. before a refresh"""
+        known = self.video_ids()
+        return self.append(entry for entry in metadata if entry.get('id') and entry['id'] not in known)
+
+    def _ordered(self):
+        """Records sorted by id then time, so each video is one contiguous run"""
+        records = self.records()
+        if self._sorted is None:
+            self._sorted = records[np.lexsort((records['time'], records['id']))]
+        return self._sorted
+
+    def video(self, video_id):
+        """Snapshots of one video, oldest first"""
+        ordered = self._ordered()
+        key = np.array(video_id.encode('ascii', 'replace')[:11], dtype='S11')
+        lo, hi = np.searchsorted(ordered['id'], key, 'left'), np.searchsorted(ordered['id'], key, 'right')
+        return ordered[lo:hi]
+
+    def growth(self, since=None, until=None, records=None):
+        """Per-video change between the first and last snapshot inside [since, until] (unix seconds).
+        Returns a structured array with id, first/last time, the deltas and per-day rates"""
+        ordered = self._ordered() if records is None else records
+        mask = np.ones(len(ordered), dtype=bool)
+        if since is not None:
+            mask &= ordered['time'] >= since
+        if until is not None:
+            mask &= ordered['time'] <= until
+        window = ordered[mask]
+
+        fields = [('id', 'S11'), ('first', '<i8'), ('last', '<i8'), ('snapshots', '<i8')]
+        fields += [(c, '<i8') for c in COUNTS] + [(f"{c}_per_day", '<f8') for c in COUNTS]
+        if not len(window):
+            return np.zeros(0, dtype=fields)
+
+        starts = np.flatnonzero(np.r_[True, window['id'][1:] != window['id'][:-1]])
+        ends = np.r_[starts[1:], len(window)] - 1
+        result = np.zeros(len(starts), dtype=fields)
+        result['id'] = window['id'][starts]
+        result['first'], result['last'] = window['time'][starts], window['time'][ends]
+        result['snapshots'] = ends - starts + 1
+        days = np.maximum(result['last'] - result['first'], 1) / DAY
+        for c in COUNTS:
+            result[c] = window[c][ends] - window[c][starts]
+            result[f"{c}_per_day"] = np.where(result['snapshots'] > 1, result[c] / days, 0.0)
+        return result
+
+    def video_growth(self, video_id, since=None, until=None):
+        """Growth row for one video, None if it has no snapshots in the range"""
+        rows = self.growth(since, until, records=self.video(video_id))
+        return rows[0] if len(rows) else None
+
+    def channel_growth(self, since=None, until=None):
+        """Summed deltas and per-day rates over all videos in the range"""
+        rows = self.growth(since, until)
+        totals = {'videos': len(rows), 'tracked': int((rows['snapshots'] > 1).sum()) if len(rows) else 0}
+        for c in COUNTS:
+            totals[c] = int(rows[c].sum()) if len(rows) else 0
+            totals[f"{c}_per_day"] = float(rows[f"{c}_per_day"].sum()) if len(rows) else 0.0
+        return totals
+
+    def top_growing(self, k=10, by='views_per_day', since=None, until=None):
+        rows = self.growth(since, until)
+        order = np.argsort(rows[by], kind='stable')[::-1][:k]
+        return [(rows['id'][i].decode('ascii'), float(rows[by][i])) for i in order]
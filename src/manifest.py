@@ -0,0 +1,207 @@
+import os, json, hashlib
+from downloadqueue import write_atomic
+from searchhelper import extract_video_id
+from storage import has_ext, plain_name, txt_name_for
+from profiling import span
+
+MANIFEST_NAME = "manifest.json"
+ROW_FIELDS = ('title', 'upload_date', 'duration', 'channel_name', 'url')
+
+
+def manifest_path(channel_dir):
+    return os.path.join(channel_dir, MANIFEST_NAME)
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _file_info(path, entry, prefix):
+    """size/mtime/hash of one file, reusing the stored hash when size and mtime are unchanged"""
+    stat = os.stat(path)
+    info = {f'{prefix}': os.path.basename(path), f'{prefix}_size': stat.st_size, f'{prefix}_mtime': stat.st_mtime_ns}
+    old = entry or {}
+    if old.get(prefix) == info[prefix] and old.get(f'{prefix}_size') == stat.st_size and \
+       old.get(f'{prefix}_mtime') == stat.st_mtime_ns and old.get(f'{prefix}_hash'):
+        info[f'{prefix}_hash'] = old[f'{prefix}_hash']
+    else:
+        info[f'{prefix}_hash'] = file_hash(path)
+    return info
+
+def conversion_settings(stopwords=None, no_punctuation=False):
+    """Short key for the options a TXT was converted with, stored on each converted entry"""
+    h = hashlib.blake2b(json.dumps([sorted(stopwords or ()), bool(no_punctuation)]).encode('utf-8'), digest_size=8)
+    return h.hexdigest()
+
+def needs_conversion(entry, settings):
+    """True when a video has a VTT and its TXT is missing, older than the VTT or made with other settings"""
+    state = conversion_state(entry)
+    return state in ('pending', 'stale') or (state == 'converted' and entry.get('settings') != settings)
+
+def conversion_state(entry):
+    """'missing' (no VTT), 'pending' (no TXT yet), 'stale' (TXT older than VTT) or 'converted'"""
+    if not entry.get('vtt'):
+        return 'missing'
+    if not entry.get('txt'):
+        return 'pending'
+    return 'stale' if entry['txt_mtime'] < entry['vtt_mtime'] else 'converted'
+
+
+class manifest:
+    """One channel folder at a glance: every video's id, metadata row fields, VTT/TXT names,
+    sizes, mtimes, content hashes and conversion state, plus a version that goes up on every change.
+
+    The version is the invalidation key for anything cached per channel"""
+
+    def __init__(self, channel_dir, data=None):
+        self.dir = channel_dir
+        data = data or {}
+        self.version = data.get('version', 0)
+        self.stamps = data.get('stamps', {})
+        self.videos = data.get('videos', {})
+
+    @classmethod
+    def load(cls, channel_dir):
+        try:
+            with open(manifest_path(channel_dir), 'r', encoding='utf-8') as f:
+                return cls(channel_dir, json.load(f))
+        except (OSError, ValueError):
+            return cls(channel_dir)
+
+    def save(self):
+        write_atomic(manifest_path(self.dir), json.dumps(
+            {'version': self.version, 'stamps': self.stamps, 'videos': self.videos}, ensure_ascii=False))
+
+    def current_stamps(self):
+        """mtimes of metadata.json and the two folders: files added, removed or re-listed change these"""
+        return {name: _mtime(os.path.join(self.dir, name)) for name in ("metadata.json", "vtt_files", "txt_files")}
+
+    def is_current(self):
+        return bool(self.stamps) and self.stamps == self.current_stamps()
+
+    def refresh(self, force=False):
+        """Rescan the folder if anything moved (or always with force). Only files whose size or
+        mtime changed are hashed again. Returns True if the manifest changed (and was saved)"""
+        stamps = self.current_stamps()
+        if not force and self.stamps == stamps:
+            return False
+
+        videos = {}
+        if stamps['metadata.json'] != self.stamps.get('metadata.json') or force:
+            try:
+                with open(os.path.join(self.dir, "metadata.json"), 'r', encoding='utf-8') as f:
+                    for item in json.load(f):
+                        if item.get('id'):
+                            videos[item['id']] = {field: item.get(field) for field in ROW_FIELDS}
+            except (OSError, ValueError):
+                pass
+        else:
+            videos = {vid: {field: e.get(field) for field in ROW_FIELDS}
+                      for vid, e in self.videos.items() if e.get('in_metadata')}
+        for entry in videos.values():
+            entry['in_metadata'] = True
+
+        txt_dir = os.path.join(self.dir, "txt_files")
+        txt_names = {}
+        if os.path.isdir(txt_dir):
+            with os.scandir(txt_dir) as entries:
+                txt_names = {plain_name(e.name): e.path for e in entries if has_ext(e.name, '.txt')}
+
+        vtt_dir = os.path.join(self.dir, "vtt_files")
+        if os.path.isdir(vtt_dir):
+            with os.scandir(vtt_dir) as entries:
+                for e in sorted(entries, key=lambda e: e.name):
+                    if not has_ext(e.name, '.vtt') or not (video_id := extract_video_id(plain_name(e.name))):
+                        continue
+                    old = self.videos.get(video_id)
+                    entry = videos.setdefault(video_id, {field: None for field in ROW_FIELDS})
+                    entry.update(_file_info(e.path, old, 'vtt'))
+                    if txt := txt_names.get(plain_name(txt_name_for(e.name))):
+                        entry.update(_file_info(txt, old, 'txt'))
+                        if old and old.get('settings') and old.get('txt_hash') == entry['txt_hash']:
+                            entry['settings'] = old['settings']
+
+        for entry in videos.values():
+            entry['state'] = conversion_state(entry)
+
+        changed = videos != self.videos
+        self.stamps = stamps
+        if changed:
+            self.videos = videos
+            self.version += 1
+        self.save()
+        return changed
+
+    def record(self, vtt_path, txt_path=None, settings=None):
+        """Update one video after the downloader or converter wrote its files"""
+        video_id = extract_video_id(plain_name(os.path.basename(vtt_path)))
+        if not video_id:
+            return
+        entry = self.videos.setdefault(video_id, {field: None for field in ROW_FIELDS})
+        before = dict(entry)
+        entry.update(_file_info(vtt_path, entry, 'vtt'))
+        if txt_path:
+            entry.update(_file_info(txt_path, entry, 'txt'))
+            if settings:
+                entry['settings'] = settings
+            else:
+                entry.pop('settings', None)
+        entry['state'] = conversion_state(entry)
+        if entry != before:
+            self.version += 1
+
+    def converted(self):
+        """(vtt path, txt path, entry) for videos that have a conversion, in VTT name order"""
+        rows = [(e['vtt'], vid, e) for vid, e in self.videos.items() if e.get('vtt') and e.get('txt')]
+        return [(os.path.join(self.dir, "vtt_files", vtt), os.path.join(self.dir, "txt_files", e['txt']), e)
+                for vtt, _, e in sorted(rows, key=lambda r: r[0])]
+
+    def counts(self):
+        states = {}
+        for entry in self.videos.values():
+            states[entry['state']] = states.get(entry['state'], 0) + 1
+        return states
+
+
+def update_manifest(channel_dir, force=False):
+    """Load a channel's manifest and bring it up to date with the folder"""
+    with span("manifest.refresh", channel=os.path.basename(channel_dir)):
+        m = manifest.load(channel_dir)
+        m.refresh(force)
+    return m
+
+def record_conversions(channel_dir, pairs, settings=None):
+    """Mark (vtt path, txt path) pairs as converted (with the conversion_settings() key used)
+    and refresh anything else that moved"""
+    m = manifest.load(channel_dir)
+    m.refresh()
+    version = m.version
+    for vtt_path, txt_path in pairs:
+        m.record(vtt_path, txt_path, settings)
+    m.version = min(m.version, version + 1)  # one bump per conversion run
+    m.stamps = m.current_stamps()
+    m.save()
+    return m
+
+def content_keys(channel_dir, txt_files):
+    """One change key per txt path for the per-channel indexes: the manifest's content hash,
+    or the file's mtime when the manifest does not list it. None for files that are gone"""
+    hashes = {e['txt']: e.get('txt_hash') for e in manifest.load(channel_dir).videos.values() if e.get('txt')}
+    keys = []
+    for path in txt_files:
+        key = hashes.get(os.path.basename(path))
+        if not key:
+            try:
+                key = str(os.path.getmtime(path))
+            except OSError:
+                key = None
+        keys.append(key)
+    return keys
@@ -0,0 +1,210 @@
+import re
+import numpy as np
+from sketches import heavyhitters, stable_hash, combine_hashes
+from storage import open_text
+
+# Token ids are packed into one uint64 per n-gram, so each slot gets 63 // n bits
+KEY_BITS = 63
+FLUSH_SIZE = 4_000_000
+# Approximate mode splits its memory budget: pending n-grams between flushes, the token hash
+# cache, and the rest for the heavy hitter sketch. Nothing grows with the vocabulary
+PENDING_SHARE = 0.25
+CACHE_SHARE = 0.10
+PENDING_BYTES = 48      # per pending n-gram: hash, np.unique temporaries, label text and offset
+CACHE_ENTRY_BYTES = 160 # per cached token: dict slot, str and int objects
+
+
+def tokenize(text):
+    """Lowercase words with punctuation stripped, same cleaning as the position words"""
+    return re.sub(r"[^\w\s']", '', text.lower()).split()
+
+
+class idmap(dict):
+    """Vocabulary that hands out the next id to unseen words"""
+    def __init__(self):
+        super().__init__()
+        self.words = []
+
+    def __missing__(self, word):
+        self[word] = len(self.words)
+        self.words.append(word)
+        return self[word]
+
+
+class ngramcounter:
+    """Counts n-grams as packed integer keys, folding them into sorted unique arrays in chunks.
+    With approximate=True the counts go into a fixed-size heavy hitter sketch instead, keyed on
+    word content hashes so sketches from different channels can be merged. Tokens are hashed
+    straight into it (no vocabulary), so the whole counter stays within memory_mb"""
+
+    def __init__(self, n=2, scope="full", start=0, window=10, approximate=False, memory_mb=64):
+        if not 1 <= n <= 3:
+            raise ValueError("N-gram size must be 1, 2 or 3")
+        if scope not in ("full", "window"):
+            raise ValueError(f"Unknown n-gram scope: {scope}")
+        self.n = n
+        self.scope = scope
+        self.start = start
+        self.window = window
+        self.bits = KEY_BITS // n
+        self.vocab = idmap()
+        self.total = 0
+        self.documents = 0
+        self._pending = []
+        self._pending_size = 0
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._pending_hashes = []
+        self._token_hashes = {}
+        self.sketch = None
+        self.flush_size = FLUSH_SIZE
+        if approximate:
+            budget = memory_mb * 1024 * 1024
+            self.flush_size = max(10_000, int(budget * PENDING_SHARE) // PENDING_BYTES)
+            self.cache_size = max(1000, int(budget * CACHE_SHARE) // CACHE_ENTRY_BYTES)
+            self.sketch = heavyhitters(memory_mb * (1 - PENDING_SHARE - CACHE_SHARE))
+
+    def select(self, tokens):
+        if self.scope == "full":
+            return tokens
+        start = self.start if self.start >= 0 else max(len(tokens) + self.start, 0)
+        return tokens[start:start + self.window]
+
+    def add_tokens(self, tokens):
+        tokens = self.select(tokens)
+        if len(tokens) < self.n:
+            return
+        size = len(tokens) - self.n + 1
+        if self.sketch is not None:
+            self.add_hashed(tokens, size)
+        else:
+            ids = np.fromiter(map(self.vocab.__getitem__, tokens), dtype=np.uint64, count=len(tokens))
+            if len(self.vocab) >= 1 << self.bits:
+                raise ValueError(f"Vocabulary too large for {self.n}-gram keys")
+            keys = ids[:size].copy()
+            for j in range(1, self.n):
+                keys <<= np.uint64(self.bits)
+                keys |= ids[j:size + j]
+            self._pending.append(keys)
+
+        self._pending_size += size
+        self.total += size
+        self.documents += 1
+        if self._pending_size >= self.flush_size:
+            self.flush()
+
+    def token_hash(self, token):
+        """stable_hash through a capped cache, emptied when full rather than grown"""
+        h = self._token_hashes.get(token)
+        if h is None:
+            if len(self._token_hashes) >= self.cache_size:
+                self._token_hashes.clear()
+            h = self._token_hashes[token] = stable_hash(token)
+        return h
+
+    def add_hashed(self, tokens, size):
+        """Queue content keys for the sketch, plus the document's text and token offsets so the
+        n-grams that make it into the summary can be labelled"""
+        hashes = np.fromiter(map(self.token_hash, tokens), dtype=np.uint64, count=len(tokens))
+        self._pending_hashes.append(combine_hashes([hashes[j:size + j] for j in range(self.n)]))
+        lengths = np.fromiter(map(len, tokens), dtype=np.int32, count=len(tokens))
+        starts = np.zeros(len(tokens), dtype=np.int32)
+        np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        self._pending.append((' '.join(tokens), starts))
+
+    def add_text(self, text):
+        self.add_tokens(tokenize(text))
+
+    def add_file(self, txt_file):
+        try:
+            with open_text(txt_file) as f:
+                self.add_text(f.read())
+        except (OSError, EOFError):
+            pass
+
+    def flush(self):
+        if not self._pending:
+            return
+        if self.sketch is not None:
+            self.flush_sketch()
+            return
+        keys, counts = np.unique(np.concatenate(self._pending), return_counts=True)
+        self._pending, self._pending_size = [], 0
+        if len(self._keys):
+            keys, inverse = np.unique(np.concatenate([self._keys, keys]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([self._counts, counts])).astype(np.int64)
+        self._keys, self._counts = keys, counts
+
+    def flush_sketch(self):
+        keys, first, counts = np.unique(np.concatenate(self._pending_hashes), return_index=True, return_counts=True)
+        documents = self._pending
+        ends = np.cumsum([len(starts) - self.n + 1 for _, starts in documents])
+        self._pending, self._pending_hashes, self._pending_size = [], [], 0
+
+        def label_of(positions):
+            labels = []
+            for i in first[positions].tolist():
+                doc = int(np.searchsorted(ends, i, 'right'))
+                offset = i - (int(ends[doc - 1]) if doc else 0)
+                text, starts = documents[doc]
+                end = int(starts[offset + self.n]) - 1 if offset + self.n < len(starts) else len(text)
+                labels.append(text[starts[offset]:end])
+            return labels
+        self.sketch.add(keys, counts, label_of)
+
+    def nbytes(self):
+        """Rough size of the approximate counter: sketch, hash cache and pending chunk budget"""
+        if self.sketch is None:
+            return self._keys.nbytes + self._counts.nbytes + sum(k.nbytes for k in self._pending)
+        return self.sketch.nbytes() + self.cache_size * CACHE_ENTRY_BYTES + self.flush_size * PENDING_BYTES
+
+    def decoder(self):
+        """Function turning a packed key back into its words"""
+        words = self.vocab.words
+        mask = (1 << self.bits) - 1
+        shifts = [self.bits * (self.n - 1 - j) for j in range(self.n)]
+        return lambda key: ' '.join(words[(key >> s) & mask] for s in shifts)
+
+    def distinct(self):
+        self.flush()
+        if self.sketch is not None:
+            return len(self.sketch.summary.keys)
+        return len(self._keys)
+
+    def top(self, k=50):
+        """[(ngram, count)] ordered by count, then alphabetically"""
+        self.flush()
+        if self.sketch is not None:
+            return [(label, estimate) for label, estimate, _, _ in self.sketch.top(k)]
+        if not len(self._keys):
+            return []
+        k = min(k, len(self._keys))
+        idx = np.argpartition(-self._counts, k - 1)[:k]
+        # Pull in ties at the cut-off so the alphabetical tie-break is stable
+        cutoff = self._counts[idx].min()
+        idx = np.flatnonzero(self._counts >= cutoff)
+        decode = self.decoder()
+        ranked = [(decode(int(key)), int(count)) for key, count in zip(self._keys[idx], self._counts[idx])]
+        ranked.sort(key=lambda x: (-x[1], x[0]))
+        return ranked[:k]
+
+    def counts(self):
+        return dict(self.top(self.distinct()))
+
+    def merge(self, other):
+        """Fold in another approximate counter, e.g. one per channel"""
+        if self.sketch is None or other.sketch is None:
+            raise ValueError("Only approximate n-gram counters can be merged")
+        self.flush()
+        other.flush()
+        self.sketch.merge(other.sketch)
+        self.total += other.total
+        self.documents += other.documents
+        return self
+
+
+def count_ngrams(txt_files, n=2, scope="full", start=0, window=10, approximate=False, memory_mb=64):
+    counter = ngramcounter(n, scope, start, window, approximate, memory_mb)
+    for txt_file in txt_files:
+        counter.add_file(txt_file)
+    return counter
@@ -0,0 +1,203 @@
+import os, sys, json, time, atexit, threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+"""
+
+    OPT-IN PROFILING
+
+    MINIMOT_PROFILE=1 python3 src/app.py          timing spans, Chrome trace written on exit
+    MINIMOT_PROFILE=cprofile python3 src/app.py   spans plus a cProfile dump (all threads)
+    python3 src/app.py --profile [--cprofile]     same, as flags
+
+    Open the trace in chrome://tracing or https://ui.perfetto.dev,
+    the .prof file with python3 -m pstats or snakeviz
+
+"""
+
+ENV_VAR = "MINIMOT_PROFILE"
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "output", "profile")
+MAX_EVENTS = 2_000_000  # spans past this are only counted, keeps a long session's memory bounded
+
+enabled = False
+_events = []
+_dropped = 0
+_profiles = []
+_output_dir = OUTPUT_DIR
+_origin = time.perf_counter_ns()
+
+
+class _nospan:
+    """Shared do-nothing span handed out while profiling is off"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+NO_SPAN = _nospan()
+
+
+class _span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        if exc[0] is not None:
+            self.args['error'] = exc[0].__name__
+        record(self.name, self.start, end - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        """Attach figures only known once the work is done (rows shown, bytes read...)"""
+        self.args.update(args)
+
+
+def span(name, **args):
+    """with span("convert_vtt", file=name): ... -- a no-op unless profiling is on"""
+    if not enabled:
+        return NO_SPAN
+    return _span(name, args)
+
+def traced(name=None):
+    """Decorator form of span, named after the function by default"""
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _span(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record(name, start_ns, duration_ns, args=None):
+    """Add a finished span; start_ns is on the perf_counter_ns clock"""
+    global _dropped
+    if len(_events) >= MAX_EVENTS:
+        _dropped += 1
+        return
+    # list.append is atomic, spans from worker threads need no lock
+    _events.append((name, start_ns, duration_ns, threading.get_ident(), args))
+
+
+@contextmanager
+def profile_thread():
+    """cProfile the body on the current thread too. Before Python 3.12 a profiler only sees the
+    thread that enabled it, so worker threads run their jobs inside this"""
+    if not enabled or not _profiles:
+        yield
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        yield  # 3.12+: the main profiler already covers every thread
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        _profiles.append(profile)
+
+
+def enable(cprofile=False, output_dir=None):
+    """Start collecting spans (and a cProfile of the calling thread); both are written at exit"""
+    global enabled, _output_dir
+    if enabled:
+        return
+    enabled = True
+    _output_dir = output_dir or _output_dir
+    if cprofile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        _profiles.append(profile)
+    atexit.register(dump)
+
+def enable_from_env():
+    """MINIMOT_PROFILE=1 for spans, =cprofile to also profile; anything else leaves it off"""
+    value = os.environ.get(ENV_VAR, "").strip().lower()
+    if value in ("1", "true", "yes", "on", "trace"):
+        enable()
+    elif value in ("cprofile", "profile", "2"):
+        enable(cprofile=True)
+
+def enable_from_args(argv=None):
+    """Take --profile / --cprofile off the command line, leaving the rest for the app"""
+    argv = sys.argv if argv is None else argv
+    flags = {arg for arg in argv[1:] if arg in ("--profile", "--cprofile")}
+    if flags:
+        argv[1:] = [arg for arg in argv[1:] if arg not in flags]
+        enable(cprofile="--cprofile" in flags)
+
+
+def chrome_trace():
+    """Collected spans in Chrome's trace event format (complete 'X' events, microseconds)"""
+    pid = os.getpid()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    events = [{'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+               'ts': (start - _origin) / 1000, 'dur': duration / 1000, **({'args': args} if args else {})}
+              for name, start, duration, tid, args in list(_events)]
+    for tid in sorted({e['tid'] for e in events}):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                       'args': {'name': names.get(tid, f"thread {tid}")}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'otherData': {'dropped_spans': _dropped, 'python': sys.version.split()[0]}}
+
+def summary(top=15):
+    """[(name, count, total seconds, max seconds)] by total time"""
+    totals = {}
+    for name, _, duration, _, _ in list(_events):
+        count, total, longest = totals.get(name, (0, 0, 0))
+        totals[name] = (count + 1, total + duration, max(longest, duration))
+    rows = [(name, count, total / 1e9, longest / 1e9) for name, (count, total, longest) in totals.items()]
+    return sorted(rows, key=lambda r: -r[2])[:top]
+
+def dump(output_dir=None):
+    """Write trace-<time>.json (and profile-<time>.prof) and print the slowest spans.
+    Returns the paths written"""
+    output_dir = output_dir or _output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+    paths = []
+    if _events:
+        path = os.path.join(output_dir, f"trace-{stamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(chrome_trace(), f)
+        paths.append(path)
+    if _profiles:
+        import pstats
+        for profile in _profiles:
+            profile.disable()
+        path = os.path.join(output_dir, f"profile-{stamp}.prof")
+        pstats.Stats(*_profiles).dump_stats(path)
+        paths.append(path)
+
+    if rows := summary():
+        print(f"{'span':>28} {'count':>8} {'total s':>9} {'max s':>8}", file=sys.stderr)
+        for name, count, total, longest in rows:
+            print(f"{name:>28} {count:>8} {total:>9.3f} {longest:>8.3f}", file=sys.stderr)
+    for path in paths:
+        print(f"Profile written to {path}", file=sys.stderr)
+    return paths
+
+
+enable_from_env()
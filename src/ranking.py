@@ -0,0 +1,35 @@
+import heapq
+
+
+def rank_key(item):
+    return (-item[1], item[0])
+
+
+class wordranking:
+    """Ranks a {word: count} table once per analysis result.
+    Top-k slices come from a heap and are reused; the full ordering is only sorted when asked for"""
+
+    def __init__(self, counts):
+        self.counts = counts
+        self._top = []
+        self._full = None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def top(self, k):
+        """[(word, count)] for the k most common words, ties broken alphabetically"""
+        if self._full is not None or k >= len(self.counts):
+            return self.ordered()[:k]
+        if k > len(self._top):
+            self._top = heapq.nsmallest(k, self.counts.items(), key=rank_key)
+        return self._top[:k]
+
+    def ordered(self):
+        if self._full is None:
+            self._full = sorted(self.counts.items(), key=rank_key)
+            self._top = self._full
+        return self._full
+
+    def words(self, k=None):
+        return [word for word, _ in (self.ordered() if k is None else self.top(k))]
@@ -0,0 +1,346 @@
+import os, json, time, hashlib, argparse
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from ranking import wordranking
+from profiling import traced
+from downloadqueue import atomic_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(ROOT, "data", "output")
+
+
+@traced("chart.bar")
+def draw_bar(fig, ranking, position_label, channel_name, count_unit='video'):
+    top_50 = ranking.top(50)
+    words, counts = zip(*top_50)
+
+    ax = fig.add_subplot()
+    bars = ax.bar(range(len(words)), counts, color='#dabdab', alpha=0.8)
+
+    ax.set_title(f'Top 50 Most Common {position_label.capitalize()} Words - {channel_name}', fontsize=16)
+    ax.set_xlabel(f'{position_label.capitalize()} Words', fontsize=12)
+    ax.set_ylabel(f'Number of {count_unit.capitalize()}s', fontsize=12)
+    ax.set_xticks(range(len(words)), words, rotation=45, ha='right')
+    ax.grid(axis='y', alpha=0.3)
+
+    for bar, count in zip(bars, counts):
+        ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.1,
+                str(count), ha='center', va='bottom')
+
+    fig.tight_layout()
+
+@traced("chart.pie")
+def draw_pie(fig, ranking, position_label, channel_name):
+    top_25 = ranking.top(25)
+    words, counts = zip(*top_25)
+
+    def format_label(pct, counts):
+        total = sum(counts)
+        count = int(round(pct/100.*total))
+        return f'{count}'
+
+    ax = fig.add_subplot()
+    ax.pie(counts, labels=words, autopct=lambda pct: format_label(pct, counts),
+           startangle=90, textprops={'fontsize': 10})
+    ax.set_title(f'Top 25 Most Common {position_label.capitalize()} Words - {channel_name}', fontsize=16)
+    ax.axis('equal')
+    fig.tight_layout()
+
+TREEMAP_TOP_N = 200
+MIN_LABEL_SIZE = 4
+
+
+@lru_cache(maxsize=32)
+def _treemap_layout(items, width, height):
+    import squarify
+
+    labels, counts = zip(*items)
+    rects = squarify.squarify(squarify.normalize_sizes(counts, width, height), 0, 0, width, height)
+    return labels, np.array(counts, dtype=float), np.array([[r['x'], r['y'], r['dx'], r['dy']] for r in rects])
+
+def treemap_layout(ranking, top_n=TREEMAP_TOP_N, width=100, height=100):
+    """(labels, counts, rects) for the top_n words with the rest folded into one "other" block.
+    rects is an (n, 4) array of x, y, dx, dy; layouts are cached per input"""
+    top = ranking.top(top_n)
+    other = sum(ranking.counts.values()) - sum(count for _, count in top)
+    tail = len(ranking) - len(top)
+    items = list(top)
+    if tail:
+        items.append((f"other ({tail} words)", other))
+        items.sort(key=lambda x: -x[1])
+    return _treemap_layout(tuple(items), width, height)
+
+def treemap_font_sizes(counts, rects, min_size=2, max_size=35):
+    """Label sizes for every block at once: log-scaled by count, capped by the block's shape"""
+    log_counts = np.log10(counts)
+    spread = log_counts.max() - log_counts.min()
+    log_factor = (log_counts - log_counts.min()) / spread if spread > 0 else np.ones_like(log_counts)
+    calculated = min_size + (max_size - min_size) * log_factor ** 0.6
+    rect_constraint = np.minimum(rects[:, 2] * 0.5, rects[:, 3] * 0.2) * 8
+    return np.maximum(np.minimum(calculated, rect_constraint), min_size)
+
+@traced("chart.treemap")
+def draw_treemap(fig, ranking, position_label, channel_name, top_n=TREEMAP_TOP_N):
+    from matplotlib import colormaps
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import Rectangle
+
+    labels, counts, rects = treemap_layout(ranking, top_n)
+
+    fig.set_facecolor('#2e2e2e')
+    ax = fig.add_subplot()
+    ax.set_facecolor('#2e2e2e')
+
+    # One collection instead of an artist per block
+    ax.add_collection(PatchCollection(
+        [Rectangle((x, y), dx, dy) for x, y, dx, dy in rects],
+        facecolor=colormaps['plasma'](np.linspace(0.1, 0.9, len(labels))),
+        alpha=0.9,
+        edgecolor='#1a1a1a',
+        linewidth=1.5
+    ))
+    ax.set_xlim(0, 100)
+    ax.set_ylim(0, 100)
+
+    font_sizes = treemap_font_sizes(counts, rects)
+    centers = rects[:, :2] + rects[:, 2:] / 2
+    spacing = np.maximum(0.15, font_sizes * 0.008) * rects[:, 3]
+
+    # Labels too small to read are skipped rather than drawn as specks
+    for i in np.flatnonzero(font_sizes >= MIN_LABEL_SIZE):
+        x, y = centers[i]
+        ax.text(x, y - spacing[i], labels[i],
+                ha='center', va='center',
+                fontsize=font_sizes[i], fontweight='bold',
+                color='#f0f0f0', fontfamily='sans-serif')
+        ax.text(x, y + spacing[i], f"({int(counts[i])})",
+                ha='center', va='center',
+                fontsize=max(3, font_sizes[i] * 0.55), fontweight='bold',
+                color='#e0e0e0', alpha=1.0)
+
+    shown = min(top_n, len(ranking))
+    more = f" (+{len(ranking) - shown} more)" if len(ranking) > shown else ""
+    ax.set_title(f'Top {shown} {position_label.capitalize()} Words{more} - {channel_name}',
+                 fontsize=26, fontweight='bold', pad=25, color='white')
+    ax.axis('off')
+    fig.tight_layout()
+
+WORDCLOUD_MASK = os.path.join(ROOT, "data", "pg.png")
+WORDCLOUD_FONT = os.path.join(ROOT, "data", "Ubuntu-Title.ttf")
+WORDCLOUD_OPTIONS = {
+    'max_font_size': 400,
+    'relative_scaling': 0.4,
+    'width': 1600, 'height': 1200,
+    'background_color': 'white',
+    'max_words': 500,
+    'colormap': 'tab10_r',
+    'normalize_plurals': False,
+}
+PREVIEW_SCALE = 0.25
+PREVIEW_WORDS = 150
+WORDCLOUD_CACHE_DIR = os.path.join(OUTPUT_DIR, "wordcloud-cache")
+WORDCLOUD_CACHE_BYTES = 200 * 1024 * 1024   # least recently used images go past this size
+WORDCLOUD_CACHE_DAYS = 30                   # images unused for longer are dropped
+
+_wordcloud_images = OrderedDict()
+
+
+@lru_cache(maxsize=8)
+def _load_mask(path, mtime, scale):
+    from PIL import Image
+
+    image = Image.open(path)
+    if scale != 1.0:
+        image = image.resize((max(int(image.width * scale), 1), max(int(image.height * scale), 1)), Image.NEAREST)
+    return np.array(image)
+
+def load_mask(path=WORDCLOUD_MASK, scale=1.0):
+    """Decoded mask array, cached until the file changes; None if missing or unreadable"""
+    try:
+        return _load_mask(path, os.path.getmtime(path), scale)
+    except Exception:
+        return None
+
+def wordcloud_options(preview=False, mask_path=WORDCLOUD_MASK):
+    """Everything that changes the picture, including the mask file's mtime"""
+    options = dict(WORDCLOUD_OPTIONS, mask=None, scale=1.0)
+    if os.path.exists(mask_path):
+        options.update(mask=mask_path, mask_mtime=os.path.getmtime(mask_path))
+    if preview:
+        options.update(scale=PREVIEW_SCALE, max_font_size=int(options['max_font_size'] * PREVIEW_SCALE),
+                       width=int(options['width'] * PREVIEW_SCALE), height=int(options['height'] * PREVIEW_SCALE),
+                       max_words=PREVIEW_WORDS)
+    return options
+
+def _remember_wordcloud(key, image):
+    _wordcloud_images[key] = image
+    _wordcloud_images.move_to_end(key)
+    while len(_wordcloud_images) > 16:
+        _wordcloud_images.popitem(last=False)
+    return image
+
+def cached_wordcloud(counts, preview=False, mask_path=WORDCLOUD_MASK):
+    """Image array already rendered for these counts and options, or None"""
+    key = chart_key(counts, 'wordcloud-image', wordcloud_options(preview, mask_path))
+    if key in _wordcloud_images:
+        return _remember_wordcloud(key, _wordcloud_images[key])
+    path = os.path.join(WORDCLOUD_CACHE_DIR, f"{key}.png")
+    if os.path.exists(path):
+        try:
+            from PIL import Image
+            image = np.array(Image.open(path))
+            os.utime(path)  # mtime is the last use, for pruning
+            return _remember_wordcloud(key, image)
+        except Exception:
+            return None
+    return None
+
+def prune_wordcloud_cache(cache_dir=WORDCLOUD_CACHE_DIR, max_bytes=WORDCLOUD_CACHE_BYTES,
+                          max_age_days=WORDCLOUD_CACHE_DAYS, now=None):
+    """Delete cached images unused for max_age_days, then the least recently used ones until the
+    cache fits in max_bytes. Returns how many files were removed"""
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(cache_dir)
+                   if e.is_file() and e.name.endswith(".png") and not e.name.startswith(".")]
+    except OSError:
+        return 0
+    oldest = (now if now is not None else time.time()) - max_age_days * 86400
+    entries.sort(reverse=True)
+    total, removed = 0, 0
+    for mtime, size, path in entries:
+        total += size
+        if mtime < oldest or total > max_bytes:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+@traced("chart.wordcloud_image")
+def wordcloud_image(counts, preview=False, mask_path=WORDCLOUD_MASK):
+    """Word cloud as an RGB array, cached in memory and under data/output/wordcloud-cache.
+    preview renders at a quarter of the size with fewer words, for showing something right away"""
+    image = cached_wordcloud(counts, preview, mask_path)
+    if image is not None:
+        return image
+
+    from wordcloud import WordCloud
+    from PIL import Image
+
+    options = wordcloud_options(preview, mask_path)
+    key = chart_key(counts, 'wordcloud-image', options)
+    mask_file, scale = options.pop('mask'), options.pop('scale')
+    mask = load_mask(mask_file, scale) if mask_file else None
+    options.pop('mask_mtime', None)
+
+    image = WordCloud(font_path=WORDCLOUD_FONT, mask=mask, **options).generate_from_frequencies(counts).to_array()
+    try:
+        os.makedirs(WORDCLOUD_CACHE_DIR, exist_ok=True)
+        with atomic_file(os.path.join(WORDCLOUD_CACHE_DIR, f"{key}.png"), 'wb') as f:
+            Image.fromarray(image).save(f, format='PNG')
+        prune_wordcloud_cache()
+    except OSError:
+        pass
+    return _remember_wordcloud(key, image)
+
+@traced("chart.wordcloud")
+def draw_wordcloud(fig, ranking, position_label, channel_name, image=None):
+    if image is None:
+        image = wordcloud_image(ranking.counts)
+
+    ax = fig.add_subplot()
+    ax.imshow(image, interpolation='bilinear')
+    ax.axis("off")
+    ax.set_title(f"Word Cloud of {position_label.capitalize()} words - {channel_name}")
+
+
+CHARTS = {
+    'bar': (draw_bar, {'figsize': (14, 8)}),
+    'pie': (draw_pie, {'figsize': (12, 8)}),
+    'treemap': (draw_treemap, {'figsize': (20, 15), 'dpi': 150}),
+    'wordcloud': (draw_wordcloud, {'figsize': (12, 8)}),
+}
+
+
+def chart_key(counts, chart, options):
+    """Hash of everything that changes the picture, used to name and reuse artifacts"""
+    payload = json.dumps([chart, options, sorted(counts.items())], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+def chart_path(counts, chart, options, fmt="png", output_dir=OUTPUT_DIR, name=None):
+    prefix = f"{name}-" if name else ""
+    return os.path.join(output_dir, f"{prefix}{chart}-{chart_key(counts, chart, options)}.{fmt}")
+
+@traced("chart.render")
+def render_chart(ranking, chart, position_label, channel_name, fmt="png", output_dir=OUTPUT_DIR,
+                 name=None, force=False, count_unit='video'):
+    """Draw one chart on the Agg backend and write it to output_dir.
+    Skips drawing when an artifact for the same counts and options is already there, so the file
+    is written to a temp name and renamed: an interrupted save never leaves a half chart to reuse"""
+    if not isinstance(ranking, wordranking):
+        ranking = wordranking(ranking)
+    draw, figure_options = CHARTS[chart]
+    axis = {'count_unit': count_unit} if chart == 'bar' else {}  # only the bar chart has a count axis
+    options = {'position_label': position_label, 'channel_name': channel_name, **figure_options, **axis}
+    if chart == 'wordcloud':
+        options['wordcloud'] = wordcloud_options()  # a new mask file (or mtime) changes the picture
+    path = chart_path(ranking.counts, chart, options, fmt, output_dir, name)
+    if os.path.exists(path) and not force:
+        return path, False
+
+    os.makedirs(output_dir, exist_ok=True)
+    fig = Figure(**figure_options)
+    FigureCanvasAgg(fig)
+    draw(fig, ranking, position_label, channel_name, **axis)
+    with atomic_file(path, 'wb') as f:
+        fig.savefig(f, format=fmt, facecolor=fig.get_facecolor())
+    return path, True
+
+def render_all(ranking, position_label, channel_name, charts=None, fmt="png", output_dir=OUTPUT_DIR, name=None,
+               count_unit='video'):
+    """{chart: (path, rendered)}; charts whose optional library is missing are left out"""
+    results = {}
+    for chart in charts or CHARTS:
+        try:
+            results[chart] = render_chart(ranking, chart, position_label, channel_name, fmt, output_dir, name,
+                                          count_unit=count_unit)
+        except ImportError:
+            continue
+    return results
+
+
+def main():
+    from corpus import corpus
+    from transcripts import get_word_at_index, position_label
+
+    parser = argparse.ArgumentParser(description="Render position-word charts to data/output without the GUI")
+    parser.add_argument('handles', nargs='+', help="Folder names under data/input (txt_files must exist)")
+    parser.add_argument('--index', type=int, default=0, help="Word position index (default: 0)")
+    parser.add_argument('--charts', default=",".join(CHARTS), help=f"Comma separated (default: {','.join(CHARTS)})")
+    parser.add_argument('--format', default="png", choices=["png", "svg"])
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    label = position_label(args.index)
+    for handle in args.handles:
+        channel = corpus.load([handle])
+        counts = {}
+        for video in channel.videos():
+            if word := channel.word_at(video, args.index, get_word_at_index):
+                counts[word] = counts.get(word, 0) + 1
+        if not counts:
+            print(f"{handle}: no converted transcripts, skipped")
+            continue
+        results = render_all(counts, label, channel.title(), args.charts.split(","), args.format,
+                             args.output_dir, name=handle)
+        for chart, (path, rendered) in results.items():
+            print(f"{handle}: {chart} {'written' if rendered else 'up to date'} -> {path}")
+
+if __name__ == "__main__":
+    main()
+
+# python3 src/render.py vsauce --charts bar,pie
@@ -1,4 +1,5 @@
-import re
+import re, os, json, hashlib, site
+import importlib.util
 from datetime import datetime
 from importlib.metadata import distributions
 import subprocess
@@ -232,17 +233,53 @@ def check_single_group(text, group):
     
     return True
 
-def check_requirements():
-    required = {'wordcloud', 'matplotlib', 'pillow', 'numpy', 'pytube', 'webvtt-py'}
+REQUIREMENTS = {'wordcloud', 'matplotlib', 'pillow', 'numpy', 'pytube', 'webvtt-py'}
+REQUIREMENTS_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", ".requirements.json")
+
+def environment_signature():
+    """Changes whenever packages are installed or removed: interpreter plus site-packages mtimes"""
+    paths = [*site.getsitepackages(), site.getusersitepackages(),
+             *(p for p in sys.path if p.endswith(('site-packages', 'dist-packages')))]
+    state = [sys.executable, sys.version]
+    for path in dict.fromkeys(paths):
+        try:
+            state.append(f"{path}:{os.stat(path).st_mtime_ns}")
+        except OSError:
+            continue
+    return hashlib.sha1("\n".join(state).encode('utf-8')).hexdigest()
+
+def module_available(name):
+    """Whether a module could be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def check_requirements(cache_path=REQUIREMENTS_CACHE):
+    signature = environment_signature()
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('signature') == signature:
+                return True
+    except (OSError, ValueError):
+        pass
+
     installed = {dist.metadata['Name'].lower() for dist in distributions()}
-    missing = required - installed
+    missing = REQUIREMENTS - installed
     
     if missing:
         try:
             subprocess.check_call([sys.executable, '-m', 'pip', 'install', *missing])
-            return True
         except Exception as e:
             raise Exception(f"Failed to install: {str(e)}")
+        signature = environment_signature()
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature}, f)
+    except OSError:
+        pass
     return True
 
 def extract_video_id(filename):
@@ -0,0 +1,241 @@
+import os, json, argparse, zipfile
+import numpy as np
+from sketches import stable_hash
+from concordance import update_index
+from tfidf import termmatrix, _gather
+from manifest import manifest, content_keys
+from downloadqueue import atomic_file
+
+DIMENSIONS = 256        # random projection size for candidate search, 0 for exact search only
+CANDIDATES = 10         # projected candidates per neighbour asked for, re-ranked on exact cosine
+NEIGHBOURS = 10
+PROJECT_CHUNK = 100_000 # sparse entries projected per block
+
+# Fixed hash parameters so every vocabulary projects a term the same way
+_rng = np.random.default_rng(0x51A1)
+PROJ_A = _rng.integers(1, 2**63, DIMENSIONS, dtype=np.uint64) | np.uint64(1)
+PROJ_B = _rng.integers(0, 2**63, DIMENSIONS, dtype=np.uint64)
+
+
+def similar_path(channel_dir):
+    return os.path.join(channel_dir, "index", "similar.npz")
+
+def term_hashes(words):
+    return np.fromiter((stable_hash(w) for w in words), dtype=np.uint64, count=len(words))
+
+def projection(hashes, dims=DIMENSIONS):
+    """+-1/sqrt(dims) per term and dimension, taken from the terms' hashes so any vocabulary
+    projects a term the same way. Rows are made on demand, the full matrix is never held"""
+    with np.errstate(over='ignore'):
+        bits = (hashes[:, None] * PROJ_A[:dims] + PROJ_B[:dims]) >> np.uint64(63)
+    return (bits.astype(np.float32) * 2 - 1) / np.float32(np.sqrt(dims))
+
+def project(indptr, indices, weights, rows, hashes, dims=DIMENSIONS):
+    """Unit-length dense vectors for CSR rows. Rows go in blocks: each block is scattered into a
+    small dense (rows x distinct terms) matrix and multiplied with just those terms' projections"""
+    vectors = np.zeros((len(rows), dims), dtype=np.float32)
+    lengths = indptr[rows + 1] - indptr[rows]
+    ends = np.cumsum(lengths)
+    block = 0
+    while block < len(rows):
+        # As many rows as fit in one chunk of entries, at least one
+        done = ends[block - 1] if block else 0
+        end = max(block + 1, int(np.searchsorted(ends, done + PROJECT_CHUNK, 'right')))
+        positions = _gather(indptr, rows[block:end])
+        if len(positions):
+            owner = np.repeat(np.arange(end - block), lengths[block:end])
+            terms, column = np.unique(indices[positions], return_inverse=True)
+            dense = np.zeros((end - block, len(terms)), dtype=np.float32)
+            dense[owner, column] = weights[positions]
+            vectors[block:end] = dense @ projection(hashes[terms], dims)
+        block = end
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class similarityindex:
+    """Per-channel "videos like this one" index: each transcript's sublinear term frequencies
+    (sparse, for exact cosine) plus a random projection of its unit-length tf row (dense, for fast
+    candidate search). No IDF is stored: similar_videos() weighs every index with one IDF over all
+    the indexes it is given, so cosines from different channels are comparable, and a projection
+    only depends on its own transcript, so it never goes stale when others change.
+    update() only projects transcripts whose content changed, keyed by the manifest's txt hashes"""
+
+    def __init__(self, dims=DIMENSIONS):
+        self.dims = dims
+        self.dir = ""
+        self.names = []
+        self.keys = []
+        self.version = -1
+        self.words = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, dims), dtype=np.float32)
+        self._word_id = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def paths(self):
+        return [os.path.join(self.dir, name) for name in self.names]
+
+    def word_id(self):
+        if self._word_id is None:
+            self._word_id = {w: i for i, w in enumerate(self.words)}
+        return self._word_id
+
+    def update(self, matrix, keys, version=-1, rebuild=False):
+        """Take the sparse rows of a one-channel termmatrix; keys say which rows changed.
+        Returns how many rows were projected"""
+        names = [os.path.basename(p) for p in matrix.paths]
+        self.dir = os.path.dirname(matrix.paths[0]) if matrix.paths else self.dir
+        old = {name: i for i, name in enumerate(self.names)}
+        vectors = np.zeros((len(names), self.dims), dtype=np.float32)
+        todo = []
+        for i, (name, key) in enumerate(zip(names, keys)):
+            j = old.get(name)
+            if not rebuild and self.dims and j is not None and self.keys[j] == key:
+                vectors[i] = self.vectors[j]
+            else:
+                todo.append(i)
+
+        self.words, self.indptr, self.indices = matrix.words, matrix.indptr, matrix.indices
+        self.tf = 1 + np.log(matrix.counts, dtype=np.float32)
+        self.df = matrix.df
+        self._word_id = None
+        if self.dims and todo:
+            vectors[todo] = project(self.indptr, self.indices, self.tf, np.array(todo, dtype=np.int64),
+                                    term_hashes(self.words), self.dims)
+        self.vectors = vectors
+        self.names, self.keys, self.version = names, list(keys), version
+        return len(todo) if self.dims else 0
+
+    def query_vector(self, row):
+        """(terms, tf) of one transcript's sparse row"""
+        lo, hi = self.indptr[row], self.indptr[row + 1]
+        return [self.words[t] for t in self.indices[lo:hi].tolist()], self.tf[lo:hi]
+
+    def scores(self, terms, weights, idf, dense=None, limit=None):
+        """(rows, exact cosine) against a query of (terms, tf-idf weights), this index's rows weighted
+        with idf (one value per word of the index, see corpus_idf); with dense and limit, only the
+        limit best projected candidates are scored exactly"""
+        if dense is not None and limit is not None and self.dims and len(self) > limit:
+            approx = self.vectors @ dense
+            rows = np.argpartition(-approx, limit - 1)[:limit]
+        else:
+            rows = np.arange(len(self))
+        word_id = self.word_id()
+        query = np.zeros(len(self.words), dtype=np.float32)
+        for term, weight in zip(terms, weights.tolist()):
+            if (i := word_id.get(term)) is not None:
+                query[i] = weight
+        positions = _gather(self.indptr, rows)
+        owner = np.repeat(np.arange(len(rows)), self.indptr[rows + 1] - self.indptr[rows])
+        w = self.tf[positions] * idf[self.indices[positions]]
+        norms = np.sqrt(np.bincount(owner, weights=w * w, minlength=len(rows)))
+        dots = np.bincount(owner, weights=query[self.indices[positions]] * w, minlength=len(rows))
+        return rows, dots / np.where(norms > 0, norms, 1)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_file(path, 'wb') as f:
+            np.savez(f, indptr=self.indptr, indices=self.indices, tf=self.tf, vectors=self.vectors,
+                     info=np.array(json.dumps({'names': self.names, 'keys': self.keys, 'words': self.words,
+                                               'dir': self.dir, 'version': self.version, 'dims': self.dims})))
+
+    @classmethod
+    def load(cls, path, dims=DIMENSIONS):
+        """Saved index, or an empty one (rebuilt by the next update) if it is missing, unreadable
+        or projected to another size"""
+        index = cls(dims)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                info = json.loads(str(data['info']))
+                if info.get('dims') != dims:
+                    return index  # projections of another size are not comparable
+                index.indptr, index.indices = data['indptr'], data['indices']
+                index.tf, index.vectors = data['tf'], data['vectors']  # older files kept idf weights: rebuilt
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return cls(dims)
+        index.names, index.keys, index.words = info['names'], info['keys'], info['words']
+        index.dir, index.version = info['dir'], info['version']
+        index.df = np.bincount(index.indices, minlength=len(index.words)).astype(np.int64)
+        return index
+
+
+def update_similar(channel_dir, txt_files, rebuild=False):
+    """Bring a channel's similarity index up to date; nothing is read when the manifest
+    version and the transcript list are the same as last time"""
+    m = manifest.load(channel_dir)
+    path = similar_path(channel_dir)
+    index = similarityindex.load(path)
+    names = [os.path.basename(p) for p in txt_files]
+    if not rebuild and m.version > 0 and index.version == m.version and index.names == names:
+        return index
+
+    matrix = termmatrix.from_indexes([update_index(channel_dir, txt_files)])
+    keys = content_keys(channel_dir, matrix.paths)
+    index.update(matrix, keys, m.version, rebuild)
+    index.save(path)
+    return index
+
+def corpus_idf(indexes):
+    """One smoothed idf over all the indexes' transcripts, as one array per index aligned with its words"""
+    if not indexes:
+        return []
+    words = np.concatenate([np.array(index.words, dtype=object) for index in indexes])
+    terms, inverse = np.unique(words, return_inverse=True)
+    df = np.bincount(inverse, weights=np.concatenate([index.df for index in indexes]), minlength=len(terms))
+    docs = sum(len(index) for index in indexes)
+    idf = (np.log((1 + docs) / (1 + df)) + 1).astype(np.float32)
+    bounds = np.cumsum([0] + [len(index.words) for index in indexes])
+    return [idf[inverse[lo:hi]] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def similar_videos(indexes, txt_file, k=NEIGHBOURS):
+    """[(txt path, cosine)] of the k transcripts most like txt_file across all indexes, every
+    index weighted with the same corpus-wide idf"""
+    source = next((ix for ix in indexes if ix.dir == os.path.dirname(txt_file)
+                   and os.path.basename(txt_file) in ix.names), None)
+    if source is None:
+        return []
+    idfs = corpus_idf(indexes)
+    row = source.names.index(os.path.basename(txt_file))
+    lo = source.indptr[row]
+    terms, tf = source.query_vector(row)
+    weights = tf * idfs[indexes.index(source)][source.indices[lo:lo + len(terms)]]
+    weights /= max(float(np.linalg.norm(weights)), 1e-12)
+    dense = source.vectors[row] if source.dims else None
+
+    found = []
+    for index, idf in zip(indexes, idfs):
+        rows, exact = index.scores(terms, weights, idf, dense, limit=(k + 1) * CANDIDATES)
+        paths = index.paths()
+        found.extend((paths[r], float(s)) for r, s in zip(rows.tolist(), exact.tolist())
+                     if s > 0 and paths[r] != txt_file)
+    found.sort(key=lambda item: -item[1])
+    return found[:k]
+
+
+def main():
+    from corpus import data_root, channel
+
+    parser = argparse.ArgumentParser(description="Build or refresh the similar-videos indexes")
+    parser.add_argument('handles', nargs='*', help="Folder names under data/input (default: all of them)")
+    parser.add_argument('--rebuild', action='store_true', help="Re-project every transcript")
+    args = parser.parse_args()
+
+    handles = args.handles or sorted(e.name for e in os.scandir(data_root()) if e.is_dir())
+    for handle in handles:
+        ch = channel.load(handle)
+        if ch.txt_files:
+            index = update_similar(ch.dir, ch.txt_files, args.rebuild)
+            print(f"{handle}: {len(index)} transcripts, {len(index.words)} terms")
+
+if __name__ == "__main__":
+    main()
+
+# python3 src/similar.py vsauce --rebuild
@@ -0,0 +1,200 @@
+import math, json, hashlib
+import numpy as np
+
+# Row hash parameters are fixed so sketches built separately (per channel) can be merged
+SEED_A = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                   0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+                  dtype=np.uint64)
+SEED_B = np.array([0x27D4EB2F165667C5, 0x85EBCA77C2B2AE63, 0x61C8864680B583EB, 0x9FB21C651E98DF25,
+                   0x4CF5AD432745937F, 0x2545F4914F6CDD1D, 0x5851F42D4C957F2D, 0x14057B7EF767814F],
+                  dtype=np.uint64)
+KEY_PRIME = np.uint64(0x100000001B3)
+
+
+def stable_hash(text):
+    """64-bit hash that is the same in every process (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def combine_hashes(columns):
+    """Fold equal-length uint64 hash arrays into one key per position"""
+    key = columns[0].copy()
+    for column in columns[1:]:
+        key *= KEY_PRIME
+        key ^= column
+    return key
+
+
+class countminsketch:
+    """Count-min sketch: estimates never undercount and overcount by at most
+    epsilon * total with probability 1 - delta"""
+
+    def __init__(self, epsilon=0.0001, delta=0.01, width=None, depth=None):
+        self.width = width or math.ceil(math.e / epsilon)
+        self.depth = depth or math.ceil(math.log(1 / delta))
+        if self.depth > len(SEED_A):
+            raise ValueError(f"Count-min depth is limited to {len(SEED_A)} rows")
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    def nbytes(self):
+        return self.table.nbytes
+
+    def _columns(self, keys, row):
+        return ((keys * SEED_A[row] + SEED_B[row]) >> np.uint64(32)) % np.uint64(self.width)
+
+    def add(self, keys, counts=None):
+        keys = np.asarray(keys, dtype=np.uint64)
+        counts = np.ones(len(keys), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._columns(keys, row), weights=counts,
+                                           minlength=self.width).astype(np.int64)
+        self.total += int(counts.sum())
+
+    def estimate(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        return np.min([self.table[row][self._columns(keys, row)] for row in range(self.depth)], axis=0)
+
+    def error_bound(self):
+        return self.epsilon * self.total
+
+    def merge(self, other):
+        if self.table.shape != other.table.shape:
+            raise ValueError("Can only merge count-min sketches with the same width and depth")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class misragries:
+    """Misra-Gries summary kept as numpy arrays. Counts undercount by at most
+    `slack`, which never exceeds total / (capacity + 1)"""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.labels = {}
+        self.slack = 0
+        self.total = 0
+
+    def nbytes(self):
+        # Arrays plus a rough allowance for the label strings
+        return self.capacity * (self.keys.itemsize + self.counts.itemsize + 100)
+
+    def _combine(self, keys, counts, labels):
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts])).astype(np.int64)
+        if len(keys) > self.capacity:
+            # Subtracting the (capacity + 1)-th count keeps the summary mergeable
+            cut = np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1]
+            counts -= cut
+            self.slack += int(cut)
+            keep = counts > 0
+            keys, counts = keys[keep], counts[keep]
+        self.keys, self.counts = keys, counts
+        self.labels = {k: labels[k] for k in map(int, keys) if k in labels}
+
+    def update(self, keys, counts, label_of=None):
+        """Fold in a batch of distinct keys with their exact counts.
+        label_of(positions) gives display labels for the batch entries that survive"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        counts = np.asarray(counts, dtype=np.int64)
+        self.total += int(counts.sum())
+        self._combine(keys, counts, self.labels)
+        if label_of is not None:
+            survived = np.flatnonzero(np.isin(keys, self.keys))
+            missing = np.array([i for i in survived if int(keys[i]) not in self.labels], dtype=np.int64)
+            if len(missing):
+                for key, label in zip(map(int, keys[missing]), label_of(missing)):
+                    self.labels[key] = label
+
+    def merge(self, other):
+        self.total += other.total
+        self.slack += other.slack
+        self._combine(other.keys, other.counts, {**other.labels, **self.labels})
+        return self
+
+    def top(self, k):
+        order = np.lexsort((self.keys, -self.counts))[:k]
+        return [(int(self.keys[i]), int(self.counts[i])) for i in order]
+
+
+class heavyhitters:
+    """Approximate top-k counter under a fixed memory budget.
+    Candidates come from a Misra-Gries summary, estimates are tightened with a count-min sketch"""
+
+    def __init__(self, memory_mb=64, delta=0.01, summary_share=0.25):
+        budget = int(memory_mb * 1024 * 1024)
+        depth = math.ceil(math.log(1 / delta))
+        capacity = max(100, int(budget * summary_share) // 116)
+        width = max(64, int(budget * (1 - summary_share)) // (8 * depth))
+        self.memory_mb = memory_mb
+        self.sketch = countminsketch(width=width, depth=depth)
+        self.summary = misragries(capacity)
+
+    @property
+    def total(self):
+        return self.sketch.total
+
+    def nbytes(self):
+        return self.sketch.nbytes() + self.summary.nbytes()
+
+    def add(self, keys, counts, label_of=None):
+        """Add distinct keys with their counts (e.g. one np.unique'd chunk)"""
+        self.sketch.add(keys, counts)
+        self.summary.update(keys, counts, label_of)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self.summary.merge(other.summary)
+        return self
+
+    def error_bounds(self):
+        """Worst-case error per estimate: (count-min overcount with prob 1-delta, summary undercount)"""
+        return {
+            'overcount': self.sketch.error_bound(),
+            'confidence': 1 - self.sketch.delta,
+            'undercount': self.summary.slack,
+            'total': self.total
+        }
+
+    def top(self, k=50):
+        """[(label, estimate, low, high)] by estimate; the true count lies in [low, high]"""
+        if not len(self.summary.keys):
+            return []
+        low = self.summary.counts
+        high = np.minimum(self.sketch.estimate(self.summary.keys), low + self.summary.slack)
+        order = np.lexsort((self.summary.keys, -high))[:k]
+        labels = self.summary.labels
+        return [(labels.get(int(self.summary.keys[i]), str(int(self.summary.keys[i]))),
+                 int(high[i]), int(low[i]), int(high[i])) for i in order]
+
+    def save(self, path):
+        np.savez_compressed(path, table=self.sketch.table, keys=self.summary.keys, counts=self.summary.counts,
+                            info=np.array(json.dumps({
+                                'memory_mb': self.memory_mb, 'capacity': self.summary.capacity,
+                                'sketch_total': self.sketch.total, 'summary_total': self.summary.total,
+                                'slack': self.summary.slack, 'labels': list(self.summary.labels.items())
+                            })))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        info = json.loads(str(data['info']))
+        hitters = cls(info['memory_mb'])
+        hitters.sketch.table = data['table']
+        hitters.sketch.width, hitters.sketch.depth = data['table'].shape[1], data['table'].shape[0]
+        hitters.sketch.total = info['sketch_total']
+        hitters.summary.capacity = info['capacity']
+        hitters.summary.keys, hitters.summary.counts = data['keys'], data['counts']
+        hitters.summary.total, hitters.summary.slack = info['summary_total'], info['slack']
+        hitters.summary.labels = {int(k): v for k, v in info['labels']}
+        return hitters
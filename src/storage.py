@@ -0,0 +1,135 @@
+import os, io, gzip, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Transcripts may be stored as name.vtt, name.vtt.gz or name.vtt.zst; every reader goes through here
+COMPRESSED = {'.gz': 'gzip', '.zst': 'zstd'}
+SUFFIXES = {method: suffix for suffix, method in COMPRESSED.items()}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compression_of(path):
+    """'gzip', 'zstd' or None from the file name"""
+    return COMPRESSED.get(os.path.splitext(path)[1])
+
+def plain_name(path):
+    """name.en.vtt.gz -> name.en.vtt; unchanged when not compressed"""
+    return os.path.splitext(path)[0] if compression_of(path) else path
+
+def has_ext(name, ext):
+    """Whether name is a (possibly compressed) file with extension ext, e.g. '.vtt'"""
+    return plain_name(name).endswith(ext)
+
+def txt_name_for(vtt_name):
+    """'x [id].en.vtt.gz' -> 'x [id].en.txt.gz': conversions are stored the same way as their VTT"""
+    method = compression_of(vtt_name)
+    return f"{os.path.splitext(plain_name(vtt_name))[0]}.txt" + (SUFFIXES[method] if method else "")
+
+def open_text(path, mode='r'):
+    """open() for text that also reads and writes .gz / .zst files"""
+    method = compression_of(path)
+    if method == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=GZIP_LEVEL)
+    if method == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is needed for .zst transcripts. Install with: pip install zstandard")
+        if 'r' in mode:
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                    encoding='utf-8')
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'),
+                                                                                            closefd=True),
+                                encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    method = compression_of(path)
+    if method == 'gzip':
+        return gzip.decompress(data)
+    if method == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is needed for .zst transcripts. Install with: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+def read_text(path):
+    return read_bytes(path).decode('utf-8')
+
+def encode(data, method):
+    if method == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if method == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard is not installed. Install with: pip install zstandard")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+def convert_file(path, method):
+    """Rewrite one file with another compression (None for plain), keeping its mtime so
+    staleness checks between VTT and TXT still hold. Returns the new path"""
+    target = plain_name(path) + (SUFFIXES[method] if method else "")
+    if target == path:
+        return path
+    stat = os.stat(path)
+    data = encode(read_bytes(path), method)
+    tmp = target + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp, target)
+    os.remove(path)
+    return target
+
+
+def channel_files(channel_dir, subdirs=("vtt_files", "txt_files")):
+    files = []
+    for subdir in subdirs:
+        folder = os.path.join(channel_dir, subdir)
+        if os.path.isdir(folder):
+            with os.scandir(folder) as entries:
+                files.extend(e.path for e in entries
+                             if e.is_file() and (has_ext(e.name, '.vtt') or has_ext(e.name, '.txt')))
+    return files
+
+def migrate(channel_dirs, method, subdirs=("vtt_files", "txt_files"), workers=None):
+    """Convert every transcript under the channel folders to method (None = uncompress).
+    Returns (files converted, bytes before, bytes after)"""
+    files = [f for d in channel_dirs for f in channel_files(d, subdirs)
+             if compression_of(f) != method]
+    before = sum(os.path.getsize(f) for f in files)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        converted = list(pool.map(lambda f: convert_file(f, method), files))
+    after = sum(os.path.getsize(f) for f in converted)
+    return len(converted), before, after
+
+
+def main():
+    from corpus import data_root
+
+    parser = argparse.ArgumentParser(description="Compress or uncompress vtt_files/txt_files in channel folders")
+    parser.add_argument('method', choices=["gzip", "zstd", "none"], help="Target storage for the transcripts")
+    parser.add_argument('handles', nargs='*', help="Folder names under data/input (default: all of them)")
+    parser.add_argument('--only', choices=["vtt", "txt"], help="Only convert vtt_files or txt_files")
+    parser.add_argument('--base-dir', default=data_root())
+    args = parser.parse_args()
+
+    method = None if args.method == "none" else args.method
+    if method == "zstd" and not ZSTD_AVAILABLE:
+        parser.error("zstandard is not installed. Install with: pip install zstandard")
+    handles = args.handles or sorted(e.name for e in os.scandir(args.base_dir) if e.is_dir())
+    subdirs = (f"{args.only}_files",) if args.only else ("vtt_files", "txt_files")
+
+    count, before, after = migrate([os.path.join(args.base_dir, h) for h in handles], method, subdirs)
+    print(f"Converted {count} files in {len(handles)} folders: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
+
+# python3 src/storage.py gzip vsauce
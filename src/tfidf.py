@@ -0,0 +1,152 @@
+import numpy as np
+
+TOP_K = 50
+MIN_DF = 2            # terms in fewer transcripts are usually typos or caption glitches
+MAX_DF = 0.5          # terms in more than this share of transcripts are filler everywhere
+CHUNK_TOKENS = 5_000_000   # tokens turned into (doc, term) keys at once, bounds peak memory
+POINTS = 1000         # scores shown in the word views are tf-idf weight x POINTS, as whole numbers
+
+
+def _gather(indptr, rows):
+    """Positions in indices/data of every entry of the given CSR rows, row after row"""
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    if not lengths.sum():
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+
+class termmatrix:
+    """Sparse document-term counts over a set of transcripts in CSR form (indptr, indices, counts),
+    built from the channels' positional indexes in one vectorized pass per chunk of documents.
+    Weights are sublinear tf x smoothed idf with L2-normalised rows"""
+
+    def __init__(self, words, indptr, indices, counts, paths):
+        self.words = words
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.paths = paths
+        self.row_of = {path: i for i, path in enumerate(paths)}
+        self.df = np.bincount(indices, minlength=len(words)).astype(np.int64)
+        self._weights = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def shape(self):
+        return len(self.paths), len(self.words)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.counts.nbytes + \
+               (self._weights.nbytes if self._weights is not None else 0)
+
+    @classmethod
+    def from_indexes(cls, indexes, chunk_tokens=CHUNK_TOKENS):
+        """One row per transcript of every positionindex, terms shared across channels"""
+        vocab, words = {}, []
+        indptr, indices, counts, paths = [np.zeros(1, dtype=np.int64)], [], [], []
+        nnz = 0
+        for index in indexes:
+            # Channel word ids -> corpus term ids
+            local = np.fromiter((vocab.setdefault(w, len(vocab)) for w in index.words), dtype=np.int64,
+                                count=len(index.words))
+            words.extend(list(vocab)[len(words):])
+            docs = len(index.names)
+            first = 0
+            while first < docs:
+                # Documents whose tokens fit in one chunk, at least one
+                last = max(first + 1, int(np.searchsorted(index.offsets, index.offsets[first] + chunk_tokens,
+                                                          'right')) - 1)
+                last = min(last, docs)
+                lo, hi = index.offsets[first], index.offsets[last]
+                doc = np.repeat(np.arange(last - first, dtype=np.int64), np.diff(index.offsets[first:last + 1]))
+                keys, tallies = np.unique(doc * len(vocab) + local[index.tokens[lo:hi]], return_counts=True)
+                rows = keys // len(vocab)
+                indices.append((keys % len(vocab)).astype(np.int32))
+                counts.append(tallies.astype(np.int32))
+                indptr.append(nnz + np.cumsum(np.bincount(rows, minlength=last - first)))
+                nnz += len(keys)
+                first = last
+            paths.extend(index.paths())
+        return cls(words, np.concatenate(indptr).astype(np.int64),
+                   np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                   np.concatenate(counts) if counts else np.zeros(0, dtype=np.int32), paths)
+
+    def idf(self):
+        return (np.log((1 + len(self)) / (1 + self.df)) + 1).astype(np.float32)
+
+    def weights(self):
+        """tf-idf value of every stored entry, each row scaled to unit length"""
+        if self._weights is None:
+            w = (1 + np.log(self.counts, dtype=np.float32)) * self.idf()[self.indices]
+            row_sq = np.bincount(np.repeat(np.arange(len(self)), np.diff(self.indptr)), weights=w * w,
+                                 minlength=len(self))
+            norms = np.sqrt(row_sq).astype(np.float32)
+            w /= np.repeat(np.where(norms > 0, norms, 1), np.diff(self.indptr))
+            self._weights = w
+        return self._weights
+
+    def rows(self, paths):
+        return np.array([self.row_of[p] for p in paths if p in self.row_of], dtype=np.int64)
+
+    def term_mask(self, min_df=MIN_DF, max_df=MAX_DF):
+        return (self.df >= min(min_df, len(self))) & (self.df <= max(max_df * len(self), 1))
+
+    def group_scores(self, rows, min_df=MIN_DF, max_df=MAX_DF):
+        """Mean tf-idf vector of a group of rows (a channel, a date range, any selection)"""
+        if not len(rows):
+            return np.zeros(len(self.words), dtype=np.float64)
+        positions = _gather(self.indptr, rows)
+        scores = np.bincount(self.indices[positions], weights=self.weights()[positions],
+                             minlength=len(self.words)) / len(rows)
+        return np.where(self.term_mask(min_df, max_df), scores, 0.0)
+
+    def top(self, scores, k=TOP_K):
+        """[(term, score)] for the k best non-zero scores"""
+        k = min(k, int((scores > 0).sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.words[i], float(scores[i])) for i in best]
+
+    def top_terms(self, paths, k=TOP_K, min_df=MIN_DF, max_df=MAX_DF):
+        """Most distinctive terms of a group of transcripts against the whole matrix"""
+        return self.top(self.group_scores(self.rows(paths), min_df, max_df), k)
+
+    def video_terms(self, paths, k=5, min_df=MIN_DF, max_df=MAX_DF):
+        """{txt path: [(term, score)]} with each transcript's own k most distinctive terms"""
+        mask = self.term_mask(min_df, max_df)
+        weights = self.weights()
+        result = {}
+        for path in paths:
+            if (row := self.row_of.get(path)) is None:
+                continue
+            lo, hi = self.indptr[row], self.indptr[row + 1]
+            terms, scores = self.indices[lo:hi], np.where(mask[self.indices[lo:hi]], weights[lo:hi], 0)
+            n = min(k, int((scores > 0).sum()))
+            best = np.argsort(-scores, kind='stable')[:n]
+            result[path] = [(self.words[terms[i]], float(scores[i])) for i in best]
+        return result
+
+
+def distinctive_terms(matrix, videos, k=5000, per_channel=10, per_video=3):
+    """TF-IDF view of a filtered set of video rows: the group's top terms as whole-number points,
+    the top terms per channel, and each video's own most distinctive terms"""
+    paths = [v['txt_file'] for v in videos]
+    overall = matrix.top_terms(paths, k)
+    channels = {}
+    for video in videos:
+        channels.setdefault(video.get('channel_handle', ''), []).append(video['txt_file'])
+    return {
+        'word_counts': {term: max(1, round(score * POINTS)) for term, score in overall},
+        'channel_word_counts': {handle: {term: max(1, round(score * POINTS))
+                                         for term, score in matrix.top_terms(files, per_channel)}
+                                for handle, files in channels.items()},
+        'video_terms': {path: [term for term, _ in terms]
+                        for path, terms in matrix.video_terms(paths, per_video).items()},
+    }
@@ -0,0 +1,163 @@
+import os, re, json
+from storage import open_text, txt_name_for, plain_name, has_ext, SUFFIXES
+from profiling import span
+
+CUE_TIME = re.compile(r'^(\d{2}):(\d{2}):(\d{2})\.(\d{3})\s*-->')
+
+
+def load_stopwords(root):
+    path = os.path.join(root, "data", "input", "stopwords.txt")
+    stopwords = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            stopwords.update(line.strip().lower() for line in f if line.strip() and not line.startswith('#'))
+    return stopwords
+
+def timed_vtt_lines(lines, stopwords=None, no_punctuation=False):
+    """(start seconds of the cue, cleaned line) for every line clean_vtt_lines keeps.
+    A rolling caption line keeps the time of the cue that first showed it"""
+    timed = []
+    prev = None
+    start = 0.0
+    for line in lines:
+        line = line.strip()
+        if cue := CUE_TIME.match(line):
+            h, m, sec, ms = map(int, cue.groups())
+            start = h * 3600 + m * 60 + sec + ms / 1000
+            continue
+        if (not line or line == "WEBVTT" or line.startswith(("Kind:", "Language:", "NOTE")) or
+           re.match(r'^\d{2}:\d{2}:\d{2}\.\d{3}.*$', line)):
+            continue
+
+        line = line.replace('[&nbsp;__&nbsp;]', 'FUCK')
+        line = re.sub(r'\[(?!&nbsp;__&nbsp;).*?\]', '', line)
+        line = re.sub(r'<.*?>|align:start position:0%|&gt;&gt;|>>|&gt;|<\d{2}:\d{2}:\d{2}\.\d{3}>', '', line)
+        line = re.sub(r'^\s*[A-Z]+\s*\d*\s*:\s*', '', line)
+
+        if no_punctuation:
+            line = re.sub(r'[^\w\s\']', '', line)
+        if not line: continue
+
+        if stopwords:
+            words = [word for word in line.split() if word.lower() not in stopwords]
+            line = ' '.join(words)
+            if not line: continue
+
+        if line != prev:
+            timed.append((start, line))
+            prev = line
+    return timed
+
+def clean_vtt_lines(lines, stopwords=None, no_punctuation=False):
+    return [line for _, line in timed_vtt_lines(lines, stopwords, no_punctuation)]
+
+def convert_vtt_file(vtt_path, txt_dir, stopwords=None, no_punctuation=False):
+    """Write the cleaned transcript next to the others in txt_dir, returns the txt path"""
+    with span("convert.vtt", file=os.path.basename(vtt_path)) as s:
+        with open_text(vtt_path) as f:
+            lines = f.readlines()
+
+        txt_file = os.path.join(txt_dir, txt_name_for(os.path.basename(vtt_path)))
+        timed = timed_vtt_lines(lines, stopwords, no_punctuation)
+        with open_text(txt_file, 'w') as f:
+            f.write("\n".join(line for _, line in timed))
+        save_line_times(txt_file, [start for start, _ in timed])
+        s.set(vtt_lines=len(lines), txt_lines=len(timed))
+    # Drop the conversion stored the other way (plain vs compressed) so only one copy is read
+    for other in (plain_name(txt_file), plain_name(txt_file) + ".gz", plain_name(txt_file) + ".zst"):
+        if other != txt_file and os.path.exists(other):
+            os.remove(other)
+    return txt_file
+
+def timing_path(txt_file):
+    """<channel>/timings/<name>.json: start seconds of each line of the txt conversion"""
+    channel_dir = os.path.dirname(os.path.dirname(txt_file))
+    name = os.path.splitext(plain_name(os.path.basename(txt_file)))[0]
+    return os.path.join(channel_dir, "timings", name + ".json")
+
+def save_line_times(txt_file, times):
+    path = timing_path(txt_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([round(t, 3) for t in times], f, separators=(',', ':'))
+
+def vtt_for(txt_file):
+    """The VTT a txt conversion came from, whichever way it is stored, or None"""
+    channel_dir = os.path.dirname(os.path.dirname(txt_file))
+    name = os.path.splitext(plain_name(os.path.basename(txt_file)))[0] + ".vtt"
+    for candidate in (name, *(name + suffix for suffix in SUFFIXES.values())):
+        path = os.path.join(channel_dir, "vtt_files", candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_line_times(txt_file, line_count):
+    """Start seconds for each of the txt file's line_count lines, None if they can't be matched up.
+    Conversions made before timings were kept fall back to re-reading the VTT with default
+    cleaning, which only lines up when no stopwords were removed"""
+    try:
+        with open(timing_path(txt_file), 'r', encoding='utf-8') as f:
+            times = json.load(f)
+    except (OSError, ValueError):
+        times = None
+        if (vtt := vtt_for(txt_file)) and has_ext(vtt, '.vtt'):
+            try:
+                with open_text(vtt) as f:
+                    times = [start for start, _ in timed_vtt_lines(f.readlines())]
+            except (OSError, EOFError, UnicodeDecodeError):
+                return None
+    return times if times is not None and len(times) == line_count else None
+
+def word_time(txt_file, index):
+    """Start seconds of the cue that spoke the word at index (as in get_word_at_index), or None"""
+    try:
+        with open_text(txt_file) as f:
+            lines = f.read().split("\n")
+    except (OSError, EOFError, UnicodeDecodeError):
+        return None
+    counts = [len(line.split()) for line in lines]
+    total = sum(counts)
+    if not -total <= index < total or (times := load_line_times(txt_file, len(lines))) is None:
+        return None
+    index %= total
+    for line, count in enumerate(counts):
+        if index < count:
+            return times[line]
+        index -= count
+    return None
+
+def position_label(index):
+    if index == 0:
+        return "1st"
+    elif index == 1:
+        return "2nd"
+    elif index == 2:
+        return "3rd"
+    elif index == -1:
+        return "last"
+    elif index == -2:
+        return "2nd to last"
+    elif index == -3:
+        return "3rd to last"
+    elif index > 0:
+        return f"{index + 1}th"
+    else:
+        return f"{abs(index)}th from end"
+
+def get_word_at_index(txt_file, index):
+    try:
+        with open_text(txt_file) as f:
+            content = f.read().strip()
+            if content:
+                words = content.split()
+                if words:
+                    try:
+                        word = words[index]
+                        # Cleans the word of punctuation
+                        clean_word = re.sub(r'[^\w\']', '', word).lower()
+                        return clean_word if clean_word else None
+                    except IndexError:
+                        return None
+        return None
+    except Exception:
+        return None
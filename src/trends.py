@@ -0,0 +1,258 @@
+import os, json
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import accumulate
+from storage import open_text
+
+
+def month_key(upload_date):
+    """Turn YYYYMMDD / YYYY-MM-DD into a month number, None if unusable"""
+    date = (upload_date or '').replace('-', '')
+    if len(date) < 6 or not date[:6].isdigit():
+        return None
+    month = int(date[4:6])
+    if not 1 <= month <= 12:
+        return None
+    return int(date[:4]) * 12 + month - 1
+
+def month_label(key):
+    return f"{key // 12:04d}-{key % 12 + 1:02d}"
+
+
+class trendcube:
+    """Per-term counts bucketed by upload month, queried through cumulative sums.
+    With keep_rows each video's own terms are kept too, so masked() can drop videos"""
+
+    def __init__(self, version=None, keep_rows=False):
+        self.version = version                               # what the counts were built from
+        self.keep_rows = keep_rows
+        self.counts = defaultdict(lambda: defaultdict(int))  # term -> month -> count
+        self.video_months = defaultdict(int)                # month -> videos added
+        self.seen = {}                                       # video id -> month
+        self.rows = {}                                       # video id -> {term: count}, with keep_rows
+        self._prefix = {}                                    # term -> (months, running totals)
+
+    def __contains__(self, video_id):
+        return video_id in self.seen
+
+    def add_video(self, video_id, upload_date, terms):
+        """Add one video's terms (iterable or {term: count}); already seen videos are skipped"""
+        if video_id in self.seen:
+            return False
+        month = month_key(upload_date)
+        if month is None:
+            return False
+
+        row = defaultdict(int)
+        for term, count in (terms.items() if isinstance(terms, dict) else ((t, 1) for t in terms)):
+            if term:
+                row[term] += count
+        self._add(video_id, month, row)
+        return True
+
+    def _add(self, video_id, month, row, sign=1):
+        if sign > 0:
+            self.seen[video_id] = month
+            if self.keep_rows:
+                self.rows[video_id] = dict(row)
+        else:
+            del self.seen[video_id]
+            self.rows.pop(video_id, None)
+        self.video_months[month] += sign
+        if not self.video_months[month]:
+            del self.video_months[month]
+        for term, count in row.items():
+            buckets = self.counts[term]
+            buckets[month] += sign * count
+            if not buckets[month]:
+                del buckets[month]
+            self._prefix.pop(term, None)
+
+    def masked(self, video_ids, row_of=None):
+        """Copy holding only the videos in video_ids (the rows that pass the filters).
+        Dropped videos are subtracted with their kept rows, or row_of(video_id) -> {term: count}
+        for cubes that do not keep rows; whichever side is smaller is (re)applied"""
+        keep = {v for v in video_ids if v in self.seen}
+        dropped = [v for v in self.seen if v not in keep]
+        row_of = self.rows.get if self.keep_rows else row_of
+        if dropped and row_of is None:
+            raise ValueError("Cube keeps no rows and cannot be masked")
+        cube = trendcube(self.version, self.keep_rows)
+        if len(keep) < len(dropped):
+            for video_id in keep:
+                cube._add(video_id, self.seen[video_id], row_of(video_id) or {})
+            return cube
+        cube.seen, cube.rows = dict(self.seen), dict(self.rows)
+        cube.video_months = defaultdict(int, self.video_months)
+        for term, buckets in self.counts.items():
+            cube.counts[term] = defaultdict(int, buckets)
+        for video_id in dropped:
+            cube._add(video_id, self.seen[video_id], row_of(video_id) or {}, sign=-1)
+        return cube
+
+    def merge(self, other):
+        """Fold in another cube (e.g. another channel), the two must not share videos"""
+        if any(video_id in self.seen for video_id in other.seen):
+            raise ValueError("Cubes share videos and cannot be merged")
+        self.seen.update(other.seen)
+        self.rows.update(other.rows)
+        for month, count in other.video_months.items():
+            self.video_months[month] += count
+        for term, buckets in other.counts.items():
+            for month, count in buckets.items():
+                self.counts[term][month] += count
+        self._prefix.clear()
+        return self
+
+    def _cumulative(self, term):
+        if term not in self._prefix:
+            buckets = self.counts.get(term, {})
+            months = sorted(buckets)
+            self._prefix[term] = (months, [0] + list(accumulate(buckets[m] for m in months)))
+        return self._prefix[term]
+
+    def _bounds(self, date_from, date_to):
+        lo = month_key(date_from) if date_from else None
+        hi = month_key(date_to) if date_to else None
+        return (lo if lo is not None else float('-inf'), hi if hi is not None else float('inf'))
+
+    def total(self, term, date_from=None, date_to=None):
+        """Count of a term between two dates (month granularity, inclusive)"""
+        lo, hi = self._bounds(date_from, date_to)
+        months, running = self._cumulative(term)
+        return running[bisect_right(months, hi)] - running[bisect_left(months, lo)]
+
+    def totals(self, date_from=None, date_to=None):
+        """All terms with a non-zero count in the range"""
+        result = {}
+        for term in self.counts:
+            if count := self.total(term, date_from, date_to):
+                result[term] = count
+        return result
+
+    def span(self):
+        if not self.video_months:
+            return None, None
+        return min(self.video_months), max(self.video_months)
+
+    def trend(self, term, date_from=None, date_to=None):
+        """Dense [(YYYY-MM, count)] series over the range, zero-filled"""
+        first, last = self.span()
+        if first is None:
+            return []
+        lo, hi = self._bounds(date_from, date_to)
+        lo, hi = max(first, lo), min(last, hi)
+
+        months, running = self._cumulative(term)
+        series = []
+        i = bisect_left(months, lo)
+        for month in range(int(lo), int(hi) + 1):
+            count = 0
+            if i < len(months) and months[i] == month:
+                count = running[i + 1] - running[i]
+                i += 1
+            series.append((month_label(month), count))
+        return series
+
+    def videos_per_month(self, date_from=None, date_to=None):
+        first, last = self.span()
+        if first is None:
+            return []
+        lo, hi = self._bounds(date_from, date_to)
+        return [(month_label(m), self.video_months.get(m, 0))
+                for m in range(int(max(first, lo)), int(min(last, hi)) + 1)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            'version': self.version,
+            'seen': self.seen,
+            'video_months': {str(m): c for m, c in self.video_months.items()},
+            'counts': {t: {str(m): c for m, c in b.items()} for t, b in self.counts.items()}
+        }
+        if self.keep_rows:
+            data['rows'] = self.rows
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path, version=None, keep_rows=False):
+        """Saved cube, or an empty one if it was built from another version of the transcripts
+        (or without the per-video rows asked for)"""
+        cube = cls(version, keep_rows)
+        if not os.path.exists(path):
+            return cube
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cube
+        if data.get('version') != version or (keep_rows and 'rows' not in data):
+            return cube
+        cube.seen = data.get('seen', {})
+        cube.rows = data.get('rows', {}) if keep_rows else {}
+        for m, c in data.get('video_months', {}).items():
+            cube.video_months[int(m)] = c
+        for term, buckets in data.get('counts', {}).items():
+            for m, c in buckets.items():
+                cube.counts[term][int(m)] = c
+        return cube
+
+
+def cube_path(channel_dir, name):
+    return os.path.join(channel_dir, "trends", f"{name}.json")
+
+def update_term_cube(channel_dir, videos, version):
+    """Refresh the full-transcript term cube with videos not counted yet. Words are tokenized like
+    the positional index, whose per-transcript counts mask this cube (it keeps no rows of its own).
+    videos: iterable of dicts with 'id', 'upload_date' and 'txt_file'. version is the channel's
+    manifest version: a re-conversion (other stopwords, punctuation...) bumps it and the cube starts over"""
+    from ngrams import tokenize
+    path = cube_path(channel_dir, "terms")
+    cube = trendcube.load(path, version)
+    added = 0
+    for video in videos:
+        if not video.get('id') or video['id'] in cube:
+            continue
+        try:
+            with open_text(video['txt_file']) as f:
+                words = tokenize(f.read())
+        except (OSError, EOFError):
+            continue
+        counts = defaultdict(int)
+        for word in words:
+            counts[word] += 1
+        added += cube.add_video(video['id'], video.get('upload_date', ''), counts)
+    if added:
+        cube.save(path)
+    return cube
+
+def update_position_cube(channel_dir, word_index, videos, version):
+    """Refresh the cube of words found at word_index, built over the same manifest version.
+    Each video's word is kept so filters can mask it. videos: iterable of dicts with 'id',
+    'upload_date' and 'selected_word'"""
+    path = cube_path(channel_dir, f"position_{word_index}")
+    cube = trendcube.load(path, version, keep_rows=True)
+    added = 0
+    for video in videos:
+        if video.get('id') and video['id'] not in cube:
+            word = video.get('selected_word')
+            added += cube.add_video(video['id'], video.get('upload_date', ''), [word] if word else [])
+    if added:
+        cube.save(path)
+    return cube
+
+def masked_trend(cubes, rows, row_of=None):
+    """One cube for the filtered rows (video dicts with 'id' and 'channel_handle'): each channel's
+    saved cube in cubes {handle: cube} masked down to that channel's rows, then merged. A video found
+    in two loaded folders (a playlist and its channel) is counted once. row_of(handle) gives the
+    video id -> {term: count} lookup for cubes that keep no rows"""
+    keep = defaultdict(set)
+    for video in rows:
+        if video.get('id'):
+            keep[video['channel_handle']].add(video['id'])
+    cube = trendcube()
+    for handle, ids in keep.items():
+        if handle in cubes:
+            cube.merge(cubes[handle].masked(ids - cube.seen.keys(), row_of(handle) if row_of else None))
+    return cube
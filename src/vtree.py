@@ -0,0 +1,116 @@
+import tkinter as tk
+from tkinter import ttk
+from profiling import span
+
+
+class virtualtree:
+    """Treeview that only keeps items for the rows on screen.
+    Rows are read from row_fn(index) when they scroll into view, and sorting or
+    filtering just swaps the index order instead of rebuilding items"""
+
+    def __init__(self, parent, columns, height=15):
+        self.tree = ttk.Treeview(parent, columns=columns, height=height)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.on_scroll)
+        self.row_fn = lambda index: ("", ())
+        self.order = []
+        self.offset = 0
+        self.items = []
+        self.attached = 0
+        self.selected = None
+        self.resize(height)
+
+        self.tree.bind("<Configure>", self.on_configure)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-len(self.items)))
+        self.tree.bind("<Next>", lambda e: self.scroll(len(self.items)))
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+
+    def __len__(self):
+        return len(self.order)
+
+    def set_rows(self, count, row_fn, order=None):
+        """Show count rows, in the given index order (default 0..count-1)"""
+        self.row_fn = row_fn
+        self.order = list(range(count)) if order is None else order
+        self.offset = 0
+        self.selected = None
+        self.render()
+
+    def set_order(self, order):
+        self.order = order
+        self.offset = min(self.offset, max(len(order) - len(self.items), 0))
+        self.selected = None
+        self.render()
+
+    def clear(self):
+        self.set_rows(0, lambda index: ("", ()))
+
+    def resize(self, rows):
+        rows = max(rows, 1)
+        while len(self.items) > rows:
+            self.tree.delete(self.items.pop())
+        self.attached = min(self.attached, len(self.items))
+        while len(self.items) < rows:
+            item = self.tree.insert('', 'end')
+            self.tree.detach(item)
+            self.items.append(item)
+        self.tree.configure(height=rows)
+
+    def rowheight(self):
+        try:
+            return int(ttk.Style().lookup('Treeview', 'rowheight')) or 20
+        except (ValueError, tk.TclError):
+            return 20
+
+    def on_configure(self, event):
+        # Leave room for the heading row
+        rows = max((event.height - 25) // self.rowheight(), 1)
+        if rows != len(self.items):
+            self.resize(rows)
+            self.offset = min(self.offset, max(len(self.order) - rows, 0))
+            self.render()
+
+    def render(self):
+        visible = self.order[self.offset:self.offset + len(self.items)]
+        with span("tree.render", rows=len(visible), total=len(self.order)):
+            for position, index in enumerate(visible):
+                text, values = self.row_fn(index)
+                self.tree.item(self.items[position], text=text, values=values)
+                if position >= self.attached:
+                    self.tree.move(self.items[position], '', position)
+            if len(visible) < self.attached:
+                self.tree.detach(*self.items[len(visible):self.attached])
+            self.attached = len(visible)
+
+        shown = self.selected is not None and self.selected in visible
+        self.tree.selection_set([self.items[visible.index(self.selected)]] if shown else [])
+
+        if self.order:
+            self.scrollbar.set(self.offset / len(self.order),
+                               min((self.offset + len(self.items)) / len(self.order), 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll(self, rows):
+        offset = min(max(self.offset + rows, 0), max(len(self.order) - len(self.items), 0))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll(int(float(amount) * len(self.order)) - self.offset)
+        elif action == "scroll":
+            self.scroll(int(amount) * (len(self.items) if unit == "pages" else 1))
+
+    def on_select(self, event):
+        if selection := self.tree.selection():
+            if (position := self.items.index(selection[0])) + self.offset < len(self.order):
+                self.selected = self.order[self.offset + position]
+
+    def selected_row(self):
+        """Index into the underlying rows for the selected line, or None"""
+        return self.selected
@@ -0,0 +1,90 @@
+import threading
+import queue
+import tkinter as tk
+from profiling import span, profile_thread
+
+
+class backgroundjob:
+    """Runs work(cancel_event) on a daemon thread, the same way SubDownloader does:
+    the thread only puts messages on a queue and the Tk side polls it with after().
+
+    work is a generator; it can yield ("progress", fraction, text) and
+    ("partial", payload) messages, and whatever it returns goes to on_done."""
+
+    def __init__(self, widget, work, on_progress=None, on_partial=None, on_done=None,
+                 on_error=None, poll_ms=100):
+        self.widget = widget
+        self.work = work
+        self.on_progress = on_progress
+        self.on_partial = on_partial
+        self.on_done = on_done
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self.message_queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.widget.after(self.poll_ms, self.process_queue)
+        return self
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        with profile_thread(), span("job", work=self.work.__qualname__):
+            try:
+                gen = self.work(self.cancel_event)
+                while True:
+                    try:
+                        self.message_queue.put(next(gen))
+                    except StopIteration as stop:
+                        self.message_queue.put(("done", stop.value))
+                        break
+                    if self.cancel_event.is_set():
+                        gen.close()
+                        self.message_queue.put(("cancelled", None))
+                        break
+            except Exception as e:
+                self.message_queue.put(("error", e))
+
+    def process_queue(self):
+        finished = False
+        try:
+            while True:
+                msg_type, *content = self.message_queue.get_nowait()
+                if msg_type in ("done", "error", "cancelled"):
+                    finished = True
+                # A cancelled job drops whatever it still had queued
+                if self.cancelled:
+                    continue
+                if msg_type == "progress" and self.on_progress:
+                    self.on_progress(*content)
+                elif msg_type == "partial" and self.on_partial:
+                    self.on_partial(content[0])
+                elif msg_type == "done" and self.on_done:
+                    self.on_done(content[0])
+                elif msg_type == "error" and self.on_error:
+                    self.on_error(content[0])
+        except queue.Empty:
+            pass
+
+        if not finished:
+            try:
+                self.widget.after(self.poll_ms, self.process_queue)
+            except tk.TclError:
+                self.cancel()  # window was closed
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
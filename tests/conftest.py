@@ -0,0 +1,37 @@
+import os, sys, json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def timestamp(seconds):
+    return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+
+@pytest.fixture
+def make_vtt():
+    """VTT text with one cue per line, cue i starting at i * step seconds"""
+    def make(lines, step=2.0):
+        cues = [f"{timestamp(i * step)} --> {timestamp((i + 1) * step)}\n{line}\n" for i, line in enumerate(lines)]
+        return "WEBVTT\nKind: captions\nLanguage: en\n\n" + "\n".join(cues)
+    return make
+
+
+@pytest.fixture
+def make_channel(tmp_path):
+    """A channel folder laid out like the downloader's: metadata.json, archive.txt,
+    vtt_files/ and txt_files/. Only the parts given are written. Returns its path"""
+    def make(handle="chan", metadata=None, archive=None, vtts=None, txts=None):
+        channel_dir = tmp_path / handle
+        channel_dir.mkdir(parents=True, exist_ok=True)
+        if metadata is not None:
+            (channel_dir / "metadata.json").write_text(json.dumps(metadata), encoding='utf-8')
+        if archive is not None:
+            (channel_dir / "archive.txt").write_text("".join(f"youtube {i}\n" for i in archive), encoding='utf-8')
+        for sub, files in (("vtt_files", vtts), ("txt_files", txts)):
+            if files is not None:
+                (channel_dir / sub).mkdir(exist_ok=True)
+                for name, text in files.items():
+                    (channel_dir / sub / name).write_text(text, encoding='utf-8')
+        return str(channel_dir)
+    return make
@@ -0,0 +1,143 @@
+import os, csv, json
+import numpy as np
+from concordance import (parse_query, query_tokens, find_hits, positionindex, update_index, index_path,
+                         concordance, export_hits)
+from transcripts import convert_vtt_file
+from manifest import content_keys
+
+TEXTS = {
+    "A [aaaaaaaaaaa].en.txt": "good morning everyone\nit is a good day",
+    "B [bbbbbbbbbbb].en.txt": "good night\nmorning comes early",
+    "C [ccccccccccc].en.txt": "working words worry nobody",
+}
+
+
+def build(make_channel, texts=TEXTS, handle="chan"):
+    channel = make_channel(handle, txts=texts)
+    return update_index(channel, [os.path.join(channel, "txt_files", name) for name in texts])
+
+
+def words_at(index, starts, length=1):
+    return [' '.join(index.words[t] for t in index.tokens[s:s + length]) for s in starts.tolist()]
+
+
+def test_parse_query_general():
+    assert parse_query('"good morning" -bye') == [{'terms': [['good', 'morning']], 'exclude': [['bye']], 'all': True}]
+    assert [g['terms'] for g in parse_query('cat | dog')] == [[['cat']], [['dog']]]
+    assert parse_query('hello world')[0]['terms'] == [['hello'], ['world']]
+
+
+def test_parse_query_specific():
+    assert parse_query('hello|"good morning"', "specific") == \
+        [{'terms': [['hello'], ['good', 'morning']], 'exclude': [], 'all': False}]
+    assert parse_query('wor*', "specific")[0]['terms'] == [['wor*']]
+
+
+def test_query_tokens_keep_wildcards():
+    assert query_tokens("Don't STOP wor*") == ["don't", "stop", "wor*"]
+
+
+def test_find_terms_and_phrases(make_channel):
+    index = build(make_channel)
+    assert words_at(index, index.find(["good"])) == ["good", "good", "good"]
+    starts = index.find(["good", "morning"])
+    assert len(starts) == 1 and index.doc_of(starts).tolist() == [0]
+    assert not len(index.find(["good", "evening"]))
+    assert not len(index.find(["missing"]))
+
+
+def test_phrases_do_not_cross_transcripts(make_channel):
+    index = build(make_channel)
+    # "day" ends the first transcript and "good" starts the second
+    assert not len(index.find(["day", "good"]))
+
+
+def test_wildcards(make_channel):
+    index = build(make_channel)
+    assert sorted(words_at(index, index.find(["wor*"]))) == ["words", "working", "worry"]
+    assert words_at(index, index.find(["good", "m*"]), 2) == ["good morning"]
+
+
+def test_find_hits_applies_all_and_exclude(make_channel):
+    index = build(make_channel)
+    starts, _ = find_hits(index, parse_query("good morning"))
+    assert sorted(set(index.doc_of(starts).tolist())) == [0, 1]
+    starts, _ = find_hits(index, parse_query("good -night"))
+    assert set(index.doc_of(starts).tolist()) == {0}
+    # Overlapping terms keep the longest match at a position
+    starts, lengths = find_hits(index, parse_query('"good morning" | good'))
+    assert lengths[starts == index.find(["good", "morning"])[0]].tolist() == [2]
+
+
+def test_concordance_rows_and_sorts(make_channel):
+    indexes = [build(make_channel), build(make_channel, {"D [ddddddddddd].en.txt": "a good apple"}, "other")]
+    view = concordance(indexes, "good")
+    assert len(view) == 4 and view.videos() == 3
+    row = view.page(0)[0]
+    assert (row['id'], row['left'], row['match'], row['right']) == ("aaaaaaaaaaa", "", "good", "morning everyone it is a good day")
+    assert [r['right'].split(" ")[0] for r in view.page(0, sort="right")] == ["apple", "day", "morning", "night"]
+    # Nearest word first, running off the start of a transcript sorts before any word
+    assert [r['left'] for r in view.page(0, sort="left")] == ["", "", "a", "good morning everyone it is a"]
+    assert view.pages(size=3) == 2 and len(view.page(1, size=3)) == 1
+
+
+def test_index_is_saved_and_reused(make_channel):
+    index = build(make_channel)
+    loaded = positionindex.load(index_path(os.path.dirname(index.dir)))
+    assert loaded.names == index.names and loaded.words == index.words
+    assert np.array_equal(loaded.find(["good", "morning"]), index.find(["good", "morning"]))
+    paths = index.paths()
+    keys = content_keys(os.path.dirname(index.dir), paths)
+    assert loaded.update(paths, keys) == 0
+    assert loaded.update(paths[:2], keys[:2]) == 0 and len(loaded) == 2
+    assert loaded.offsets[-1] == len(loaded.tokens)
+
+
+def test_damaged_index_files_are_rebuilt(make_channel):
+    index = build(make_channel)
+    path = index_path(os.path.dirname(index.dir))
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    assert len(positionindex.load(path)) == 0
+    rebuilt = update_index(os.path.dirname(index.dir), index.paths())
+    assert rebuilt.names == index.names and len(positionindex.load(path)) == 3
+    assert os.listdir(os.path.dirname(path)) == ["positions.npz"]
+
+
+def test_term_counts_per_transcript(make_channel):
+    index = build(make_channel)
+    assert index.term_counts(0) == {"good": 2, "morning": 1, "everyone": 1, "it": 1, "is": 1, "a": 1, "day": 1}
+    assert sum(sum(index.term_counts(i).values()) for i in range(len(index))) == len(index.tokens)
+
+
+def test_update_rereads_only_changed_keys(make_channel):
+    index = build(make_channel)
+    paths = index.paths()
+    index.update(paths, ["0", "1", "2"])
+    assert index.update(paths, ["0", "changed", "2"]) == 1
+    assert index.update(paths[:2], ["0", "changed"]) == 0
+    assert len(index) == 2 and index.offsets[-1] == len(index.tokens)
+
+
+def test_hits_carry_spoken_times_and_export(make_channel, make_vtt, tmp_path):
+    channel = make_channel(vtts={"A [aaaaaaaaaaa].en.vtt": make_vtt(["good morning", "it is a good day"], step=30)})
+    txt_dir = os.path.join(channel, "txt_files")
+    os.makedirs(txt_dir)
+    txt = convert_vtt_file(os.path.join(channel, "vtt_files", "A [aaaaaaaaaaa].en.vtt"), txt_dir)
+    view = concordance([update_index(channel, [txt])], "good")
+    rows = view.page(0)
+    assert [r['time'] for r in rows] == [0.0, 30.0]
+    assert rows[1]['url'].endswith("v=aaaaaaaaaaa&t=30s")
+
+    path = str(tmp_path / "hits.csv")
+    assert export_hits(view, path, lambda video_id: {'title': "Morning talk"}) == 2
+    with open(path, encoding='utf-8') as f:
+        records = list(csv.DictReader(f))
+    assert [(r['title'], r['timestamp'], r['match']) for r in records] == \
+        [("Morning talk", "00:00:00", "good"), ("Morning talk", "00:00:30", "good")]
+    path = str(tmp_path / "hits.jsonl")
+    assert export_hits(view, path, sort="right") == 2
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)["right"] for line in f] == ["day", "morning it is a good day"]
@@ -0,0 +1,174 @@
+import os
+import pytest
+import debug
+from downloadqueue import write_atomic, atomic_file, add_to_queue, remove_from_queue, load_queue
+
+IDS = ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"]
+
+
+def vtt_name(video_id, title="Video"):
+    return f"{title} [{video_id}].en.vtt"
+
+
+def test_get_vid_id():
+    assert debug.get_vid_id("Some title [abc_DEF-123].en.vtt") == "abc_DEF-123"
+    assert debug.get_vid_id("Some title [short].en.vtt") is None
+
+
+def test_clean_channel_has_nothing_to_report(make_channel, make_vtt):
+    channel = make_channel(metadata=[{'id': i} for i in IDS], archive=IDS,
+                           vtts={vtt_name(i): make_vtt(["hello there"]) for i in IDS})
+    report = debug.scan_channel(channel)
+    assert report['errors'] == []
+    assert (report['metadata_entries'], report['archive_entries'], report['vtt_files']) == (3, 3, 3)
+    assert not any(value for value in report.values() if isinstance(value, list))
+
+
+def test_three_way_differences(make_channel, make_vtt):
+    channel = make_channel(metadata=[{'id': IDS[0]}, {'id': IDS[1]}, {'id': IDS[1]}],
+                           archive=[IDS[1], IDS[2], IDS[2]],
+                           vtts={vtt_name(IDS[0]): make_vtt(["a"]), vtt_name(IDS[2]): make_vtt(["c"])})
+    report = debug.scan_channel(channel)
+    assert report['metadata_without_vtt'] == [IDS[1]]
+    assert report['vtt_without_metadata'] == [IDS[2]]
+    assert report['archived_without_vtt'] == [IDS[1]]
+    assert report['vtt_not_archived'] == [IDS[0]]
+    assert report['metadata_not_archived'] == [IDS[0]]
+    assert report['archived_without_metadata'] == [IDS[2]]
+    assert report['duplicate_metadata_ids'] == [IDS[1]]
+    assert report['duplicate_archive_ids'] == [IDS[2]]
+
+
+def test_bad_vtt_files(make_channel, make_vtt):
+    whole = make_vtt(["one", "two"])
+    cut = whole + "00:00:04.000 --> 00:00:06.000\n"
+    channel = make_channel(metadata=[], archive=[], vtts={
+        vtt_name(IDS[0]): "", vtt_name(IDS[1]): "<html>not found</html>\n", vtt_name(IDS[2]): cut,
+        vtt_name("ddddddddddd"): whole, vtt_name("eeeeeeeeeee"): "WEBVTT\n\n",
+    })
+    problems = {bad['id']: bad['problem'] for bad in debug.scan_channel(channel)['bad_vtt_files']}
+    assert problems == {IDS[0]: 'empty', IDS[1]: 'not_vtt', IDS[2]: 'truncated', "eeeeeeeeeee": 'no_cues'}
+
+
+@pytest.mark.parametrize("ending, problem", [
+    ("", None),                                      # whole, with its final newline
+    ("last words", None),                            # no final newline is not a cut
+    ("00:00:09.000 --> 00:00:1", 'truncated'),       # cut inside a timing line
+    ("00:00:09.0", 'truncated'),                     # cut inside a timestamp
+])
+def test_truncation_needs_a_cut_cue(make_vtt, ending, problem):
+    data = (make_vtt(["one", "two"]) + ending).encode('utf-8')
+    assert debug.vtt_problem_in(data, data, len(data)) == problem
+
+
+def test_files_that_vanish_during_a_scan_are_errors(make_channel, make_vtt, monkeypatch):
+    channel = make_channel(metadata=[], archive=[], vtts={vtt_name(IDS[0]): make_vtt(["one"])},
+                           txts={vtt_name(IDS[0])[:-4] + ".txt": "one"})
+    listed = debug.scan_vtt_files
+
+    class gone:
+        def __init__(self, entry):
+            self.name, self.path = entry.name, entry.path
+        def stat(self):
+            raise FileNotFoundError(2, "No such file")
+
+    monkeypatch.setattr(debug, "scan_vtt_files", lambda d: {k: gone(v) for k, v in listed(d).items()})
+    report = debug.scan_channel(channel)
+    assert report['errors'] == [f"Cannot read {vtt_name(IDS[0])}: [Errno 2] No such file"]
+    assert report['bad_vtt_files'] == [] and report['stale_txt_files'] == []
+
+
+def test_conversions(make_channel, make_vtt):
+    channel = make_channel(metadata=[], archive=[], vtts={vtt_name(i): make_vtt(["x"]) for i in IDS},
+                           txts={vtt_name(IDS[0])[:-4] + ".txt": "x", vtt_name(IDS[1])[:-4] + ".txt": "x",
+                                 "Leftover [zzzzzzzzzzz].en.txt": "x"})
+    stale = os.path.join(channel, "txt_files", vtt_name(IDS[1])[:-4] + ".txt")
+    os.utime(stale, (0, 0))
+    report = debug.scan_channel(channel)
+    assert report['stale_txt_files'] == [os.path.basename(stale)]
+    assert report['unconverted_vtt_ids'] == [IDS[2]]
+    assert report['orphan_txt_files'] == ["Leftover [zzzzzzzzzzz].en.txt"]
+
+
+def test_scan_corpus_totals_every_channel(make_channel, make_vtt, tmp_path):
+    make_channel("one", metadata=[{'id': IDS[0]}], archive=[IDS[0]], vtts={vtt_name(IDS[0]): make_vtt(["x"])})
+    make_channel("two", metadata=[{'id': IDS[1]}], archive=[])
+    report = debug.scan_corpus(str(tmp_path), workers=2)
+    assert report['channels'] == 2
+    assert report['reports']['two']['errors'] == ["vtt_files not found"]
+    assert report['totals']['metadata_without_vtt'] == 1
+    assert report['totals']['metadata_not_archived'] == 1
+
+
+def repair_channel(make_channel, make_vtt):
+    # ccc is archived without a VTT, bbb is archived twice, ddd is in the metadata only
+    return make_channel(metadata=[{'id': i} for i in IDS + ["ddddddddddd"]],
+                        archive=[IDS[0], IDS[1], IDS[1], IDS[2]],
+                        vtts={vtt_name(i): make_vtt(["x"]) for i in IDS[:2]})
+
+
+def test_repair_plan_is_a_dry_run(make_channel, make_vtt):
+    channel = repair_channel(make_channel, make_vtt)
+    archive = os.path.join(channel, "archive.txt")
+    before = open(archive, encoding='utf-8').read()
+    plan = debug.plan_archive_repair(channel)
+    assert plan['errors'] == []
+    assert plan['new_lines'] == [f"youtube {IDS[0]}", f"youtube {IDS[1]}"]
+    assert plan['removed'] == [IDS[2]]
+    assert plan['queue'] == [IDS[2], "ddddddddddd"]
+    assert debug.archive_diff(plan)[-2:] == [f"-youtube {IDS[1]}", f"-youtube {IDS[2]}"]
+    assert open(archive, encoding='utf-8').read() == before
+
+
+def test_apply_repair_rewrites_with_backup_and_queues(make_channel, make_vtt, tmp_path):
+    channel = repair_channel(make_channel, make_vtt)
+    archive = os.path.join(channel, "archive.txt")
+    before = open(archive, encoding='utf-8').read()
+    backup = debug.apply_archive_repair(debug.plan_archive_repair(channel))
+    assert open(backup, encoding='utf-8').read() == before
+    assert open(archive, encoding='utf-8').read() == f"youtube {IDS[0]}\nyoutube {IDS[1]}\n"
+    assert load_queue(str(tmp_path / "download_queue.json")) == {"chan": [IDS[2], "ddddddddddd"]}
+
+
+def test_apply_refuses_a_plan_made_before_the_archive_changed(make_channel, make_vtt):
+    channel = repair_channel(make_channel, make_vtt)
+    plan = debug.plan_archive_repair(channel)
+    with open(os.path.join(channel, "archive.txt"), 'a', encoding='utf-8') as f:
+        f.write("youtube eeeeeeeeeee\n")
+    with pytest.raises(RuntimeError):
+        debug.apply_archive_repair(plan, queue=False)
+
+
+def test_repair_never_empties_the_archive(make_channel):
+    channel = make_channel(archive=IDS, vtts={})
+    assert debug.plan_archive_repair(channel)['errors']
+
+
+def test_queue_skips_ids_already_queued(tmp_path):
+    path = str(tmp_path / "queue.json")
+    assert add_to_queue("chan", ["a", "b", "a"], path) == 2
+    assert add_to_queue("chan", ["b", "c"], path) == 1
+    remove_from_queue("chan", ["a", "b"], path)
+    assert load_queue(path) == {"chan": ["c"]}
+    remove_from_queue("chan", ["c"], path)
+    assert load_queue(path) == {}
+
+
+def test_write_atomic_replaces_in_one_step(tmp_path):
+    path = str(tmp_path / "file.txt")
+    assert write_atomic(path, "one") is None
+    backup = write_atomic(path, "two", backup=True)
+    assert open(path, encoding='utf-8').read() == "two"
+    assert open(backup, encoding='utf-8').read() == "one"
+    assert sorted(os.listdir(tmp_path)) == sorted(["file.txt", os.path.basename(backup)])
+
+
+def test_atomic_file_keeps_the_old_file_on_errors(tmp_path):
+    path = str(tmp_path / "data.bin")
+    with atomic_file(path, 'wb') as f:
+        f.write(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_file(path, 'wb') as f:
+            f.write(b"partial")
+            raise RuntimeError("crash")
+    assert open(path, 'rb').read() == b"old" and os.listdir(tmp_path) == ["data.bin"]
@@ -0,0 +1,164 @@
+import os, random
+import numpy as np
+import dedupe
+from manifest import update_manifest
+from dedupe import fingerprint_text, update_fingerprints, fingerprintindex, find_duplicates, redundant_files
+
+
+def speech(seed, words=400):
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(500)]
+    return "\n".join(" ".join(rng.choice(vocabulary) for _ in range(10)) for _ in range(words // 10))
+
+
+def edited(text, every=60):
+    """The same transcript with one word in every `every` replaced, like a re-upload with fixed captions"""
+    words = text.split(" ")
+    return " ".join("changed" if i % every == 0 else w for i, w in enumerate(words))
+
+
+def txt_paths(channel):
+    folder = os.path.join(channel, "txt_files")
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+
+def test_exact_hash_ignores_case_punctuation_and_lines():
+    a, sig_a, n = fingerprint_text("Hello, world!\nIt's me.")
+    b, sig_b, _ = fingerprint_text("hello world it's   me")
+    assert a == b and np.array_equal(sig_a, sig_b) and n == 4
+    assert fingerprint_text("hello there")[0] != a
+
+
+def test_empty_transcripts_are_never_near_duplicates(make_channel):
+    channel = make_channel(txts={"a.txt": "", "b.txt": "", "c.txt": speech(1)})
+    index = update_fingerprints(channel, txt_paths(channel))
+    assert np.all(index.signatures[0] == dedupe.EMPTY)
+    # Both are exact duplicates of each other (same empty text) but nothing else
+    assert find_duplicates([index]) == [[os.path.join(channel, "txt_files", n) for n in ("a.txt", "b.txt")]]
+
+
+def test_exact_and_near_duplicates_are_grouped(make_channel):
+    original = speech(1)
+    channel = make_channel(txts={
+        "a.txt": original, "b.txt": original.upper(), "c.txt": edited(original),
+        "d.txt": speech(2), "e.txt": speech(3),
+    })
+    groups = find_duplicates([update_fingerprints(channel, txt_paths(channel))])
+    assert [sorted(os.path.basename(p) for p in g) for g in groups] == [["a.txt", "b.txt", "c.txt"]]
+
+
+def test_duplicates_are_found_across_channels(make_channel):
+    original = speech(4)
+    one = make_channel("one", txts={"a.txt": original, "b.txt": speech(5)})
+    two = make_channel("two", txts={"c.txt": edited(original, 80)})
+    indexes = [update_fingerprints(ch, txt_paths(ch)) for ch in (one, two)]
+    assert find_duplicates(indexes) == [[os.path.join(one, "txt_files", "a.txt"), os.path.join(two, "txt_files", "c.txt")]]
+
+
+def test_updates_only_read_changed_files(make_channel, monkeypatch):
+    channel = make_channel(txts={"a.txt": speech(6), "b.txt": speech(7), "c.txt": speech(8)})
+    paths = txt_paths(channel)
+    update_fingerprints(channel, paths)
+    reads = []
+    original = dedupe.fingerprint_text
+    monkeypatch.setattr(dedupe, "fingerprint_text", lambda text: reads.append(text) or original(text))
+
+    update_fingerprints(channel, paths)
+    assert reads == []
+    with open(paths[1], 'w', encoding='utf-8') as f:
+        f.write(speech(9))
+    os.utime(paths[1], (os.path.getmtime(paths[1]) + 10,) * 2)
+    index = update_fingerprints(channel, paths[:2])
+    assert len(reads) == 1
+    assert index.names == ["a.txt", "b.txt"]
+    assert fingerprintindex.load(dedupe.fingerprint_path(channel)).hashes == index.hashes
+
+
+def near(signature):
+    """signature changed in one row of every band but the first: still similar, never in one bucket"""
+    rows = dedupe.NUM_PERM // dedupe.BANDS
+    changed = signature.copy()
+    changed[rows::rows] += 1
+    return changed
+
+
+def bucket_index(hashes, signatures):
+    """Rows that all share the first band, with the rest of their signatures as given"""
+    index = fingerprintindex()
+    index.names, index.hashes, index.dir = [f"{n}.txt" for n in "abcd"[:len(hashes)]], hashes, "x"
+    index.signatures = np.array(signatures, dtype=np.uint32)
+    index.signatures[:, :dedupe.NUM_PERM // dedupe.BANDS] = 7
+    return index
+
+
+def test_rows_already_grouped_are_not_compared_again(monkeypatch):
+    rng = np.random.default_rng(1)
+    x, y = rng.integers(0, 2**31, (2, dedupe.NUM_PERM))
+    # a, b and c are exact duplicates; only c's signature is close to d
+    index = bucket_index(["1", "1", "1", "2"], [x, x, y, near(y)])
+    monkeypatch.setattr(dedupe, "BUCKET_PAIRS", 3)
+    assert find_duplicates([index]) == [[os.path.join("x", f"{n}.txt") for n in "abcd"]]
+
+
+def test_pairs_per_bucket_are_capped(monkeypatch):
+    rng = np.random.default_rng(2)
+    x, y = rng.integers(0, 2**31, (2, dedupe.NUM_PERM))
+    index = bucket_index(["1", "2", "3"], [x, y, near(y)])
+    assert len(find_duplicates([index])) == 1
+    monkeypatch.setattr(dedupe, "BUCKET_PAIRS", 1)
+    assert find_duplicates([index]) == []
+
+
+def test_token_hash_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(dedupe, "TOKEN_CACHE", 3)
+    monkeypatch.setattr(dedupe, "_token_hashes", {})
+    tokens = [f"w{i}" for i in range(10)] * 2
+    assert dedupe.token_hashes(tokens).tolist() == [dedupe.stable_hash(t) for t in tokens]
+    assert len(dedupe._token_hashes) <= 3
+
+
+def test_damaged_fingerprint_files_are_rebuilt(make_channel):
+    channel = make_channel(txts={"a.txt": speech(1), "b.txt": speech(2)})
+    update_fingerprints(channel, txt_paths(channel))
+    path = dedupe.fingerprint_path(channel)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert len(fingerprintindex.load(path)) == 0
+    assert len(update_fingerprints(channel, txt_paths(channel))) == 2 and len(fingerprintindex.load(path)) == 2
+    assert not [n for n in os.listdir(os.path.dirname(path)) if n.endswith(".tmp")]
+
+
+def test_touched_files_listed_in_the_manifest_are_not_read_again(make_channel, make_vtt, monkeypatch):
+    names = ["A [aaaaaaaaaaa].en", "B [bbbbbbbbbbb].en"]
+    channel = make_channel(vtts={f"{n}.vtt": make_vtt(["hello"]) for n in names},
+                           txts={f"{n}.txt": speech(i) for i, n in enumerate(names)})
+    paths = txt_paths(channel)
+    update_manifest(channel)
+    update_fingerprints(channel, paths)
+    reads = []
+    original = dedupe.fingerprint_text
+    monkeypatch.setattr(dedupe, "fingerprint_text", lambda text: reads.append(text) or original(text))
+    os.utime(paths[0], (os.path.getmtime(paths[0]) + 10,) * 2)
+    update_fingerprints(channel, paths)
+    assert reads == []
+
+
+def test_redundant_files_keep_the_earliest_upload():
+    groups = [["x/a.txt", "x/b.txt", "y/c.txt"], ["x/d.txt", "x/e.txt"]]
+    videos = [{'txt_file': "x/a.txt", 'upload_date': "20200101"}, {'txt_file': "x/b.txt", 'upload_date': "20190101"},
+              {'txt_file': "y/c.txt", 'upload_date': "20210101"}]
+    assert redundant_files(groups, videos) == {"x/a.txt", "y/c.txt", "x/e.txt"}
+    assert redundant_files(groups) == {"x/b.txt", "y/c.txt", "x/e.txt"}
+
+
+def test_every_pair_in_a_bucket_is_checked():
+    # All three share only the first band; b and c also agree on most of the others
+    index = fingerprintindex()
+    index.names, index.hashes, index.dir = ["a.txt", "b.txt", "c.txt"], ["1", "2", "3"], "x"
+    rng = np.random.default_rng(0)
+    index.signatures = rng.integers(0, 2**31, (3, dedupe.NUM_PERM)).astype(np.uint32)
+    index.signatures[2] = index.signatures[1]
+    rows = dedupe.NUM_PERM // dedupe.BANDS
+    index.signatures[2, rows::rows] += 1
+    index.signatures[:, :rows] = 7
+    assert find_duplicates([index]) == [[os.path.join("x", "b.txt"), os.path.join("x", "c.txt")]]
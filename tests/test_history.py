@@ -0,0 +1,66 @@
+import os
+import pytest
+from history import statshistory, history_path, to_epoch, RECORD, DAY
+
+
+def entry(video_id, views, likes=0, comments=0, timestamp=None):
+    return {'id': video_id, 'view_count': views, 'like_count': likes, 'comment_count': comments,
+            'timestamp': timestamp}
+
+
+@pytest.fixture
+def history(tmp_path):
+    h = statshistory(str(tmp_path))
+    h.append([entry("aaaaaaaaaaa", 100, 10), entry("bbbbbbbbbbb", 50)], timestamp=0)
+    h.append([entry("aaaaaaaaaaa", 300, 15)], timestamp=2 * DAY)
+    h.append([entry("bbbbbbbbbbb", 60), entry("aaaaaaaaaaa", 400, 20)], timestamp=4 * DAY)
+    return h
+
+
+def test_to_epoch():
+    assert to_epoch("1970-01-02T00:00:00Z") == DAY
+    assert to_epoch(None) is None and to_epoch("yesterday") is None
+
+
+def test_snapshots_read_back_in_time_order(history):
+    assert len(history) == 5
+    assert history.video_ids() == {"aaaaaaaaaaa", "bbbbbbbbbbb"}
+    assert history.video("aaaaaaaaaaa")['views'].tolist() == [100, 300, 400]
+    assert len(history.video("ccccccccccc")) == 0
+
+
+def test_growth_over_a_window(history):
+    row = history.video_growth("aaaaaaaaaaa")
+    assert (row['views'], row['likes'], row['snapshots']) == (300, 10, 3)
+    assert row['views_per_day'] == pytest.approx(75)
+    row = history.video_growth("aaaaaaaaaaa", since=DAY)
+    assert (row['views'], row['snapshots']) == (100, 2)
+    assert history.video_growth("aaaaaaaaaaa", since=10 * DAY) is None
+    # A single snapshot has no rate
+    assert history.video_growth("aaaaaaaaaaa", until=DAY)['views_per_day'] == 0
+
+
+def test_channel_totals_and_ranking(history):
+    totals = history.channel_growth()
+    assert (totals['videos'], totals['tracked'], totals['views']) == (2, 2, 310)
+    assert totals['views_per_day'] == pytest.approx(75 + 2.5)
+    assert history.top_growing(1) == [("aaaaaaaaaaa", pytest.approx(75))]
+
+
+def test_seed_only_adds_unknown_videos(history):
+    added = history.seed([entry("aaaaaaaaaaa", 1, timestamp="2024-01-01T00:00:00"),
+                          entry("ccccccccccc", 5, timestamp="2024-01-01T00:00:00"),
+                          entry("ddddddddddd", 5)])
+    assert added == 1
+    assert history.video_ids() == {"aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"}
+
+
+def test_torn_tail_is_ignored_and_dropped(history, tmp_path):
+    path = history_path(str(tmp_path))
+    with open(path, 'ab') as f:
+        f.write(b"\x01\x02\x03")
+    fresh = statshistory(str(tmp_path))
+    assert len(fresh) == 5
+    fresh.append([entry("ccccccccccc", 1)], timestamp=5 * DAY)
+    assert os.path.getsize(path) == 6 * RECORD.itemsize
+    assert fresh.video("ccccccccccc")['views'].tolist() == [1]
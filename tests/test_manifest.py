@@ -0,0 +1,105 @@
+import os, json
+import pytest
+from manifest import (manifest, update_manifest, record_conversions, conversion_state, file_hash,
+                      conversion_settings, needs_conversion, content_keys)
+
+FIRST = "First [aaaaaaaaaaa].en"
+SECOND = "Second [bbbbbbbbbbb].en"
+
+
+@pytest.mark.parametrize("entry, state", [
+    ({}, 'missing'),
+    ({'txt': 'a.txt', 'txt_mtime': 5}, 'missing'),
+    ({'vtt': 'a.vtt', 'vtt_mtime': 5}, 'pending'),
+    ({'vtt': 'a.vtt', 'vtt_mtime': 5, 'txt': 'a.txt', 'txt_mtime': 4}, 'stale'),
+    ({'vtt': 'a.vtt', 'vtt_mtime': 5, 'txt': 'a.txt', 'txt_mtime': 5}, 'converted'),
+    ({'vtt': 'a.vtt', 'vtt_mtime': 5, 'txt': 'a.txt', 'txt_mtime': 6}, 'converted'),
+])
+def test_conversion_state(entry, state):
+    assert conversion_state(entry) == state
+
+
+@pytest.fixture
+def channel(make_channel, make_vtt):
+    channel = make_channel(metadata=[{'id': 'aaaaaaaaaaa', 'title': 'First'}, {'id': 'ccccccccccc', 'title': 'No captions'}],
+                           vtts={f"{FIRST}.vtt": make_vtt(["hello"]), f"{SECOND}.vtt": make_vtt(["world"])},
+                           txts={f"{FIRST}.txt": "hello"})
+    os.utime(os.path.join(channel, "vtt_files", f"{FIRST}.vtt"), (1000, 1000))
+    return channel
+
+
+def test_refresh_reads_the_folder(channel):
+    m = update_manifest(channel)
+    assert m.version == 1
+    assert m.counts() == {'converted': 1, 'pending': 1, 'missing': 1}
+    first = m.videos['aaaaaaaaaaa']
+    assert first['title'] == 'First' and first['in_metadata']
+    assert first['txt_hash'] == file_hash(os.path.join(channel, "txt_files", f"{FIRST}.txt"))
+    assert not m.videos['bbbbbbbbbbb'].get('in_metadata')
+    assert [os.path.basename(txt) for _, txt, _ in m.converted()] == [f"{FIRST}.txt"]
+
+
+def test_unchanged_folder_keeps_its_version(channel):
+    update_manifest(channel)
+    assert manifest.load(channel).is_current()
+    m = update_manifest(channel)
+    assert m.version == 1 and not m.refresh()
+    assert not update_manifest(channel, force=True).refresh(force=True)
+
+
+def test_changes_bump_the_version(channel):
+    update_manifest(channel)
+    os.remove(os.path.join(channel, "txt_files", f"{FIRST}.txt"))
+    m = update_manifest(channel)
+    assert m.version == 2 and m.videos['aaaaaaaaaaa']['state'] == 'pending'
+
+
+def test_record_conversions_bumps_once(channel):
+    update_manifest(channel)
+    pairs = []
+    for name in (FIRST, SECOND):
+        txt = os.path.join(channel, "txt_files", f"{name}.txt")
+        with open(txt, 'w', encoding='utf-8') as f:
+            f.write("converted again")
+        pairs.append((os.path.join(channel, "vtt_files", f"{name}.vtt"), txt))
+    m = record_conversions(channel, pairs)
+    assert m.version == 2
+    assert m.counts() == {'converted': 2, 'missing': 1}
+    assert json.load(open(os.path.join(channel, "manifest.json"), encoding='utf-8'))['version'] == 2
+    assert update_manifest(channel).version == 2
+
+
+def test_conversion_settings_decide_what_is_converted_again():
+    settings = conversion_settings({"um", "uh"}, True)
+    assert settings == conversion_settings(["uh", "um"], 1) != conversion_settings({"um", "uh"})
+    converted = {'vtt': 'a.vtt', 'vtt_mtime': 5, 'txt': 'a.txt', 'txt_mtime': 5, 'settings': settings}
+    assert not needs_conversion(converted, settings)
+    assert needs_conversion(converted, conversion_settings())
+    assert needs_conversion({'vtt': 'a.vtt', 'vtt_mtime': 5}, settings)
+    assert not needs_conversion({}, settings)
+
+
+def test_content_keys_follow_the_txt_hash(channel):
+    update_manifest(channel)
+    folder = os.path.join(channel, "txt_files")
+    listed, unlisted = os.path.join(folder, f"{FIRST}.txt"), os.path.join(folder, "other.txt")
+    with open(unlisted, 'w', encoding='utf-8') as f:
+        f.write("not in the manifest")
+    keys = content_keys(channel, [listed, unlisted, os.path.join(folder, "gone.txt")])
+    assert keys == [file_hash(listed), str(os.path.getmtime(unlisted)), None]
+    os.utime(listed, (5000, 5000))
+    assert content_keys(channel, [listed])[0] == keys[0]
+
+
+def test_record_conversions_stores_settings(channel):
+    update_manifest(channel)
+    settings = conversion_settings({"the"})
+    txt = os.path.join(channel, "txt_files", f"{SECOND}.txt")
+    with open(txt, 'w', encoding='utf-8') as f:
+        f.write("world")
+    m = record_conversions(channel, [(os.path.join(channel, "vtt_files", f"{SECOND}.vtt"), txt)], settings)
+    entry = m.videos['bbbbbbbbbbb']
+    assert entry['state'] == 'converted' and entry['settings'] == settings
+    assert not needs_conversion(entry, settings) and needs_conversion(m.videos['aaaaaaaaaaa'], settings)
+    # A rescan keeps the settings while the txt content is unchanged
+    assert update_manifest(channel, force=True).videos['bbbbbbbbbbb']['settings'] == settings
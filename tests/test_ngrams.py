@@ -0,0 +1,96 @@
+from collections import Counter
+import pytest
+import ngrams
+from ngrams import ngramcounter, count_ngrams, tokenize, KEY_BITS
+
+
+def ngrams_of(tokens, n):
+    return Counter(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def test_tokenize():
+    assert tokenize("Don't STOP, believing!") == ["don't", "stop", "believing"]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+def test_packed_keys_decode_to_their_words(n):
+    counter = ngramcounter(n)
+    assert counter.bits == KEY_BITS // n
+    tokens = "the quick brown fox jumps over the lazy dog the quick brown".split()
+    counter.add_tokens(tokens)
+    counter.flush()
+    decode = counter.decoder()
+    assert {decode(int(k)): int(c) for k, c in zip(counter._keys, counter._counts)} == ngrams_of(tokens, n)
+
+
+def test_full_slots_do_not_spill_into_neighbours():
+    counter = ngramcounter(3)
+    counter.bits = 2  # room for ids 0-3 per slot
+    tokens = ["c", "b", "a", "c", "c", "a"]
+    counter.add_tokens(tokens)
+    assert counter.counts() == dict(ngrams_of(tokens, 3))
+    with pytest.raises(ValueError):
+        counter.add_tokens(["d", "e", "f"])
+
+
+def test_counts_merge_across_flushes(monkeypatch):
+    monkeypatch.setattr(ngrams, "FLUSH_SIZE", 3)
+    counter = ngramcounter(2)
+    for text in ["a b a b", "a b c", "c a b"]:
+        counter.add_text(text)
+    assert counter.counts() == {"a b": 4, "b a": 1, "b c": 1, "c a": 1}
+    assert counter.total == 7 and counter.documents == 3
+    assert counter.top(1) == [("a b", 4)]
+
+
+def test_top_breaks_ties_alphabetically():
+    counter = ngramcounter(1)
+    counter.add_text("b a c b a c d")
+    assert counter.top(2) == [("a", 2), ("b", 2)]
+
+
+def test_window_scope():
+    counter = ngramcounter(2, scope="window", start=-3, window=3)
+    counter.add_text("one two three four five")
+    assert counter.counts() == {"three four": 1, "four five": 1}
+    counter = ngramcounter(2, scope="window", start=1, window=2)
+    counter.add_text("one two three four five")
+    assert counter.counts() == {"two three": 1}
+
+
+def test_count_ngrams_reads_files(tmp_path):
+    paths = []
+    for i, text in enumerate(["red green blue", "red green", "missing"]):
+        path = tmp_path / f"{i}.txt"
+        if text != "missing":
+            path.write_text(text, encoding='utf-8')
+        paths.append(str(path))
+    assert count_ngrams(paths, 2).counts() == {"red green": 2, "green blue": 1}
+
+
+def write_transcripts(tmp_path, texts):
+    paths = []
+    for i, text in enumerate(texts):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(text, encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+
+def test_approximate_matches_exact_on_small_input(tmp_path):
+    paths = write_transcripts(tmp_path, ["red green blue red green", "red green yellow", "blue red green"])
+    exact = count_ngrams(paths, 2)
+    approx = count_ngrams(paths, 2, approximate=True, memory_mb=1)
+    assert dict(approx.top(10)) == exact.counts()
+    assert approx.total == exact.total
+
+
+def test_approximate_counters_merge(tmp_path):
+    texts = ["one two three one two", "two three four", "one two four four"]
+    paths = write_transcripts(tmp_path, texts)
+    merged = count_ngrams(paths[:2], 2, approximate=True, memory_mb=1)
+    merged.merge(count_ngrams(paths[2:], 2, approximate=True, memory_mb=1))
+    assert dict(merged.top(10)) == count_ngrams(paths, 2).counts()
+    assert merged.documents == 3
+    with pytest.raises(ValueError):
+        merged.merge(count_ngrams(paths, 2))
@@ -0,0 +1,59 @@
+import os
+import pytest
+
+pytest.importorskip("matplotlib")
+import render
+from render import render_chart, chart_path
+
+COUNTS = {"hello": 5, "world": 3, "again": 1}
+
+
+def test_charts_are_written_once(tmp_path):
+    path, rendered = render_chart(COUNTS, 'bar', "first", "chan", output_dir=str(tmp_path))
+    assert rendered and os.path.getsize(path) > 0
+    assert render_chart(COUNTS, 'bar', "first", "chan", output_dir=str(tmp_path)) == (path, False)
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_interrupted_saves_leave_no_chart(tmp_path, monkeypatch):
+    def crash(self, f, **kwargs):
+        f.write(b"half a png")
+        raise RuntimeError("killed")
+    monkeypatch.setattr(render.Figure, "savefig", crash)
+    with pytest.raises(RuntimeError):
+        render_chart(COUNTS, 'bar', "first", "chan", output_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_wordcloud_key_follows_the_mask(tmp_path, monkeypatch):
+    paths = []
+    for mtime in (1.0, 2.0):
+        monkeypatch.setattr(render, "wordcloud_options", lambda mtime=mtime: {'mask': "pg.png", 'mask_mtime': mtime})
+        monkeypatch.setattr(render, "draw_wordcloud", lambda fig, *args: fig.add_subplot())
+        monkeypatch.setitem(render.CHARTS, 'wordcloud', (render.draw_wordcloud, {'figsize': (2, 2)}))
+        paths.append(render_chart(COUNTS, 'wordcloud', "first", "chan", output_dir=str(tmp_path))[0])
+    assert paths[0] != paths[1] and all(os.path.exists(p) for p in paths)
+
+
+@pytest.mark.parametrize("unit, label", [('video', "Number of Videos"), ('time', "Number of Times")])
+def test_bar_axis_names_the_count_unit(unit, label):
+    fig = render.Figure()
+    render.draw_bar(fig, render.wordranking(COUNTS), "first", "chan", unit)
+    assert fig.axes[0].get_ylabel() == label
+
+
+def test_bar_artifacts_are_keyed_on_the_count_unit(tmp_path):
+    videos = render_chart(COUNTS, 'bar', "2-gram", "chan", output_dir=str(tmp_path))[0]
+    assert render_chart(COUNTS, 'bar', "2-gram", "chan", output_dir=str(tmp_path), count_unit='time')[0] != videos
+
+
+def test_wordcloud_cache_drops_old_then_least_recently_used(tmp_path):
+    now = 1_000_000_000
+    for name, age_days, size in [("old", 40, 10), ("a", 3, 10), ("b", 2, 10), ("c", 1, 10)]:
+        path = tmp_path / f"{name}.png"
+        path.write_bytes(b"x" * size)
+        os.utime(path, (now - age_days * 86400,) * 2)
+    (tmp_path / ".c.png.123.tmp").write_bytes(b"x")
+    assert render.prune_wordcloud_cache(str(tmp_path), max_bytes=25, max_age_days=30, now=now) == 2
+    assert sorted(os.listdir(tmp_path)) == [".c.png.123.tmp", "b.png", "c.png"]
+    assert render.prune_wordcloud_cache(str(tmp_path / "missing")) == 0
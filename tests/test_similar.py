@@ -0,0 +1,102 @@
+import os, random
+import numpy as np
+import pytest
+import similar
+from similar import (update_similar, similar_videos, similarityindex, similar_path, projection, term_hashes,
+                     corpus_idf)
+
+TOPICS = {
+    "cats": "cat kitten whiskers purr litter meow paw fur tail nap",
+    "space": "rocket orbit planet moon star galaxy launch comet nasa gravity",
+    "food": "bread butter oven flour recipe bake salt sugar dough yeast",
+}
+FILLER = "the a and it is that we so you like just really"
+
+
+def talk(topic, seed, words=200):
+    rng = random.Random(seed)
+    pool = TOPICS[topic].split() * 2 + FILLER.split()
+    return " ".join(rng.choice(pool) for _ in range(words))
+
+
+def channel_with(make_channel, handle, videos):
+    """videos: {name: (topic, seed)}"""
+    channel = make_channel(handle, txts={f"{name} [{name[0] * 11}].en.txt": talk(*spec) for name, spec in videos.items()})
+    folder = os.path.join(channel, "txt_files")
+    return channel, sorted(os.path.join(folder, n) for n in os.listdir(folder))
+
+
+def test_projection_is_the_same_for_any_vocabulary():
+    a = projection(term_hashes(["cat", "dog"]))
+    b = projection(term_hashes(["dog", "fish", "cat"]))
+    assert np.array_equal(a[0], b[2]) and np.array_equal(a[1], b[0])
+    assert np.allclose(np.linalg.norm(a, axis=1), 1)
+
+
+def test_neighbours_share_a_topic(make_channel):
+    channel, paths = channel_with(make_channel, "chan", {
+        "cats1": ("cats", 1), "cats2": ("cats", 2), "space1": ("space", 3),
+        "space2": ("space", 4), "food1": ("food", 5), "food2": ("food", 6)})
+    index = update_similar(channel, paths)
+    assert len(index) == 6 and len(index.vectors) == 6
+    found = similar_videos([index], paths[0], k=5)
+    assert os.path.basename(found[0][0]).startswith("cats2")
+    assert paths[0] not in [p for p, _ in found]
+    assert [s for _, s in found] == sorted((s for _, s in found), reverse=True)
+    assert 0 < found[-1][1] < found[0][1] <= 1 + 1e-6
+
+
+def test_projected_candidates_agree_with_exact_search(make_channel, monkeypatch):
+    videos = {f"{topic}{i}": (topic, i * 10 + n) for n, topic in enumerate(TOPICS) for i in range(8)}
+    channel, paths = channel_with(make_channel, "chan", videos)
+    index = update_similar(channel, paths)
+    exact = similar_videos([index], paths[0], k=3)
+    monkeypatch.setattr(similar, "CANDIDATES", 2)
+    assert [p for p, _ in similar_videos([index], paths[0], k=3)] == [p for p, _ in exact]
+
+
+def test_updates_only_project_changed_transcripts(make_channel):
+    channel, paths = channel_with(make_channel, "chan", {
+        "cats1": ("cats", 1), "space1": ("space", 2), "food1": ("food", 3), "food2": ("food", 4)})
+    index = update_similar(channel, paths)
+    saved = similarityindex.load(similar_path(channel))
+    assert saved.names == index.names and np.array_equal(saved.vectors, index.vectors)
+
+    matrix = similar.termmatrix.from_indexes([similar.update_index(channel, paths)])
+    keys = list(saved.keys)
+    keys[1] = "changed"
+    assert saved.update(matrix, keys) == 1
+    assert saved.update(matrix, keys, rebuild=True) == 4
+
+
+def test_indexes_of_another_size_are_rebuilt(make_channel):
+    channel, paths = channel_with(make_channel, "chan", {"cats1": ("cats", 1), "cats2": ("cats", 2)})
+    update_similar(channel, paths)
+    assert len(similarityindex.load(similar_path(channel), dims=64)) == 0
+    assert len(similarityindex.load(similar_path(channel))) == 2
+
+
+def test_damaged_index_files_are_rebuilt(make_channel):
+    channel, paths = channel_with(make_channel, "chan", {"cats1": ("cats", 1), "cats2": ("cats", 2)})
+    update_similar(channel, paths)
+    path = similar_path(channel)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    assert len(similarityindex.load(path)) == 0
+    assert len(update_similar(channel, paths)) == 2 and len(similarityindex.load(path)) == 2
+    assert not [n for n in os.listdir(os.path.dirname(path)) if n.endswith(".tmp")]
+
+
+def test_scores_across_channels_use_one_idf(make_channel):
+    one, one_paths = channel_with(make_channel, "one", {"cats1": ("cats", 1), "space1": ("space", 2), "food1": ("food", 3)})
+    two, two_paths = channel_with(make_channel, "two", {"copy": ("cats", 1), "cats2": ("cats", 4), "cats3": ("cats", 5)})
+    indexes = [update_similar(one, one_paths), update_similar(two, two_paths)]
+    # The same transcript in a channel of other topics still scores as an exact copy
+    path, score = similar_videos(indexes, one_paths[0], k=1)[0]
+    assert path == two_paths[2] and score == pytest.approx(1.0, abs=1e-5)
+    forward = dict(similar_videos(indexes, two_paths[0], k=5))[one_paths[0]]
+    assert dict(similar_videos(indexes, one_paths[0], k=5))[two_paths[0]] == pytest.approx(forward, abs=1e-5)
+
+    idfs = corpus_idf(indexes)
+    cat = [idf[ix.word_id()["cat"]] for ix, idf in zip(indexes, idfs)]
+    assert cat[0] == cat[1]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from sketches import countminsketch, misragries, heavyhitters, stable_hash, combine_hashes
+
+
+def stream(seed, size=5000, distinct=300):
+    rng = np.random.default_rng(seed)
+    keys = rng.zipf(1.5, size) % distinct
+    return np.unique(keys.astype(np.uint64), return_counts=True)
+
+
+def test_stable_hash_and_combine():
+    assert stable_hash("word") == stable_hash("word") != stable_hash("other")
+    a = np.array([1, 2], dtype=np.uint64)
+    b = np.array([3, 4], dtype=np.uint64)
+    assert combine_hashes([a, b])[0] != combine_hashes([b, a])[0]
+
+
+def test_countmin_merge_equals_one_sketch():
+    (k1, c1), (k2, c2) = stream(1), stream(2)
+    left, right, whole = (countminsketch(width=256, depth=4) for _ in range(3))
+    left.add(k1, c1)
+    right.add(k2, c2)
+    whole.add(np.concatenate([k1, k2]), np.concatenate([c1, c2]))
+    left.merge(right)
+    assert np.array_equal(left.table, whole.table)
+    assert left.total == whole.total
+    with pytest.raises(ValueError):
+        left.merge(countminsketch(width=128, depth=4))
+
+
+def test_countmin_never_undercounts():
+    keys, counts = stream(3)
+    sketch = countminsketch(width=64, depth=4)
+    sketch.add(keys, counts)
+    assert np.all(sketch.estimate(keys) >= counts)
+
+
+def test_misragries_merge_stays_within_slack():
+    (k1, c1), (k2, c2) = stream(4), stream(5)
+    left, right = misragries(20), misragries(20)
+    left.update(k1, c1)
+    right.update(k2, c2)
+    left.merge(right)
+    exact = {}
+    for keys, counts in ((k1, c1), (k2, c2)):
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            exact[key] = exact.get(key, 0) + count
+    assert len(left.keys) <= 20
+    assert left.total == sum(exact.values())
+    assert left.slack <= left.total / 21
+    for key, count in zip(left.keys.tolist(), left.counts.tolist()):
+        assert exact[key] - left.slack <= count <= exact[key]
+
+
+def test_heavyhitters_merge_keeps_labels_and_bounds():
+    left, right = heavyhitters(0.05), heavyhitters(0.05)
+    labels = lambda keys: lambda positions: [f"k{int(keys[p])}" for p in positions]
+    (k1, c1), (k2, c2) = stream(6), stream(7)
+    left.add(k1, c1, labels(k1))
+    right.add(k2, c2, labels(k2))
+    left.merge(right)
+    exact = {}
+    for keys, counts in ((k1, c1), (k2, c2)):
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            exact[f"k{key}"] = exact.get(f"k{key}", 0) + count
+    top = left.top(5)
+    assert [label for label, *_ in top] == sorted(exact, key=lambda k: (-exact[k], int(k[1:])))[:5]
+    for label, estimate, low, high in top:
+        assert low <= exact[label] <= high
+
+
+def test_heavyhitters_save_and_load(tmp_path):
+    keys, counts = stream(8)
+    hitters = heavyhitters(0.05)
+    hitters.add(keys, counts, lambda positions: [str(int(keys[p])) for p in positions])
+    path = str(tmp_path / "hh.npz")
+    hitters.save(path)
+    assert heavyhitters.load(path).top(10) == hitters.top(10)
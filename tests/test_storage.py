@@ -0,0 +1,58 @@
+import os, gzip
+import pytest
+import storage
+from storage import compression_of, plain_name, has_ext, txt_name_for, open_text, read_text, convert_file, migrate
+
+METHODS = [None, 'gzip', pytest.param('zstd', marks=pytest.mark.skipif(not storage.ZSTD_AVAILABLE,
+                                                                         reason="zstandard not installed"))]
+
+
+def test_names():
+    assert compression_of("a.en.vtt.gz") == 'gzip' and compression_of("a.en.vtt.zst") == 'zstd'
+    assert compression_of("a.en.vtt") is None
+    assert plain_name("a [x].en.vtt.gz") == "a [x].en.vtt" and plain_name("a.en.vtt") == "a.en.vtt"
+    assert has_ext("a.en.vtt.zst", '.vtt') and not has_ext("a.en.txt.gz", '.vtt')
+    assert txt_name_for("a [x].en.vtt.gz") == "a [x].en.txt.gz"
+    assert txt_name_for("a [x].en.vtt") == "a [x].en.txt"
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_open_text_round_trip(tmp_path, method):
+    path = str(tmp_path / ("a.txt" + (storage.SUFFIXES[method] if method else "")))
+    with open_text(path, 'w') as f:
+        f.write("héllo\nworld")
+    with open_text(path) as f:
+        assert f.read() == "héllo\nworld"
+    assert read_text(path) == "héllo\nworld"
+
+
+def test_gzip_files_are_really_compressed(tmp_path):
+    path = str(tmp_path / "a.txt.gz")
+    with open_text(path, 'w') as f:
+        f.write("words " * 1000)
+    assert gzip.decompress(open(path, 'rb').read()) == b"words " * 1000
+    assert os.path.getsize(path) < 1000
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_convert_file_keeps_content_and_mtime(tmp_path, method):
+    path = tmp_path / "a.en.vtt"
+    path.write_text("WEBVTT\n\nhello", encoding='utf-8')
+    os.utime(path, (1000, 1000))
+    target = convert_file(str(path), method)
+    assert not os.path.exists(path) or target == str(path)
+    assert compression_of(target) == method and read_text(target) == "WEBVTT\n\nhello"
+    assert os.path.getmtime(target) == 1000
+    back = convert_file(target, None)
+    assert back == str(path) and path.read_text(encoding='utf-8') == "WEBVTT\n\nhello"
+
+
+def test_migrate_only_touches_transcripts_not_stored_that_way(make_channel):
+    channel = make_channel(vtts={"a.en.vtt": "WEBVTT", "notes.json": "{}"}, txts={"a.en.txt": "hello"})
+    with open_text(os.path.join(channel, "txt_files", "b.en.txt.gz"), 'w') as f:
+        f.write("already")
+    count, before, after = migrate([channel], 'gzip')
+    assert count == 2 and before > 0 and after > 0
+    assert sorted(os.listdir(os.path.join(channel, "vtt_files"))) == ["a.en.vtt.gz", "notes.json"]
+    assert sorted(os.listdir(os.path.join(channel, "txt_files"))) == ["a.en.txt.gz", "b.en.txt.gz"]
+    assert migrate([channel], 'gzip')[0] == 0
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from concordance import update_index
+from tfidf import termmatrix, distinctive_terms, _gather
+
+TEXTS = {
+    "a.txt": "the cat sat on the mat",
+    "b.txt": "the dog sat",
+    "c.txt": "a cat and a dog and a bird",
+    "d.txt": "bird bird bird",
+}
+
+
+def index_of(make_channel, texts=TEXTS, handle="chan"):
+    channel = make_channel(handle, txts=texts)
+    return update_index(channel, [os.path.join(channel, "txt_files", name) for name in texts])
+
+
+def dense(matrix):
+    out = np.zeros(matrix.shape, dtype=np.int64)
+    for row in range(len(matrix)):
+        lo, hi = matrix.indptr[row], matrix.indptr[row + 1]
+        out[row, matrix.indices[lo:hi]] = matrix.counts[lo:hi]
+    return out
+
+
+def row_counts(matrix, row):
+    return {matrix.words[t]: int(c) for t, c in enumerate(dense(matrix)[row]) if c}
+
+
+def test_counts_match_the_text(make_channel):
+    matrix = termmatrix.from_indexes([index_of(make_channel)])
+    assert matrix.shape == (4, 9)
+    assert row_counts(matrix, 0) == {"the": 2, "cat": 1, "sat": 1, "on": 1, "mat": 1}
+    assert row_counts(matrix, 3) == {"bird": 3}
+
+
+def test_chunk_boundaries_do_not_change_the_matrix(make_channel):
+    indexes = [index_of(make_channel, handle="one"), index_of(make_channel, {"e.txt": "cat cat fish"}, "two")]
+    whole = termmatrix.from_indexes(indexes)
+    for chunk_tokens in (1, 3, 6, 7, 10):
+        chunked = termmatrix.from_indexes(indexes, chunk_tokens=chunk_tokens)
+        assert chunked.words == whole.words
+        assert np.array_equal(chunked.indptr, whole.indptr)
+        assert np.array_equal(dense(chunked), dense(whole))
+        assert np.array_equal(chunked.df, whole.df)
+
+
+def test_terms_are_shared_across_channels(make_channel):
+    matrix = termmatrix.from_indexes([index_of(make_channel, handle="one"),
+                                      index_of(make_channel, {"e.txt": "cat fish"}, "two")])
+    assert len(matrix) == 5 and matrix.words.count("cat") == 1
+    assert matrix.df[matrix.words.index("cat")] == 3
+
+
+def test_rows_are_unit_length(make_channel):
+    matrix = termmatrix.from_indexes([index_of(make_channel)])
+    w = matrix.weights()
+    norms = [np.sqrt((w[_gather(matrix.indptr, np.array([row]))] ** 2).sum()) for row in range(len(matrix))]
+    assert np.allclose(norms, 1)
+
+
+def test_distinctive_terms(make_channel):
+    index = index_of(make_channel)
+    matrix = termmatrix.from_indexes([index])
+    paths = index.paths()
+    videos = [{'txt_file': p, 'channel_handle': "chan"} for p in paths]
+    terms = distinctive_terms(matrix, videos, per_video=1)
+    # Words found in just one transcript are left out by default
+    assert set(terms['word_counts']) == {"the", "cat", "sat", "dog", "bird"}
+    assert "the" not in dict(matrix.top_terms(paths, max_df=0.25))
+    assert all(isinstance(points, int) and points >= 1 for points in terms['word_counts'].values())
+    assert terms['video_terms'][paths[3]] == ["bird"]
+    assert list(terms['channel_word_counts']) == ["chan"]
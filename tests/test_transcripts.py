@@ -0,0 +1,70 @@
+import os
+import pytest
+from transcripts import (timed_vtt_lines, convert_vtt_file, timing_path, load_line_times, word_time,
+                         get_word_at_index, position_label)
+from downloadqueue import moment_url
+
+ROLLING = """WEBVTT
+Kind: captions
+Language: en
+
+00:00:01.000 --> 00:00:03.000 align:start position:0%
+hello<00:00:01.500><c> there</c>
+
+00:00:03.000 --> 00:00:04.000 align:start position:0%
+hello there
+
+00:00:04.000 --> 00:00:06.500
+general <i>kenobi</i>
+
+00:01:05.250 --> 00:01:07.000
+you are a <b>bold</b> one
+"""
+
+
+def convert(make_channel, text, name="Talk [aaaaaaaaaaa].en.vtt"):
+    channel = make_channel(vtts={name: text})
+    txt_dir = os.path.join(channel, "txt_files")
+    os.makedirs(txt_dir, exist_ok=True)
+    return convert_vtt_file(os.path.join(channel, "vtt_files", name), txt_dir)
+
+
+def test_rolling_captions_keep_the_time_they_first_appeared():
+    assert timed_vtt_lines(ROLLING.splitlines()) == [
+        (1.0, "hello there"), (4.0, "general kenobi"), (65.25, "you are a bold one")]
+
+
+def test_conversion_writes_text_and_line_times(make_channel):
+    txt = convert(make_channel, ROLLING)
+    assert open(txt, encoding='utf-8').read() == "hello there\ngeneral kenobi\nyou are a bold one"
+    assert os.path.exists(timing_path(txt))
+    assert load_line_times(txt, 3) == [1.0, 4.0, 65.25]
+    assert load_line_times(txt, 4) is None
+
+
+@pytest.mark.parametrize("index, seconds", [(0, 1.0), (1, 1.0), (2, 4.0), (3, 4.0), (4, 65.25), (-1, 65.25),
+                                            (-6, 4.0), (8, 65.25), (9, None), (-10, None)])
+def test_word_time(make_channel, index, seconds):
+    assert word_time(convert(make_channel, ROLLING), index) == seconds
+
+
+def test_word_time_falls_back_to_the_vtt(make_channel):
+    txt = convert(make_channel, ROLLING)
+    os.remove(timing_path(txt))
+    assert word_time(txt, 2) == 4.0
+    # Lines that no longer match the VTT (e.g. stopwords were removed) have no times
+    with open(txt, 'w', encoding='utf-8') as f:
+        f.write("hello there\ngeneral kenobi")
+    assert word_time(txt, 2) is None
+
+
+def test_word_at_index_and_labels(make_channel):
+    txt = convert(make_channel, ROLLING)
+    assert [get_word_at_index(txt, i) for i in (0, 2, -1, 99)] == ["hello", "general", "one", None]
+    assert [position_label(i) for i in (0, 1, 2, 3, -1, -2, -3, -4)] == \
+        ["1st", "2nd", "3rd", "4th", "last", "2nd to last", "3rd to last", "4th from end"]
+
+
+def test_moment_url():
+    assert moment_url("aaaaaaaaaaa", 65.25) == "https://www.youtube.com/watch?v=aaaaaaaaaaa&t=65s"
+    assert moment_url("aaaaaaaaaaa") == moment_url("aaaaaaaaaaa", 0) == "https://www.youtube.com/watch?v=aaaaaaaaaaa"
@@ -0,0 +1,136 @@
+import pytest
+from trends import trendcube, month_key, update_term_cube, update_position_cube, cube_path, masked_trend
+
+
+def cube():
+    c = trendcube()
+    c.add_video("a", "20230115", {"hello": 2, "world": 1})
+    c.add_video("b", "2023-03-02", ["hello"])
+    c.add_video("c", "20240701", {"hello": 5})
+    return c
+
+
+def test_month_key():
+    assert month_key("2023-02-10") == month_key("20230201") == 2023 * 12 + 1
+    assert month_key("20231301") is None
+    assert month_key("") is None
+
+
+def test_range_sums():
+    c = cube()
+    assert c.total("hello") == 8
+    assert c.total("hello", "20230101", "20230331") == 3
+    assert c.total("hello", "20230201", "20230228") == 0
+    assert c.total("hello", date_from="20230301") == 6
+    assert c.total("hello", date_to="20230131") == 2
+    assert c.total("missing") == 0
+    assert c.totals("20240101", "20241231") == {"hello": 5}
+
+
+def test_prefix_sums_follow_new_videos():
+    c = cube()
+    assert c.total("world") == 1
+    c.add_video("d", "20230120", ["world"])
+    assert c.total("world", "20230101", "20230131") == 2
+
+
+def test_videos_are_counted_once():
+    c = cube()
+    assert not c.add_video("a", "20230115", ["hello"])
+    assert not c.add_video("e", "not a date", ["hello"])
+    assert c.total("hello") == 8
+
+
+def test_trend_is_zero_filled():
+    c = cube()
+    assert c.trend("hello", "20230101", "20230430") == [("2023-01", 2), ("2023-02", 0), ("2023-03", 1), ("2023-04", 0)]
+    assert c.videos_per_month("20230101", "20230228") == [("2023-01", 1), ("2023-02", 0)]
+
+
+def test_merge_adds_another_channel():
+    c = cube()
+    other = trendcube()
+    other.add_video("x", "20230110", ["hello"])
+    other.add_video("y", "20250101", ["new"])
+    c.merge(other)
+    assert c.total("hello", "20230101", "20230131") == 3
+    assert c.total("new") == 1 and "y" in c
+    assert c.span() == (month_key("20230101"), month_key("20250101"))
+    with pytest.raises(ValueError):
+        c.merge(cube())
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "trends" / "cube.json")
+    cube().save(path)
+    loaded = trendcube.load(path)
+    assert loaded.totals() == cube().totals()
+    assert "a" in loaded and loaded.trend("hello") == cube().trend("hello")
+
+
+def test_channel_cubes_only_count_new_videos(tmp_path):
+    channel_dir = str(tmp_path)
+    txt = tmp_path / "a.txt"
+    txt.write_text("Hello hello world", encoding='utf-8')
+    videos = [{'id': 'a', 'upload_date': '20230105', 'txt_file': str(txt), 'selected_word': 'hello'}]
+    assert update_term_cube(channel_dir, videos, 1).totals() == {"hello": 2, "world": 1}
+    txt.write_text("something else", encoding='utf-8')
+    assert update_term_cube(channel_dir, videos, 1).totals() == {"hello": 2, "world": 1}
+    assert update_position_cube(channel_dir, 0, videos, 1).totals() == {"hello": 1}
+
+
+def test_cubes_start_over_when_the_transcripts_change(tmp_path):
+    channel_dir = str(tmp_path)
+    txt = tmp_path / "a.txt"
+    txt.write_text("Hello world", encoding='utf-8')
+    videos = [{'id': 'a', 'upload_date': '20230105', 'txt_file': str(txt)}]
+    update_term_cube(channel_dir, videos, 1)
+    txt.write_text("goodbye world", encoding='utf-8')
+    assert update_term_cube(channel_dir, videos, 2).totals() == {"goodbye": 1, "world": 1}
+    assert trendcube.load(str(tmp_path / "missing.json"), 2).version == 2
+
+
+def rows_cube():
+    c = trendcube(keep_rows=True)
+    c.add_video("v1", "20230105", ["hello"])
+    c.add_video("v2", "20230210", ["hello"])
+    c.add_video("v3", "20230315", ["world"])
+    return c
+
+
+@pytest.mark.parametrize("keep", [["v1"], ["v1", "v2"]])
+def test_mask_matches_a_cube_of_the_kept_videos(keep):
+    masked = rows_cube().masked(keep + ["unknown"])
+    assert set(masked.seen) == set(keep)
+    assert masked.totals() == {"hello": len(keep)}
+    assert masked.videos_per_month() == [("2023-01", 1), ("2023-02", len(keep) - 1)][:len(keep)]
+    assert rows_cube().totals() == {"hello": 2, "world": 1}
+
+
+def test_cubes_without_rows_need_a_lookup_to_mask():
+    c = cube()
+    with pytest.raises(ValueError):
+        c.masked(["a"])
+    assert c.masked(list(c.seen)).totals() == c.totals()
+    rows = {"a": {"hello": 2, "world": 1}, "b": {"hello": 1}, "c": {"hello": 5}}
+    assert c.masked(["a", "c"], rows.get).totals() == {"hello": 7, "world": 1}
+    assert c.masked(["b"], rows.get).totals() == {"hello": 1}
+
+
+def test_rows_are_saved_with_the_cube(tmp_path):
+    path = str(tmp_path / "cube.json")
+    rows_cube().save(path)
+    assert trendcube.load(path, keep_rows=True).masked(["v3"]).totals() == {"world": 1}
+    cube().save(path)
+    assert not trendcube.load(path, keep_rows=True).seen
+
+
+def test_masked_trend_counts_shared_videos_once():
+    other = trendcube(keep_rows=True)
+    other.add_video("v1", "20230105", ["hello"])
+    other.add_video("v9", "20230105", ["bye"])
+    rows = [{'id': "v1", 'channel_handle': "a"}, {'id': "v2", 'channel_handle': "a"},
+            {'id': "v1", 'channel_handle': "b"}, {'id': "v9", 'channel_handle': "b"}, {'id': None, 'channel_handle': "b"}]
+    merged = masked_trend({"a": rows_cube(), "b": other}, rows)
+    assert merged.totals() == {"hello": 2, "bye": 1}
+    assert merged.videos_per_month() == [("2023-01", 2), ("2023-02", 1)]